@@ -0,0 +1,127 @@
+"""Measure the time needed to strip ANSI codes from Sphinx's console output.
+
+Compares the character-at-a-time loop that ANSIOutputHandler used to run
+with the current regular expression based implementation:
+
+    $ python -m benchmarks.ansi --documents 10000
+
+The output is modelled on a verbose, coloured Sphinx build: progress and
+status lines for every document, written a message at a time. Messages
+are put on a queue that only collects them, so the time measured is the
+time spent in the handler.
+
+The legacy loop never looked at the character that followed an escape
+sequence, so it missed a line break (or another escape sequence) there;
+the stripped text is compared, rather than how it was split into lines.
+"""
+import argparse
+import re
+import time
+
+from galley.worker import ANSIOutputHandler
+
+
+class LegacyANSIOutputHandler(ANSIOutputHandler):
+    "The output handler, as it stripped ANSI codes before the rewrite"
+    def write(self, data):
+        start = 0
+        end = 0
+
+        while end < len(data):
+            ch = data[end]
+            if ch == '\x1b':
+                self.buffer.append(data[start:end])
+
+                end = end + 2
+                params = []
+                while ord(data[end]) not in range(64, 127):
+                    param = []
+                    while ord(data[end]) not in range(64, 127) and data[end] != ';':
+                        param.append(data[end])
+                        end = end + 1
+                    params.append(int(''.join(param)))
+                    if data[end] == ';':
+                        end = end + 1
+
+                end = end + 1
+                start = end
+
+            elif ch == '\r' or ch == '\n':
+                self.buffer.append(data[start:end])
+                self.flush()
+                start = end + 1
+            end = end + 1
+
+        self.buffer.append(data[start:end])
+
+
+class CollectingQueue(object):
+    "Enough of a queue to collect the messages put on it"
+    def __init__(self):
+        self.messages = []
+        self.put = self.messages.append
+
+
+def sphinx_output(documents):
+    "The writes that a verbose build of the given number of documents makes to its status stream"
+    writes = []
+    for stage in ['reading sources', 'writing output']:
+        for i in range(documents):
+            writes.append('\x1b[01m%s... \x1b[39;49;00m[%3d%%] ' % (stage, 100 * (i + 1) // documents))
+            writes.append('\x1b[35mpackage/module%d\x1b[39;49;00m' % i)
+            writes.append('\r')
+        writes.append('\n')
+    for i in range(documents):
+        writes.append('\x1b[01mcopying images... \x1b[39;49;00mimage%d.png\n' % i)
+        writes.append('\x1b[91mdocument%d.rst:%d: WARNING: undefined label: target-%d\x1b[39;49;00m\n' % (i, i, i))
+    writes.append('\x1b[01mbuild succeeded, %d warnings.\x1b[39;49;00m\n' % documents)
+    return writes
+
+
+def stripped_text(messages):
+    "The text of the messages, without line breaks"
+    return re.sub(r'[\r\n]', '', ''.join(message.message for message in messages))
+
+
+def measure(handler_class, writes, repeat):
+    "Returns the best time to handle the writes, and the messages produced"
+    best = None
+    for _ in range(repeat):
+        queue = CollectingQueue()
+        handler = handler_class(queue)
+        start = time.perf_counter()
+        for data in writes:
+            handler.write(data)
+        handler.flush()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, queue.messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ANSI code stripping.')
+    parser.add_argument('--documents', type=int, default=10000, help='The number of documents in the build.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of times to run each handler.')
+    options = parser.parse_args()
+
+    writes = sphinx_output(options.documents)
+    size = sum(len(data) for data in writes)
+
+    results = {}
+    print('%-8s %12s %12s %16s' % ('handler', 'time (ms)', 'MB/s', 'messages/s'))
+    for name, handler_class in [('legacy', LegacyANSIOutputHandler), ('regex', ANSIOutputHandler)]:
+        elapsed, messages = measure(handler_class, writes, options.repeat)
+        results[name] = stripped_text(messages)
+        print('%-8s %12.1f %12.2f %16.0f' % (
+            name,
+            elapsed * 1000,
+            size / elapsed / 1024 / 1024,
+            len(messages) / elapsed,
+        ))
+
+    if results['legacy'] != results['regex']:
+        raise SystemExit('The handlers stripped the output differently!')
+
+
+if __name__ == '__main__':
+    main()
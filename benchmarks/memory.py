@@ -0,0 +1,120 @@
+"""Measure the memory used to track the modification state of a project tree.
+
+Compares the dictionary-of-dictionaries representation that the monitor
+used to keep with the current PathTable:
+
+    $ python -m benchmarks.memory --files 100000
+
+Memory is measured with tracemalloc: "retained" is the memory still held
+by the monitor state after the initial scan, and "peak" is the highest
+allocation during the scan. "rescan peak" is the transient allocation
+made by a rescan that finds no changes.
+"""
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from galley.monitor import Monitor, gather_tree, scan
+
+from benchmarks.tree import make_tree
+
+
+class LegacyMonitor(object):
+    "The modification state, as it was tracked before the PathTable"
+    def __init__(self):
+        self.modification_time = {}
+        self.listing = {}
+        self.new_files = []
+        self.modified_files = []
+
+
+def legacy_gather_dir(dirname, monitor, stat):
+    monitor.modification_time.setdefault(dirname, {})[None] = stat.st_mtime
+    monitor.listing.setdefault(dirname, ([], []))
+    parent = os.path.dirname(dirname)
+    if parent in monitor.listing:
+        monitor.listing[parent][0].append(os.path.basename(dirname))
+
+
+def legacy_gather_file(dirname, filename, monitor, stat):
+    old_mtime = monitor.modification_time[dirname].get(filename)
+    if old_mtime is None:
+        monitor.new_files.append(os.path.join(dirname, filename))
+        monitor.listing[dirname][1].append(filename)
+    elif old_mtime < stat.st_mtime:
+        monitor.modified_files.append(os.path.join(dirname, filename))
+    monitor.modification_time[dirname][filename] = stat.st_mtime
+
+
+def legacy_scan(base_path, monitor):
+    scan(base_path, legacy_gather_dir, legacy_gather_file, monitor, stat=True)
+
+
+def legacy_reset(monitor):
+    monitor.new_files = []
+    monitor.modified_files = []
+
+
+def current_scan(base_path, monitor):
+    gather_tree(base_path, monitor)
+
+
+def current_reset(monitor):
+    monitor.reset()
+
+
+STRATEGIES = [
+    ('dict', LegacyMonitor, legacy_scan, legacy_reset),
+    ('pathtable', Monitor, current_scan, current_reset),
+]
+
+
+def measure(factory, scanner, reset, base_path):
+    "Returns the retained and peak memory of an initial scan, and the peak of a rescan"
+    gc.collect()
+    tracemalloc.start()
+    monitor = factory()
+    scanner(base_path, monitor)
+    # The list of new files is transient; only the state is retained.
+    reset(monitor)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+
+    tracemalloc.reset_peak()
+    scanner(base_path, monitor)
+    reset(monitor)
+    after, rescan_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained, peak, rescan_peak - after
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory used by the monitor state.')
+    parser.add_argument('--files', type=int, default=100000, help='The number of documents in the tree.')
+    parser.add_argument('--depth', type=int, default=3, help='The depth of the directory tree.')
+    parser.add_argument('--fanout', type=int, default=8, help='The number of subdirectories in each directory.')
+    options = parser.parse_args()
+
+    base_path = tempfile.mkdtemp()
+    try:
+        make_tree(base_path, files=options.files, depth=options.depth, fanout=options.fanout)
+
+        print('%-10s %14s %14s %14s %16s' % ('state', 'retained (MB)', 'peak (MB)', 'rescan (KB)', 'bytes/document'))
+        for name, factory, scanner, reset in STRATEGIES:
+            retained, peak, rescan = measure(factory, scanner, reset, base_path)
+            print('%-10s %14.2f %14.2f %14.1f %16.1f' % (
+                name,
+                retained / 1024 / 1024,
+                peak / 1024 / 1024,
+                rescan / 1024,
+                retained / options.files,
+            ))
+    finally:
+        shutil.rmtree(base_path)
+
+
+if __name__ == '__main__':
+    main()
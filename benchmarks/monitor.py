@@ -0,0 +1,254 @@
+"""A benchmark suite for the file monitor strategies.
+
+Generates synthetic documentation trees, and measures each monitor
+strategy on each tree:
+
+* full_scan: the wall time of the initial scan (best of --repeat).
+* rescan: the wall time of a poll that finds no changes (best of
+  --repeat). Event driven strategies don't poll, so this is null.
+* idle_cpu: the CPU seconds consumed per second by a running monitor
+  when nothing is changing.
+* latency: the time between saving a document and the FileChange
+  reaching the output queue (median of --samples). Documents are saved
+  the way most editors save them: written to a temporary file, then
+  renamed over the original.
+* peak_memory: the peak memory allocated during the initial scan.
+
+Results are printed, and can be written as a JSON report; a report from
+a previous run can be given to compare against:
+
+    $ python -m benchmarks.monitor --files 1000 10000 --output report.json
+    $ python -m benchmarks.monitor --files 1000 10000 --compare report.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # python 3.x
+
+from galley import VERSION, inotify
+from galley.monitor import MONITORS, Monitor, ProjectLayout, file_monitor, gather_tree, gather_dir, gather_file, scan
+
+from benchmarks.tree import make_tree
+
+
+def initial_scan(strategy, base_path):
+    "Run the initial scan of a monitor strategy, and return the Monitor"
+    # With the stop event already set, a monitor performs its initial
+    # scan (and sets up any watches), and then returns.
+    stop_event = threading.Event()
+    stop_event.set()
+    monitor = Monitor(layout=ProjectLayout(base_path))
+    MONITORS[strategy](base_path, stop_event, Queue(), monitor)
+    return monitor
+
+
+def rescan(strategy, base_path, monitor):
+    "Perform a single poll of a warm monitor"
+    monitor.reset()
+    if strategy == 'poll':
+        scan(base_path, gather_dir, gather_file, monitor, stat=True)
+    else:
+        gather_tree(base_path, monitor)
+
+
+def best_time(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def save(filename, content):
+    "Save a file the way an editor would; write a temporary file, then rename it"
+    with open(filename + '.tmp', 'w') as f:
+        f.write(content)
+    os.replace(filename + '.tmp', filename)
+
+
+def wait_for(queue, filename, timeout=60):
+    "Wait until a FileChange mentioning filename arrives on the queue"
+    deadline = time.monotonic() + timeout
+    while True:
+        change = queue.get(timeout=max(0, deadline - time.monotonic()))
+        if filename in change.new or filename in change.modified:
+            return time.perf_counter()
+
+
+def run_monitor(strategy, base_path, documents, samples, idle):
+    "Run a monitor, measuring its idle CPU usage and change-detection latency"
+    queue = Queue()
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=file_monitor,
+        args=(base_path, stop_event, queue),
+        kwargs={'backend': strategy, 'quiet_period': 0, 'max_latency': 0}
+    )
+    thread.start()
+    try:
+        # Wait for the monitor to finish its initial scan, by making changes
+        # until one is reported.
+        for attempt in range(60):
+            save(documents[0], 'Warming up %d\n' % attempt)
+            try:
+                wait_for(queue, documents[0], timeout=2)
+                break
+            except Empty:
+                pass
+
+        start_cpu = time.process_time()
+        time.sleep(idle)
+        idle_cpu = (time.process_time() - start_cpu) / idle
+
+        latency = []
+        step = max(1, len(documents) // max(1, samples))
+        for i in range(samples):
+            filename = documents[(i + 1) * step % len(documents)]
+            # Don't save in lockstep with a polling monitor.
+            time.sleep(0.1 + 0.3 * i)
+            start = time.perf_counter()
+            save(filename, 'Sample %d\n' % i)
+            latency.append(wait_for(queue, filename) - start)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    return idle_cpu, latency
+
+
+def peak_memory(strategy, base_path):
+    "The peak memory allocated by the initial scan of a strategy"
+    tracemalloc.start()
+    initial_scan(strategy, base_path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark(strategy, base_path, documents, options):
+    "Measure a single strategy against a single tree"
+    result = {}
+    result['full_scan'] = best_time(lambda: initial_scan(strategy, base_path), options.repeat)
+
+    if strategy == 'inotify':
+        result['rescan'] = None
+    else:
+        monitor = initial_scan(strategy, base_path)
+        result['rescan'] = best_time(lambda: rescan(strategy, base_path, monitor), options.repeat)
+
+    idle_cpu, latency = run_monitor(strategy, base_path, documents, options.samples, options.idle)
+    result['idle_cpu'] = idle_cpu
+    result['latency'] = statistics.median(latency)
+    result['peak_memory'] = peak_memory(strategy, base_path)
+    return result
+
+
+METRICS = [
+    ('full_scan', 'full scan (ms)', 1000),
+    ('rescan', 'rescan (ms)', 1000),
+    ('idle_cpu', 'idle CPU (%)', 100),
+    ('latency', 'latency (ms)', 1000),
+    ('peak_memory', 'peak (MB)', 1 / 1024 / 1024),
+]
+
+
+def format_value(value, scale):
+    if value is None:
+        return '-'
+    return '%.2f' % (value * scale)
+
+
+def print_results(results, previous=None):
+    "Print a table of results, with the change since a previous report, if given"
+    baseline = {}
+    if previous:
+        for result in previous['results']:
+            baseline[(result['files'], result['strategy'])] = result
+
+    print('%8s %-12s' % ('files', 'strategy') + ''.join('%18s' % label for key, label, scale in METRICS))
+    for result in results:
+        row = '%8d %-12s' % (result['files'], result['strategy'])
+        old = baseline.get((result['files'], result['strategy']))
+        for key, label, scale in METRICS:
+            cell = format_value(result[key], scale)
+            if old and old.get(key) and result[key] is not None:
+                cell += ' (%+.0f%%)' % ((result[key] / old[key] - 1) * 100)
+            row += '%18s' % cell
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the file monitor strategies.')
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='The number of documents in each tree.')
+    parser.add_argument('--depth', type=int, default=3, help='The depth of the directory trees.')
+    parser.add_argument('--fanout', type=int, default=8, help='The number of subdirectories in each directory.')
+    parser.add_argument('--strategy', nargs='+', choices=sorted(MONITORS),
+                        help='The strategies to measure (default: all available).')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of timed scans.')
+    parser.add_argument('--samples', type=int, default=3, help='The number of latency samples.')
+    parser.add_argument('--idle', type=float, default=3.0, help='Seconds to measure idle CPU usage.')
+    parser.add_argument('--output', help='Write a JSON report to this file.')
+    parser.add_argument('--compare', help='A JSON report from a previous run to compare against.')
+    options = parser.parse_args()
+
+    strategies = options.strategy or [
+        strategy for strategy in sorted(MONITORS)
+        if strategy != 'inotify' or inotify.is_available()
+    ]
+
+    previous = None
+    if options.compare:
+        with open(options.compare) as f:
+            previous = json.load(f)
+
+    results = []
+    for files in options.files:
+        base_path = tempfile.mkdtemp()
+        try:
+            documents = make_tree(base_path, files=files, depth=options.depth, fanout=options.fanout)
+            for strategy in strategies:
+                result = {'files': files, 'strategy': strategy}
+                result.update(benchmark(strategy, base_path, documents, options))
+                results.append(result)
+        finally:
+            shutil.rmtree(base_path)
+
+    print_results(results, previous)
+
+    if options.output:
+        report = {
+            'galley': VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'parameters': {
+                'depth': options.depth,
+                'fanout': options.fanout,
+                'repeat': options.repeat,
+                'samples': options.samples,
+                'idle': options.idle,
+            },
+            'results': results,
+        }
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Measure the rate at which worker output reaches the view.
+
+Compares putting every output message on the results queue by itself
+with sending the messages in batches, through a BatchingQueue:
+
+    $ python -m benchmarks.output --messages 100000
+
+A producer thread plays the part of the worker, sending a mix of status,
+progress and warning messages like those of a build, and then a BuildEnd.
+The main thread plays the part of the view, taking messages off the
+results queue and unpacking batches, until the BuildEnd arrives. With
+--pipe, the messages also cross a pipe, as they do when the worker runs
+in its own process.
+
+Batches don't carry the status and progress messages that newer ones
+supersede, so fewer messages are delivered than were sent.
+"""
+import argparse
+import multiprocessing
+import threading
+import time
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.worker import BatchingQueue, Batch, BuildEnd, ConnectionQueue, Output, Progress, WarningOutput
+
+
+def build_output(count):
+    "A list of messages like those sent during a build"
+    messages = []
+    for i in range(count):
+        if i % 10 == 9:
+            messages.append(WarningOutput('/docs/document%d.rst' % i, i, 'undefined label: target-%d' % i))
+        elif i % 2:
+            messages.append(Progress('writing output', i * 100 // count, 'document%d' % i))
+        else:
+            messages.append(Output('writing output... [%3d%%] document%d' % (i * 100 // count, i)))
+    return messages
+
+
+def produce(output_queue, messages, batched):
+    if batched:
+        output_queue = BatchingQueue(output_queue)
+    for message in messages:
+        output_queue.put(message)
+    # Marks the end of the messages; it is never dropped from a batch.
+    output_queue.put(BuildEnd(filenames=None))
+    if batched:
+        output_queue.flush()
+
+
+def forward(connection, results_queue):
+    "Forward messages from a pipe onto the results queue, as WorkerProcess does"
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+        results_queue.put(message)
+
+
+def measure(messages, batched, pipe):
+    """Returns the time taken for all the messages to reach the view, how many
+    gets it took, and how many messages were delivered
+    """
+    results_queue = Queue()
+    if pipe:
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        forwarder = threading.Thread(target=forward, args=(receiver, results_queue))
+        forwarder.daemon = True
+        forwarder.start()
+        output_queue = ConnectionQueue(sender)
+    else:
+        output_queue = results_queue
+
+    producer = threading.Thread(target=produce, args=(output_queue, messages, batched))
+    start = time.perf_counter()
+    producer.start()
+
+    delivered = 0
+    gets = 0
+    done = False
+    while not done:
+        result = results_queue.get()
+        gets += 1
+        for message in result.messages if isinstance(result, Batch) else [result]:
+            if isinstance(message, BuildEnd):
+                done = True
+            else:
+                delivered += 1
+    elapsed = time.perf_counter() - start
+
+    producer.join()
+    if pipe:
+        sender.close()
+    return elapsed, gets, delivered
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the delivery of output messages.')
+    parser.add_argument('--messages', type=int, default=100000, help='The number of messages to send.')
+    parser.add_argument('--pipe', action='store_true', help='Send the messages through a pipe, as from a worker process.')
+    options = parser.parse_args()
+
+    messages = build_output(options.messages)
+
+    print('%-10s %12s %16s %12s %12s' % ('delivery', 'time (ms)', 'messages/s', 'queue gets', 'delivered'))
+    for name, batched in [('single', False), ('batched', True)]:
+        elapsed, gets, delivered = measure(messages, batched, options.pipe)
+        print('%-10s %12.1f %16.0f %12d %12d' % (name, elapsed * 1000, len(messages) / elapsed, gets, delivered))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Measure the system calls and wall time needed to scan a project tree.
+
+Compares the os.walk()/os.path.isdir()/os.stat() approach that the
+monitor used to take with the os.scandir() based scanner:
+
+    $ python -m benchmarks.scan --files 10000
+
+System calls are counted at the level of the os module. DirEntry.is_dir()
+is assumed to be free (the type comes from the directory listing on
+Linux, macOS and Windows) and DirEntry.stat() is counted as one call on
+its first use, except on Windows, where the listing provides it.
+"""
+import argparse
+from collections import Counter
+import os
+import shutil
+import tempfile
+import time
+
+from galley.monitor import Monitor, gather_dir, gather_file, gather_tree, is_ignored_dir, is_source_file, scan
+
+from benchmarks.tree import make_tree
+
+
+class CountingDirEntry(object):
+    "A proxy for os.DirEntry that counts the system calls it makes"
+    def __init__(self, entry, counts):
+        self._entry = entry
+        self._counts = counts
+        self._stat = None
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        if follow_symlinks and self._entry.is_symlink():
+            self._counts['stat'] += 1
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        if follow_symlinks and self._entry.is_symlink():
+            self._counts['stat'] += 1
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self._entry.is_symlink()
+
+    def stat(self, follow_symlinks=True):
+        if self._stat is None and os.name != 'nt':
+            self._counts['stat'] += 1
+        self._stat = self._entry.stat(follow_symlinks=follow_symlinks)
+        return self._stat
+
+
+class CountingScandir(object):
+    "A proxy for the os.scandir() iterator"
+    def __init__(self, iterator, counts):
+        self._iterator = iterator
+        self._counts = counts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._iterator.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return CountingDirEntry(next(self._iterator), self._counts)
+
+    def close(self):
+        self._iterator.close()
+
+
+class SyscallCounter(object):
+    "A context manager that counts filesystem system calls made through the os module"
+    def __init__(self):
+        self.counts = Counter()
+
+    def __enter__(self):
+        self._originals = {
+            name: getattr(os, name)
+            for name in ('stat', 'lstat', 'listdir', 'scandir')
+        }
+
+        def counting(name):
+            original = self._originals[name]
+
+            def _counting(*args, **kwargs):
+                self.counts[name] += 1
+                return original(*args, **kwargs)
+            return _counting
+
+        for name in ('stat', 'lstat', 'listdir'):
+            setattr(os, name, counting(name))
+
+        def scandir(*args, **kwargs):
+            self.counts['scandir'] += 1
+            return CountingScandir(self._originals['scandir'](*args, **kwargs), self.counts)
+        os.scandir = scandir
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, original in self._originals.items():
+            setattr(os, name, original)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def legacy_scan(base_path, monitor):
+    "A scan of the project tree, as performed by the original os.walk monitor"
+    for dirname, dirnames, filenames in os.walk(base_path):
+        gather_dir(dirname, monitor)
+        for name in dirnames + filenames:
+            if os.path.isdir(os.path.join(dirname, name)):
+                if is_ignored_dir(name):
+                    dirnames.remove(name)
+            elif is_source_file(name):
+                gather_file(dirname, name, monitor)
+
+
+def scandir_scan(base_path, monitor):
+    "A scan of the project tree using the os.scandir() based scanner"
+    scan(base_path, gather_dir, gather_file, monitor, stat=True)
+
+
+def incremental_scan(base_path, monitor):
+    "An incremental rescan of an unchanged project tree"
+    gather_tree(base_path, monitor)
+
+
+STRATEGIES = [
+    ('os.walk', legacy_scan),
+    ('scandir', scandir_scan),
+    ('incremental', incremental_scan),
+]
+
+
+def measure(scanner, base_path, repeat):
+    """Measure a warm rescan of the tree.
+
+    Returns the system calls made by a single scan, and the best wall time
+    over `repeat` scans.
+    """
+    monitor = Monitor()
+    scanner(base_path, monitor)
+
+    with SyscallCounter() as counter:
+        monitor.reset()
+        scanner(base_path, monitor)
+
+    best = None
+    for i in range(repeat):
+        monitor.reset()
+        start = time.perf_counter()
+        scanner(base_path, monitor)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return counter, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark scans of a synthetic documentation tree.')
+    parser.add_argument('--files', type=int, default=10000, help='The number of documents in the tree.')
+    parser.add_argument('--depth', type=int, default=3, help='The depth of the directory tree.')
+    parser.add_argument('--fanout', type=int, default=4, help='The number of subdirectories in each directory.')
+    parser.add_argument('--repeat', type=int, default=5, help='The number of timed scans of each strategy.')
+    options = parser.parse_args()
+
+    base_path = tempfile.mkdtemp()
+    try:
+        make_tree(base_path, files=options.files, depth=options.depth, fanout=options.fanout)
+
+        print('%-12s %10s %10s %10s %10s %10s %12s' % (
+            'strategy', 'stat', 'lstat', 'listdir', 'scandir', 'total', 'wall (ms)'
+        ))
+        for name, scanner in STRATEGIES:
+            counter, elapsed = measure(scanner, base_path, options.repeat)
+            print('%-12s %10d %10d %10d %10d %10d %12.2f' % (
+                name,
+                counter.counts['stat'],
+                counter.counts['lstat'],
+                counter.counts['listdir'],
+                counter.counts['scandir'],
+                counter.total,
+                elapsed * 1000,
+            ))
+    finally:
+        shutil.rmtree(base_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Generate synthetic documentation trees for benchmarking."""
+import os
+
+
+def make_tree(base_path, files=1000, depth=3, fanout=4):
+    """Create a synthetic Sphinx documentation tree under base_path.
+
+    The tree has `fanout` subdirectories in every directory, down to
+    `depth` levels, and `files` documents spread evenly over all the
+    directories. Every directory also contains an image, and the root
+    contains a conf.py and a _build directory, so that scans have
+    content to skip.
+
+    Returns the list of document filenames that were created.
+    """
+    dirnames = [base_path]
+    level = [base_path]
+    for d in range(depth):
+        level = [
+            os.path.join(parent, 'section%d' % i)
+            for parent in level
+            for i in range(fanout)
+        ]
+        dirnames.extend(level)
+
+    for dirname in dirnames:
+        os.makedirs(dirname, exist_ok=True)
+        with open(os.path.join(dirname, 'diagram.png'), 'wb') as f:
+            f.write(b'\x89PNG')
+
+    with open(os.path.join(base_path, 'conf.py'), 'w') as f:
+        f.write("project = 'Benchmark'\n")
+    os.makedirs(os.path.join(base_path, '_build', 'json'), exist_ok=True)
+
+    documents = []
+    for i in range(files):
+        filename = os.path.join(dirnames[i % len(dirnames)], 'page%d.rst' % i)
+        with open(filename, 'w') as f:
+            f.write('Page %d\n=========\n\nSome content for page %d.\n' % (i, i))
+        documents.append(filename)
+    return documents
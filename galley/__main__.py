@@ -4,11 +4,26 @@ This is the main entry point for the Galley GUI.
 from tkinter import *
 
 import argparse
+import multiprocessing
 
 from galley import VERSION
+from galley.monitor import MONITORS
 from galley.view import MainWindow
 
 
+def jobs(value):
+    "Parse the number of parallel jobs; 'auto' means one per CPU"
+    if value == 'auto':
+        return multiprocessing.cpu_count()
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%r is not a number of jobs, or 'auto'" % value)
+    if count < 1:
+        raise argparse.ArgumentTypeError('The number of jobs must be at least 1')
+    return count
+
+
 def main():
     parser = argparse.ArgumentParser(description='GUI tool to assist in drafting documentation.')
     parser.add_argument(
@@ -16,6 +31,59 @@ def main():
         action='version',
         version=VERSION
     )
+    parser.add_argument(
+        '--monitor',
+        choices=['auto'] + sorted(MONITORS),
+        default='auto',
+        help='The mechanism used to detect changes to documentation sources.'
+    )
+    parser.add_argument(
+        '--fingerprint',
+        action='store_true',
+        help="Ignore saves that don't change the content of a document."
+    )
+    parser.add_argument(
+        '--quiet-period',
+        type=float,
+        default=0.25,
+        help='Seconds without further changes before a burst of changes is built.'
+    )
+    parser.add_argument(
+        '--max-latency',
+        type=float,
+        default=2.0,
+        help='The longest that a change will be held waiting for a burst of changes to end.'
+    )
+    parser.add_argument(
+        '--worker',
+        choices=['thread', 'process'],
+        default='thread',
+        help='Run Sphinx in a background thread, or in a separate process (which keeps the GUI responsive during builds).'
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=jobs,
+        default=1,
+        help="The number of processes Sphinx uses to read and write documents, or 'auto' for one per CPU."
+    )
+    parser.add_argument(
+        '--persist-every',
+        type=int,
+        default=10,
+        help='Save the build environment after this many builds, even if Galley is never idle; 1 saves it after every build.'
+    )
+    parser.add_argument(
+        '--no-write',
+        dest='write_files',
+        action='store_false',
+        help="Don't write built documents to disk; they are only delivered to the viewer."
+    )
+    parser.add_argument(
+        '--no-snapshot',
+        dest='snapshot',
+        action='store_false',
+        help="Don't remember the state of the documentation between runs."
+    )
 
     # parser.add_argument(
     #     'filename',
@@ -0,0 +1,140 @@
+"""A minimal ctypes binding to the Linux inotify API.
+
+Only the small part of the API that is needed by the file monitor is
+exposed. On platforms without inotify, ``is_available()`` returns False
+and constructing an ``INotify`` raises ``OSError``.
+"""
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+
+
+######################################################################
+# Event masks (from <sys/inotify.h>)
+######################################################################
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# Flags for inotify_init1(); these share values with the open() flags.
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+
+Event = namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    "Load the C library, if it provides the inotify API"
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+_libc = _load_libc()
+
+
+def _error(path=None):
+    "Construct an OSError from the current value of errno"
+    err = ctypes.get_errno()
+    return OSError(err, os.strerror(err), path)
+
+
+def is_available():
+    "Is the inotify API available on this platform?"
+    return _libc is not None
+
+
+class INotify(object):
+    "A handle on an inotify instance"
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available on this platform')
+        self.fd = _libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            raise _error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        "Release the inotify instance, and all its watches"
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path, mask):
+        "Watch the given path for the events in mask; returns the watch descriptor"
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise _error(path)
+        return wd
+
+    def rm_watch(self, wd):
+        "Stop watching the given watch descriptor"
+        # The kernel removes watches on deleted directories by itself, so
+        # a failure here just means the watch is already gone.
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        """Read all pending events.
+
+        Blocks for up to timeout seconds waiting for the first event;
+        returns an empty list if nothing happened in that time.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append(Event(wd, mask, cookie, os.fsdecode(name)))
+        return events
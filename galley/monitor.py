@@ -1,6 +1,15 @@
+from array import array
+from bisect import bisect_left
 from collections import namedtuple
+import hashlib
 import os
+import pickle
+from queue import Queue, Empty
 import sys
+import threading
+import time
+
+from galley import inotify
 
 
 ######################################################################
@@ -9,93 +18,1076 @@ import sys
 
 FileChange = namedtuple('FileChange', ['new', 'modified'])
 
+# Changes to the parts of a project that aren't documents. Each of these
+# only reports the names of the files that have been added or modified.
+ConfigChange = namedtuple('ConfigChange', ['filenames'])
+TemplateChange = namedtuple('TemplateChange', ['filenames'])
+StaticChange = namedtuple('StaticChange', ['filenames'])
+# A change to Python modules that documents depend on (e.g., through autodoc);
+# documents lists the source files of the dependent documents.
+ModuleChange = namedtuple('ModuleChange', ['filenames', 'documents'])
+# A change to other files that documents depend on, but that aren't
+# documents themselves (e.g., included snippets, or literalincluded code).
+DependencyChange = namedtuple('DependencyChange', ['filenames', 'documents'])
+
+
+def is_ignored_dir(dirname):
+    "Should the named directory be excluded from the project tree?"
+    return dirname in ('.git', '.hg') or dirname.endswith('.egg-info') or dirname.startswith('_')
+
+
+def is_source_file(filename):
+    "Is the named file a document source file?"
+    name, ext = os.path.splitext(filename)
+    return ext in ('.txt', '.rst')
+
+
+def is_asset_file(filename):
+    "Is the named file part of a template or static tree (rather than editor debris)?"
+    return not (filename.startswith(('.', '#')) or filename.endswith('~'))
+
+
+def scan_dir(dirname, accept=is_source_file, exclude=()):
+    """List the subdirectories and documents in a project directory.
+
+    Returns a pair of lists of os.DirEntry objects. The type of each entry
+    is (on most platforms) provided by the directory listing itself, and
+    each entry caches its stat result, so classifying the contents of a
+    directory doesn't require a system call per entry.
+
+    Only files for which accept(filename) is true are listed; the
+    subdirectories whose paths are in exclude are skipped.
+    """
+    subdirs = []
+    files = []
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                # Like os.walk(), don't follow symlinks to directories.
+                if (not is_ignored_dir(entry.name) and not entry.is_symlink()
+                        and entry.path not in exclude):
+                    subdirs.append(entry)
+            elif accept(entry.name):
+                files.append(entry)
+    return subdirs, files
+
 
-def project_visitor(on_dir, on_file):
-    """A filesystem visitor factory
+def scan(base_path, on_dir, on_file, data, stat=False, accept=is_source_file, exclude=()):
+    """Visit every directory and document in the project tree.
 
-    Returns os.walk-compatible visitor functions that will
-    invoke on_dir(dirname, data) and on_file(dirname, filename, data)
-    whenever a new directory or file is detected, respectively.
+    Invokes on_dir(dirname, data) and on_file(dirname, filename, data)
+    for each directory and document, respectively. A directory is visited
+    before any of its contents.
+
+    If stat is True, the stat result for the directory or file is passed
+    as an additional argument. This is obtained from the directory entry,
+    so it costs at most one system call per file.
+
+    accept and exclude select the files and directories that are visited;
+    see scan_dir().
     """
-    def _visitor(data, dirname, filesindir):
-        prune = []
-        on_dir(dirname, data)
-        for filename in filesindir:
-            if os.path.isdir(os.path.join(dirname, filename)):
-                if filename in ('.git', '.hg') or filename.endswith('.egg-info') or filename.startswith('_'):
-                    prune.append(filename)
+    if stat:
+        on_dir(base_path, data, os.stat(base_path))
+    else:
+        on_dir(base_path, data)
+    _scan(base_path, on_dir, on_file, data, stat, accept, exclude)
+
+
+def _scan(dirname, on_dir, on_file, data, stat, accept, exclude):
+    "Visit the contents of a directory that has already been visited"
+    subdirs, files = scan_dir(dirname, accept, exclude)
+    for entry in files:
+        try:
+            if stat:
+                on_file(dirname, entry.name, data, entry.stat())
             else:
-                name, ext = os.path.splitext(filename)
-                if ext in ('.txt', '.rst'):
-                    on_file(dirname, filename, data)
-                else:
-                    prune.append(filename)
+                on_file(dirname, entry.name, data)
+        except OSError:
+            # The file was removed after the directory was listed, or it
+            # is a dangling symlink (e.g., an editor's lock file).
+            continue
 
-        for filename in prune:
-            filesindir.remove(filename)
+    for entry in subdirs:
+        try:
+            if stat:
+                on_dir(entry.path, data, entry.stat())
+            else:
+                on_dir(entry.path, data)
+            _scan(entry.path, on_dir, on_file, data, stat, accept, exclude)
+        except OSError:
+            # The directory was removed after its parent was listed.
+            continue
 
-    return _visitor
 
+######################################################################
+# Project layout
+######################################################################
+
+class ProjectLayout(object):
+    """Where the different kinds of file in a Sphinx project live.
+
+    Documents, and the project configuration (conf.py), are found by
+    scanning the source directory. Templates and static files live in
+    their own directory trees, in which every file is of interest. The
+    template and static paths are interpreted relative to the source
+    directory, as they are in conf.py; they can be changed while the
+    monitor is running, once the real configuration is known.
+
+    The project can also depend on individual Python modules, and on other
+    files (e.g., included snippets), which may be anywhere; only the files
+    that documents are known to depend on are monitored.
+    """
+    def __init__(self, base_path, templates_path=('_templates',), static_path=('_static',)):
+        self.base_path = base_path
+        self.config_file = os.path.join(base_path, 'conf.py')
+        self.lock = threading.Lock()
+        # The filenames of Python modules, and of other files that aren't
+        # documents, mapped to the source files of the documents that
+        # depend on them.
+        self.modules = {}
+        self.dependencies = {}
+        self.configure(templates_path, static_path)
+
+    def configure(self, templates_path, static_path):
+        "Set the template and static paths"
+        with self.lock:
+            self.template_dirs = [
+                os.path.normpath(os.path.join(self.base_path, path))
+                for path in templates_path
+            ]
+            self.static_dirs = [
+                os.path.normpath(os.path.join(self.base_path, path))
+                for path in static_path
+            ]
+
+    def watch_modules(self, modules):
+        """Set the Python modules that documents depend on.
+
+        modules is a dictionary mapping the filename of each module to a
+        list of the source files of the documents that depend on it.
+        """
+        with self.lock:
+            self.modules = dict(modules)
+
+    def watch_dependencies(self, dependencies):
+        """Set the other files that documents depend on.
+
+        dependencies is a dictionary mapping the filename of each file to a
+        list of the source files of the documents that depend on it.
+        """
+        with self.lock:
+            self.dependencies = dict(dependencies)
+
+    def watched_files(self):
+        "The individual files that documents depend on"
+        with self.lock:
+            return list(self.modules) + list(self.dependencies)
+
+    def is_project_file(self, filename):
+        "Is the named file in the source tree a document, or the project configuration?"
+        return filename == 'conf.py' or is_source_file(filename)
+
+    def roots(self):
+        """Return the directory trees that make up the project.
+
+        Returns a list of (dirname, accept) pairs, where accept(filename)
+        decides if a file in that tree is of interest. The source directory
+        is always first.
+        """
+        with self.lock:
+            return [(self.base_path, self.is_project_file)] + [
+                (dirname, is_asset_file)
+                for dirname in self.template_dirs + self.static_dirs
+            ]
+
+    def classify(self, filename):
+        """Return the type of change message that should report a change to
+        the named file, or None if the file isn't of interest.
+        """
+        if filename == self.config_file:
+            return ConfigChange
+        with self.lock:
+            if filename in self.modules:
+                return ModuleChange
+            if filename in self.dependencies:
+                return DependencyChange
+            for dirname in self.template_dirs:
+                if filename.startswith(dirname + os.sep):
+                    return TemplateChange
+            for dirname in self.static_dirs:
+                if filename.startswith(dirname + os.sep):
+                    return StaticChange
+        if is_source_file(filename):
+            return FileChange
+        return None
+
+    def changes(self, new, modified):
+        """Split a set of new and modified files into the change messages
+        that should report them.
+
+        Any change to the configuration is reported first, as reloading the
+        configuration can make the other changes redundant.
+        """
+        sources = ([], [])
+        others = {}
+        for i, filenames in enumerate((new, modified)):
+            for filename in filenames:
+                kind = self.classify(filename)
+                if kind is FileChange:
+                    sources[i].append(filename)
+                elif kind is not None:
+                    others.setdefault(kind, []).append(filename)
+
+        messages = [
+            kind(others[kind])
+            for kind in (ConfigChange, TemplateChange, StaticChange)
+            if kind in others
+        ]
+        with self.lock:
+            # The dictionaries are replaced, never modified, when the files
+            # being watched change.
+            dependents = {ModuleChange: self.modules, DependencyChange: self.dependencies}
+        for kind in (ModuleChange, DependencyChange):
+            if kind in others:
+                documents = set()
+                for filename in others[kind]:
+                    documents.update(dependents[kind].get(filename, []))
+                messages.append(kind(others[kind], sorted(documents)))
+        if sources[0] or sources[1]:
+            messages.append(FileChange(*sources))
+        return messages
+
+
+def fingerprint(filename):
+    "Compute a digest of the content of a file"
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class DirRecord(object):
+    """The modification state of a single directory.
+
+    The names of the documents in the directory are kept in sorted order.
+    Their modification times, sizes and content fingerprints are held in
+    parallel arrays, rather than as an object per document.
+    """
+    __slots__ = ('id', 'path', 'mtime', 'subdirs', 'names', 'mtimes', 'sizes', 'digests')
+
+    def __init__(self, id, path):
+        self.id = id
+        self.path = path
+        self.mtime = None
+        # The names of the subdirectories, once the directory has been listed.
+        self.subdirs = None
+
+        self.names = []
+        self.mtimes = array('d')
+        self.sizes = array('q')
+        self.digests = []
+
+    def index(self, name):
+        "Return the index of the named document, or -1 if it isn't known"
+        i = bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return i
+        return -1
+
+    def insert(self, name, mtime, size):
+        "Add a document to the directory; returns the index of the document"
+        i = bisect_left(self.names, name)
+        self.names.insert(i, name)
+        self.mtimes.insert(i, mtime)
+        self.sizes.insert(i, size)
+        self.digests.insert(i, None)
+        return i
+
+    def remove(self, name):
+        "Remove a document from the directory, if it is known"
+        i = self.index(name)
+        if i >= 0:
+            del self.names[i]
+            del self.mtimes[i]
+            del self.sizes[i]
+            del self.digests[i]
+
+
+class PathTable(object):
+    """The modification state of a project tree.
+
+    Each directory is assigned an integer id when it is first seen; its
+    (interned) path is stored once, on the DirRecord for that id.
+    """
+    __slots__ = ('ids', 'records')
 
-class Monitor(object):
-    "An object to track file modification data"
     def __init__(self):
-        self.modification_time = {}
+        self.ids = {}
+        self.records = []
+
+    def __iter__(self):
+        return (record for record in self.records if record is not None)
+
+    def get(self, dirname):
+        "Return the record for a directory, or None if it isn't known"
+        i = self.ids.get(dirname)
+        if i is None:
+            return None
+        return self.records[i]
+
+    def add(self, dirname):
+        "Add a record for a new directory"
+        record = DirRecord(len(self.records), sys.intern(dirname))
+        self.ids[record.path] = record.id
+        self.records.append(record)
+        return record
+
+    def discard(self, dirname):
+        "Discard the record for a directory, if it is known"
+        i = self.ids.pop(dirname, None)
+        if i is not None:
+            self.records[i] = None
+
+
+class Fingerprints(object):
+    """Detects modifications that don't change the content of a document.
+
+    A touch, a save without edits, or a checkout that rewrites a file with
+    identical content will move the modification time of a document
+    without changing its content.
+
+    A file is only hashed if its size is unchanged; a file whose size has
+    changed must have different content. As a result, the fingerprint for
+    a file isn't known again until the next modification that doesn't
+    change its size. The fingerprints themselves are kept on the DirRecord
+    for each directory.
+    """
+    def __init__(self):
+        # The number of files that have been hashed.
+        self.hashed = 0
+        # The number of modifications that were found to change nothing.
+        self.suppressed = 0
+
+    def add(self, record, i):
+        "Fingerprint a newly discovered document"
+        record.digests[i] = fingerprint(os.path.join(record.path, record.names[i]))
+        self.hashed += 1
+
+    def changed(self, record, i, size):
+        """Has the content of a document actually changed since it was last
+        examined?
+
+        Must be invoked before the new size is recorded.
+        """
+        if size != record.sizes[i]:
+            record.digests[i] = None
+            return True
+
+        old_digest = record.digests[i]
+        record.digests[i] = fingerprint(os.path.join(record.path, record.names[i]))
+        self.hashed += 1
+        if record.digests[i] == old_digest:
+            self.suppressed += 1
+            return False
+        return True
+
+
+class Monitor(object):
+    """An object to track file modification data
+
+    If fingerprint is True, the content of documents is also tracked, and
+    modifications that don't change the content of a document are ignored.
+
+    layout is the ProjectLayout describing the trees that are monitored.
+    """
+    def __init__(self, fingerprint=False, layout=None):
+        self.table = PathTable()
+        self.fingerprints = Fingerprints() if fingerprint else None
+        self.layout = layout
+        # The roots of the trees that have been scanned, or None before
+        # the initial scan.
+        self.roots = None
+        # The modification times of the individual files (Python modules,
+        # and other dependencies) that are monitored.
+        self.dependencies = {}
+        # The Snapshot of the tree from the last time Galley ran (if any).
+        self.snapshot = None
+        # The Outdated documents, if the changes that are reported are to
+        # be tracked until they have been built.
+        self.outdated = None
         self.reset()
 
     def reset(self):
         self.new_dirs = []
         self.modified_dirs = []
 
-        self.new_files = []
-        self.modified_files = []
+        # Documents are recorded as (DirRecord, name) pairs; full filenames
+        # are only constructed for changes that are reported.
+        self.new_documents = []
+        self.modified_documents = []
+
+        # The filenames of the individual files that have been modified.
+        self.modified_dependencies = []
+
+    @property
+    def new_files(self):
+        return [os.path.join(record.path, name) for record, name in self.new_documents]
+
+    @property
+    def modified_files(self):
+        return [
+            os.path.join(record.path, name) for record, name in self.modified_documents
+        ] + self.modified_dependencies
+
+    def discard_dir(self, dirname):
+        "Discard everything known about a directory (but not its subdirectories)"
+        self.table.discard(dirname)
 
+    def discard_file(self, dirname, filename):
+        "Discard everything known about a file"
+        record = self.table.get(dirname)
+        if record is not None:
+            record.remove(filename)
 
-def gather_dir(dirname, monitor):
-    "The visitor utility method to catch directory modifications"
-    stat = os.stat(dirname)
+
+def gather_dir(dirname, monitor, stat=None):
+    """The visitor utility method to catch directory modifications
+
+    If the stat result for the directory isn't provided, it will be
+    retrieved. Returns True if the directory is new or has been modified.
+    """
+    if stat is None:
+        stat = os.stat(dirname)
     current_mtime = stat.st_mtime
     if sys.platform == "win32":
         current_mtime -= stat.st_ctime
 
-    try:
-        old_mtime = monitor.modification_time[dirname][None]
-        if old_mtime < current_mtime:
-            monitor.modified_dirs.append(dirname)
-    except KeyError:
-        monitor.new_dirs.append(dirname)
+    changed = True
+    record = monitor.table.get(dirname)
+    if record is None:
+        record = monitor.table.add(dirname)
+        monitor.new_dirs.append(record.path)
+    elif record.mtime < current_mtime:
+        monitor.modified_dirs.append(record.path)
+    else:
+        changed = False
 
     # Record the new modification time.
-    monitor.modification_time.setdefault(dirname, {})[None] = current_mtime
+    record.mtime = current_mtime
+    return changed
 
 
-def gather_file(dirname, filename, monitor):
-    "The visitor utility method to catch file modifications"
-    stat = os.stat(os.path.join(dirname, filename))
+def gather_file(dirname, filename, monitor, stat=None):
+    """The visitor utility method to catch file modifications
+
+    If the stat result for the file isn't provided, it will be retrieved.
+    """
+    if stat is None:
+        stat = os.stat(os.path.join(dirname, filename))
     current_mtime = stat.st_mtime
     if sys.platform == "win32":
         current_mtime -= stat.st_ctime
 
+    fingerprints = monitor.fingerprints
+    record = monitor.table.get(dirname)
+    i = record.index(filename)
+    if i < 0:
+        i = record.insert(filename, current_mtime, stat.st_size)
+        monitor.new_documents.append((record, record.names[i]))
+        if fingerprints is not None:
+            fingerprints.add(record, i)
+    elif record.mtimes[i] < current_mtime:
+        if fingerprints is None or fingerprints.changed(record, i, stat.st_size):
+            monitor.modified_documents.append((record, record.names[i]))
+
+        # Record the new modification time.
+        record.mtimes[i] = current_mtime
+        record.sizes[i] = stat.st_size
+
+
+def gather_dependencies(monitor):
+    """Check the individual files in the monitor's project layout (Python
+    modules, and other files that documents depend on) for modifications.
+
+    A file that has only just been added to the layout isn't reported
+    as modified.
+    """
+    dependencies = {}
+    for filename in monitor.layout.watched_files():
+        try:
+            current_mtime = os.stat(filename).st_mtime
+        except OSError:
+            continue
+        mtime = monitor.dependencies.get(filename)
+        if mtime is not None and mtime < current_mtime:
+            monitor.modified_dependencies.append(filename)
+        dependencies[filename] = current_mtime
+    monitor.dependencies = dependencies
+
+
+def forget_dir(dirname, monitor):
+    "Discard everything that is known about a directory tree"
+    record = monitor.table.get(dirname)
+    if record is not None:
+        for subdir in record.subdirs or []:
+            forget_dir(os.path.join(dirname, subdir), monitor)
+        monitor.discard_dir(dirname)
+
+
+def gather_tree(dirname, monitor, full=False, accept=is_source_file, exclude=()):
+    """Incrementally rescan the directory tree rooted at dirname.
+
+    A directory's modification time only moves when entries are added to,
+    removed from, or renamed within it. Only directories whose modification
+    time has moved are re-listed, and only the files in those directories
+    are examined. Documents that are edited in place don't touch their
+    directory, so a full rescan, which examines every known file, should be
+    performed periodically.
+
+    accept and exclude select the files and directories that are examined;
+    see scan_dir().
+    """
     try:
-        old_mtime = monitor.modification_time[dirname][filename]
-        if old_mtime < current_mtime:
-            monitor.modified_files.append(os.path.join(dirname, filename))
-    except KeyError:
-        monitor.new_files.append(os.path.join(dirname, filename))
+        touched = gather_dir(dirname, monitor)
+        record = monitor.table.get(dirname)
+        if touched or record.subdirs is None:
+            touched = True
+            subdir_entries, file_entries = scan_dir(dirname, accept, exclude)
+    except OSError:
+        # The directory has been removed; the next rescan of the parent
+        # will notice that it is gone.
+        forget_dir(dirname, monitor)
+        return
 
-    # Record the new modification time.
-    monitor.modification_time[dirname][filename] = current_mtime
+    if touched:
+        old_subdirs = record.subdirs or []
+        record.subdirs = [sys.intern(entry.name) for entry in subdir_entries]
+        for subdir in set(old_subdirs).difference(record.subdirs):
+            forget_dir(os.path.join(dirname, subdir), monitor)
+
+        names = set(entry.name for entry in file_entries)
+        for filename in [name for name in record.names if name not in names]:
+            record.remove(filename)
+
+        for entry in file_entries:
+            try:
+                gather_file(dirname, entry.name, monitor, entry.stat())
+            except OSError:
+                # The file was removed after the directory was listed.
+                pass
+    elif full:
+        for filename in list(record.names):
+            try:
+                gather_file(dirname, filename, monitor)
+            except OSError:
+                pass
+
+    for subdir in record.subdirs:
+        gather_tree(os.path.join(dirname, subdir), monitor, full, accept, exclude)
+
+
+######################################################################
+# Snapshots
+######################################################################
+
+# Increment whenever the structure of saved snapshots changes.
+SNAPSHOT_VERSION = 2
+
+# The modification time saved for a document whose changes haven't been
+# built; it is older than any real file, so the document will be reported
+# as modified on the next run.
+OUTDATED_MTIME = -1.0
+
+
+class Outdated(object):
+    """The documents whose changes haven't been built yet.
+
+    The monitor adds each document that it reports as new or modified; the
+    view takes the documents out again as builds that include them are
+    completed. Whatever is left when the monitor stops is saved in the
+    snapshot as out of date.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Each document is mapped to a count of changes, so that a change
+        # made while a build is running isn't mistaken for the one it built.
+        self.changes = {}
+        self.count = 0
+
+    def add(self, filenames):
+        "Record changes to the named documents"
+        with self.lock:
+            for filename in filenames:
+                self.count += 1
+                self.changes[filename] = self.count
+
+    def building(self, filenames=None):
+        "The changes that a build of the named files (or of every file) includes"
+        with self.lock:
+            if filenames is None:
+                return dict(self.changes)
+            return dict(
+                (filename, self.changes[filename])
+                for filename in filenames if filename in self.changes
+            )
+
+    def built(self, changes):
+        "Discard changes that have been built, unless the documents have changed again since"
+        with self.lock:
+            for filename, count in changes.items():
+                if self.changes.get(filename) == count:
+                    del self.changes[filename]
+
+    def filenames(self):
+        "The documents that are out of date"
+        with self.lock:
+            return set(self.changes)
+
+
+class Snapshot(object):
+    "The modification state of a project tree, as it was when Galley last exited"
+    def __init__(self, table):
+        self.table = table
+
+    def diff(self, monitor):
+        """Compare the snapshot with the results of an initial scan.
+
+        Returns lists of the documents that are new, and that have been
+        modified since the snapshot was taken. If both the snapshot and the
+        monitor have content fingerprints, documents whose mtime has moved
+        but whose content is unchanged aren't reported.
+        """
+        new = []
+        modified = []
+        for record, name in monitor.new_documents:
+            path = os.path.join(record.path, name)
+            old_record = self.table.get(record.path)
+            old = old_record.index(name) if old_record is not None else -1
+            if old < 0:
+                new.append(path)
+                continue
+
+            i = record.index(name)
+            if old_record.mtimes[old] < record.mtimes[i]:
+                if (monitor.fingerprints is not None
+                        and old_record.digests[old] is not None
+                        and old_record.sizes[old] == record.sizes[i]
+                        and old_record.digests[old] == record.digests[i]):
+                    monitor.fingerprints.suppressed += 1
+                    continue
+                modified.append(path)
+        return new, modified
+
+
+def save_snapshot(monitor, base_path, filename):
+    """Save the modification state of a monitor, so it can be restored on the next launch
+
+    Documents that the monitor's Outdated documents haven't seen built are
+    saved as out of date.
+    """
+    outdated = monitor.outdated.filenames() if monitor.outdated is not None else set()
+    records = []
+    for record in monitor.table:
+        mtimes = record.mtimes
+        digests = record.digests if monitor.fingerprints is not None else None
+        for i, name in enumerate(record.names):
+            if os.path.join(record.path, name) in outdated:
+                if mtimes is record.mtimes:
+                    mtimes = array('d', mtimes)
+                    digests = list(digests) if digests is not None else None
+                mtimes[i] = OUTDATED_MTIME
+                # The content may match, but it still needs to be built.
+                if digests is not None:
+                    digests[i] = None
+        records.append((
+            os.path.relpath(record.path, base_path),
+            record.mtime,
+            record.names,
+            mtimes,
+            record.sizes,
+            digests,
+        ))
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'records': records,
+    }
+
+    # Write to a temporary file, so that an interrupted save can't leave
+    # a truncated snapshot behind.
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename + '.tmp', 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp', filename)
+
+
+def load_snapshot(base_path, filename):
+    "Load a saved snapshot; returns None if there isn't a usable snapshot"
+    try:
+        with open(filename, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        return None
+
+    table = PathTable()
+    for path, mtime, names, mtimes, sizes, digests in data['records']:
+        record = table.add(os.path.normpath(os.path.join(base_path, path)))
+        record.mtime = mtime
+        record.names = names
+        record.mtimes = mtimes
+        record.sizes = sizes
+        record.digests = digests if digests is not None else [None] * len(names)
+    return Snapshot(table)
+
+
+######################################################################
+# Monitor backends
+######################################################################
+
+def scan_project(monitor, scan_tree):
+    """Scan each of the directory trees in the monitor's project layout.
+
+    scan_tree(dirname, accept, exclude) scans a single tree. A tree that has
+    been added to the layout since the last scan is scanned silently: its
+    files are recorded, but aren't reported as new. A tree that is only
+    created after it has been added to the layout is reported as usual.
+    """
+    roots = monitor.layout.roots()
+    exclude = set(dirname for dirname, accept in roots[1:])
+    for i, (dirname, accept) in enumerate(roots):
+        # The source directory must exist; the others are optional.
+        if i > 0 and not os.path.isdir(dirname):
+            continue
+        if monitor.roots is None or dirname in monitor.roots:
+            scan_tree(dirname, accept, exclude)
+        else:
+            count = len(monitor.new_documents)
+            scan_tree(dirname, accept, exclude)
+            del monitor.new_documents[count:]
+    monitor.roots = set(dirname for dirname, accept in roots)
+    gather_dependencies(monitor)
+
+
+def record_outdated(monitor, filenames):
+    "Record that the named files have changed, if the monitor tracks outdated documents"
+    if monitor.outdated is not None:
+        monitor.outdated.add(
+            filename for filename in filenames
+            if monitor.layout is None or monitor.layout.classify(filename) is FileChange
+        )
+
+
+def report_changes(monitor, output_queue):
+    "Put the changes found by the most recent scan onto the output queue"
+    if monitor.new_documents or monitor.modified_documents or monitor.modified_dependencies:
+        record_outdated(monitor, monitor.new_files + monitor.modified_files)
+        output_queue.put(FileChange(monitor.new_files, monitor.modified_files))
+
+
+def report_offline_changes(monitor, output_queue):
+    """Put the changes that were made while Galley wasn't running onto the
+    output queue.
+
+    Invoked after the initial scan; does nothing if there was no snapshot
+    from a previous run.
+    """
+    if monitor.snapshot is not None:
+        new, modified = monitor.snapshot.diff(monitor)
+        monitor.snapshot = None
+        if new or modified:
+            record_outdated(monitor, new + modified)
+            output_queue.put(FileChange(new, modified))
+
+
+def poll_monitor(base_path, stop_event, output_queue, monitor):
+    "A file monitor that rescans the entire project tree once a second"
+    def scan_tree(dirname, accept, exclude):
+        scan(dirname, gather_dir, gather_file, monitor, stat=True, accept=accept, exclude=exclude)
+
+    scan_project(monitor, scan_tree)
+    report_offline_changes(monitor, output_queue)
+
+    while not stop_event.is_set():
+        stop_event.wait(1.0)
+        monitor.reset()
+        scan_project(monitor, scan_tree)
+        report_changes(monitor, output_queue)
+
+
+def incremental_monitor(base_path, stop_event, output_queue, monitor, full_scan_interval=10):
+    """A file monitor that polls once a second, using directory modification
+    times to skip the parts of the project tree that haven't changed.
 
+    Every full_scan_interval polls, all known documents are examined, to
+    catch any documents that were edited in place.
+    """
+    full = False
+
+    def scan_tree(dirname, accept, exclude):
+        gather_tree(dirname, monitor, full, accept, exclude)
 
-def file_monitor(base_path, stop_event, output_queue):
-    "The actual thread method that checks for file modifications"
-    monitor = Monitor()
-    os.walk(base_path, project_visitor(gather_dir, gather_file), monitor)
+    scan_project(monitor, scan_tree)
+    report_offline_changes(monitor, output_queue)
 
+    polls = 0
     while not stop_event.is_set():
         stop_event.wait(1.0)
+        polls += 1
+        full = (polls % full_scan_interval == 0)
         monitor.reset()
-        os.walk(base_path, project_visitor(gather_dir, gather_file), monitor)
+        scan_project(monitor, scan_tree)
+        report_changes(monitor, output_queue)
+
+
+# The inotify events that can indicate a change to the project tree.
+INOTIFY_MASK = (
+    inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO
+    | inotify.IN_CREATE | inotify.IN_DELETE | inotify.IN_MOVED_FROM
+    | inotify.IN_ONLYDIR | inotify.IN_EXCL_UNLINK
+)
+
+
+class InotifyUnavailable(Exception):
+    "inotify can't be used to watch the project tree"
+
+
+def inotify_monitor(base_path, stop_event, output_queue, monitor):
+    """A file monitor driven by Linux inotify events.
+
+    A watch is placed on every project directory; rather than rescanning
+    the tree, only the files named in change events are examined.
+
+    Raises InotifyUnavailable if inotify can't be set up, or a directory
+    can't be watched (e.g., the per-user limit on watches has been reached).
+    """
+    try:
+        notifier = inotify.INotify()
+    except OSError as err:
+        raise InotifyUnavailable(err)
+
+    with notifier:
+        # Watch descriptors, mapped to the directory they are watching and
+        # the function that accepts files in that directory.
+        watches = {}
+
+        def scan_tree(dirname, accept, exclude):
+            def watch_dir(dirname, monitor, stat):
+                try:
+                    wd = notifier.add_watch(dirname, INOTIFY_MASK)
+                except (FileNotFoundError, NotADirectoryError):
+                    # The directory has already gone away.
+                    raise
+                except OSError as err:
+                    raise InotifyUnavailable(err)
+                watches[wd] = (dirname, accept)
+                gather_dir(dirname, monitor, stat)
+
+            scan(dirname, watch_dir, gather_file, monitor, stat=True, accept=accept, exclude=exclude)
+
+        def forget_dir(dirname):
+            prefix = dirname + os.sep
+            for wd, (watched, accept) in list(watches.items()):
+                if watched == dirname or watched.startswith(prefix):
+                    notifier.rm_watch(wd)
+                    del watches[wd]
+                    monitor.discard_dir(watched)
+
+        scan_project(monitor, scan_tree)
+        report_offline_changes(monitor, output_queue)
+
+        while not stop_event.is_set():
+            events = notifier.read(timeout=1.0)
+            monitor.reset()
+
+            roots = monitor.layout.roots()
+            if set(dirname for dirname, accept in roots) != monitor.roots:
+                # The layout has changed; pick up any new trees.
+                scan_project(monitor, scan_tree)
+            exclude = set(dirname for dirname, accept in roots[1:])
+
+            for event in events:
+                if event.mask & inotify.IN_Q_OVERFLOW:
+                    # The kernel's event queue overflowed, so events have
+                    # been lost. Rescan the tree to find out what changed.
+                    scan_project(monitor, scan_tree)
+                    continue
+
+                dirname, accept = watches.get(event.wd, (None, None))
+                if dirname is None:
+                    # An event for a watch that has already been removed.
+                    continue
+
+                if event.mask & inotify.IN_IGNORED:
+                    # The watched directory itself has gone away.
+                    del watches[event.wd]
+                    monitor.discard_dir(dirname)
+
+                elif event.mask & inotify.IN_ISDIR:
+                    path = os.path.join(dirname, event.name)
+                    if path in exclude:
+                        # A template or static tree has been created.
+                        accept = dict(roots)[path]
+                    elif is_ignored_dir(event.name):
+                        continue
+                    if event.mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO):
+                        try:
+                            scan_tree(path, accept, exclude)
+                        except InotifyUnavailable:
+                            raise
+                        except OSError:
+                            # The directory was removed before it could be
+                            # scanned; forget whatever was seen of it.
+                            forget_dir(path)
+                    else:
+                        forget_dir(path)
+
+                elif accept(event.name):
+                    if event.mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+                        monitor.discard_file(dirname, event.name)
+                    elif event.mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+                        try:
+                            gather_file(dirname, event.name, monitor)
+                        except OSError:
+                            # The file was removed before we could look at it.
+                            pass
+
+            # Python modules and other dependencies aren't watched, as they
+            # can be anywhere; there are few enough of them that they can be
+            # checked on every pass.
+            gather_dependencies(monitor)
+            report_changes(monitor, output_queue)
+
+
+def coalesce_changes(input_queue, output_queue, quiet_period, max_latency, layout=None):
+    """Merge bursts of FileChange messages into a single FileChange.
+
+    Changes are held until no further change has arrived for quiet_period
+    seconds, or until the oldest held change is max_latency seconds old,
+    whichever comes first. A file is reported at most once per merged
+    change; a file that is new in any of the merged changes is reported
+    as new.
+
+    If a ProjectLayout is provided, the merged change is split into a
+    message for each kind of file that changed; see ProjectLayout.changes().
+
+    Putting None on the input queue flushes any held changes, and stops
+    the coalescer.
+    """
+    # Dictionaries are used as insertion-ordered sets.
+    new = {}
+    modified = {}
+    first = last = None
+
+    def flush():
+        if layout is None:
+            output_queue.put(FileChange(list(new), list(modified)))
+        else:
+            for message in layout.changes(list(new), list(modified)):
+                output_queue.put(message)
+
+    while True:
+        if new or modified:
+            deadline = min(last + quiet_period, first + max_latency)
+            timeout = max(0.0, deadline - time.monotonic())
+        else:
+            timeout = None
+
+        try:
+            change = input_queue.get(timeout=timeout)
+        except Empty:
+            flush()
+            new = {}
+            modified = {}
+            continue
+
+        if change is None:
+            if new or modified:
+                flush()
+            return
+
+        now = time.monotonic()
+        if not (new or modified):
+            first = now
+        last = now
+
+        for filename in change.new:
+            modified.pop(filename, None)
+            new[filename] = True
+        for filename in change.modified:
+            if filename not in new:
+                modified[filename] = True
+
+
+MONITORS = {
+    'incremental': incremental_monitor,
+    'inotify': inotify_monitor,
+    'poll': poll_monitor,
+}
+
+
+def file_monitor(base_path, stop_event, output_queue, backend='auto', fingerprint=False,
+                 quiet_period=0.25, max_latency=2.0, snapshot=None, layout=None, outdated=None):
+    """The actual thread method that checks for file modifications
+
+    backend is the name of one of the MONITORS; if it is 'auto', inotify
+    will be used if the platform supports it. Polling is used as a fallback
+    if the requested backend can't be used.
+
+    If fingerprint is True, modifications that don't change the content of
+    a document won't be reported.
+
+    Bursts of changes are merged before being put on the output queue;
+    see coalesce_changes() for the meaning of quiet_period and max_latency.
+
+    If snapshot is the name of a file, the modification state of the tree
+    is saved to that file when the monitor stops. On the next run, any
+    documents that changed in the meantime are reported as soon as the
+    initial scan is complete. outdated is the Outdated tracker from which
+    the builder of the documents discards the changes it has built; any
+    change left in it is reported again on the next run. Without one, no
+    change that was reported is assumed to have been built.
+
+    layout is the ProjectLayout of the project; by default, the conventional
+    layout of a project in base_path is assumed. Documents are reported
+    with FileChange messages; changes to the configuration, templates,
+    static files, Python modules and other dependencies are reported with
+    ConfigChange, TemplateChange, StaticChange, ModuleChange and
+    DependencyChange messages.
+    """
+    if layout is None:
+        layout = ProjectLayout(base_path)
+    monitor = Monitor(fingerprint=fingerprint, layout=layout)
+    if snapshot:
+        monitor.snapshot = load_snapshot(base_path, snapshot)
+        monitor.outdated = outdated if outdated is not None else Outdated()
+
+    changes = Queue()
+    coalescer = threading.Thread(
+        target=coalesce_changes,
+        args=(changes, output_queue, quiet_period, max_latency, layout)
+    )
+    coalescer.daemon = True
+    coalescer.start()
+
+    try:
+        if backend == 'auto':
+            backend = 'inotify' if inotify.is_available() else 'poll'
+
+        if backend == 'inotify':
+            try:
+                inotify_monitor(base_path, stop_event, changes, monitor)
+            except InotifyUnavailable:
+                # inotify couldn't be used (e.g., the per-user limit on
+                # watches has been reached), so fall back to polling.
+                MONITORS['poll'](base_path, stop_event, changes, monitor)
+        else:
+            MONITORS[backend](base_path, stop_event, changes, monitor)
 
-        if monitor.new_files or monitor.modified_files:
-            output_queue.put(FileChange(monitor.new_files, monitor.modified_files))
+        if snapshot:
+            save_snapshot(monitor, base_path, snapshot)
+    finally:
+        changes.put(None)
+        coalescer.join()
@@ -3,8 +3,9 @@
 
 This is the "View" of the MVC world.
 """
+from collections import OrderedDict
 import os
-from queue import Query, Empty
+from queue import Queue, Empty
 import threading
 from tkinter import *
 from tkinter.font import *
@@ -17,20 +18,40 @@ from tkreadonly import ReadOnlyText
 
 from galley import VERSION, NUM_VERSION
 from galley.widgets import SimpleHTMLView, FileView
-from galley.monitor import file_monitor, FileChange
+from galley.monitor import (
+    file_monitor,
+    ProjectLayout,
+    Outdated,
+    FileChange,
+    ConfigChange,
+    TemplateChange,
+    StaticChange,
+    ModuleChange,
+    DependencyChange,
+)
 from galley.worker import (
     sphinx_worker,
+    WorkerProcess,
     ReloadConfig,
     BuildAll,
     BuildSpecific,
+    RewriteAll,
+    CopyStatic,
     Quit,
+    Focus,
     Output,
     WarningOutput,
     Progress,
     InitializationStart,
     InitializationEnd,
     BuildStart,
-    BuildEnd
+    BuildEnd,
+    BuildCancelled,
+    ModuleDependencies,
+    FileDependencies,
+    DocumentReady,
+    Batch,
+    collapse,
 )
 
 
@@ -50,7 +71,72 @@ def filename_normalizer(base_path):
 
 
 
+class NotifyingQueue(Queue):
+    """A Queue that wakes the Tk main loop when there are results waiting.
+
+    Putting an item on the queue writes a byte to a pipe that Tk watches
+    (unless a wakeup is already pending), and Tk calls callback from the
+    main loop. Tk can't watch a pipe on Windows; there, callback is called
+    every interval milliseconds instead.
+    """
+    def __init__(self, root, callback, interval=40):
+        Queue.__init__(self)
+        self.root = root
+        self.callback = callback
+        self.interval = interval
+
+        self.pending = False
+        if hasattr(root.tk, 'createfilehandler'):
+            self.read_fd, self.write_fd = os.pipe()
+            os.set_blocking(self.read_fd, False)
+            os.set_blocking(self.write_fd, False)
+            root.tk.createfilehandler(self.read_fd, READABLE, self._wake)
+        else:
+            self.read_fd = self.write_fd = None
+            root.after(interval, self._poll)
+
+    def put(self, item, block=True, timeout=None):
+        Queue.put(self, item, block, timeout)
+        write_fd = self.write_fd
+        if write_fd is not None and not self.pending:
+            self.pending = True
+            try:
+                os.write(write_fd, b'!')
+            except OSError:
+                # The pipe is full, so Tk will wake up anyway; or the
+                # queue has been closed, and nothing is listening.
+                pass
+
+    def _wake(self, fd, mask):
+        # The pipe is emptied, then the wakeup is cleared, before the queue
+        # is drained. Anything put on the queue before the wakeup is cleared
+        # is drained now; anything put after it writes to the pipe again.
+        try:
+            os.read(self.read_fd, 4096)
+        except BlockingIOError:
+            pass
+        self.pending = False
+        self.callback()
+
+    def _poll(self):
+        self.callback()
+        self.root.after(self.interval, self._poll)
+
+    def close(self):
+        "Stop waking the main loop"
+        if self.read_fd is not None:
+            self.root.tk.deletefilehandler(self.read_fd)
+            read_fd, write_fd = self.read_fd, self.write_fd
+            self.read_fd = self.write_fd = None
+            os.close(read_fd)
+            os.close(write_fd)
+
+
 class MainWindow(object):
+    # The number of rendered documents kept in memory when they are also
+    # written to disk; any others are read from disk when they are shown.
+    DOCUMENT_CACHE_SIZE = 8
+
     def __init__(self, root, options):
         '''
         -----------------------------------------------------
@@ -97,6 +183,12 @@ class MainWindow(object):
         # Known warnings, indexed by source file.
         self.warning_output = {}
 
+        # Rendered documents delivered by the worker, indexed by source file,
+        # least recently used first. If the worker doesn't write documents
+        # to disk, this is the only place to find them, so none are dropped.
+        self.documents = OrderedDict()
+        self.write_files = options.write_files
+
         # Setup the menu
         self._setup_menubar()
 
@@ -111,23 +203,43 @@ class MainWindow(object):
         self.root.rowconfigure(1, weight=1)
         self.root.rowconfigure(2, weight=0)
 
-        # Set up a background worker thread to build docs.
-        self.work_queue = Queue()
-        self.results_queue = Queue()
-        self.worker_thread = threading.Thread(target=sphinx_worker, args=(os.path.join(self.base_path, 'docs'), self.work_queue, self.results_queue))
-        self.worker_thread.daemon = True
+        # Set up a background worker to build docs. A worker process stands
+        # in for both the work queue and the worker thread. Tk only looks
+        # at the results when there are some.
+        self.results_queue = NotifyingQueue(self.root, self.handle_background_tasks)
+        if options.worker == 'process':
+            self.work_queue = WorkerProcess(os.path.join(self.base_path, 'docs'), self.results_queue, options.jobs, options.persist_every, options.write_files)
+            self.worker_thread = self.work_queue
+        else:
+            self.work_queue = Queue()
+            self.worker_thread = threading.Thread(target=sphinx_worker, args=(os.path.join(self.base_path, 'docs'), self.work_queue, self.results_queue, options.jobs, options.persist_every, options.write_files))
+            self.worker_thread.daemon = True
         self.worker_thread.start()
 
-        # Set up a background monitor thread.
+        # Set up a background monitor thread. Until Sphinx has been
+        # initialized, the conventional project layout is assumed.
+        self.project_layout = ProjectLayout(os.path.join(self.base_path, 'docs'))
+        # The changes the monitor has reported, until they have been built;
+        # any left over when Galley quits are reported again next time.
+        self.outdated = Outdated()
+        self.building = {}
         self.stop_event = threading.Event()
-        self.monitor_thread = threading.Thread(target=file_monitor, args=(os.path.join(self.base_path, 'docs'), self.stop_event, self.results_queue))
+        self.monitor_thread = threading.Thread(
+            target=file_monitor,
+            args=(os.path.join(self.base_path, 'docs'), self.stop_event, self.results_queue),
+            kwargs={
+                'backend': options.monitor,
+                'fingerprint': options.fingerprint,
+                'quiet_period': options.quiet_period,
+                'max_latency': options.max_latency,
+                'snapshot': os.path.join(self.base_path, 'docs', '_build', 'galley.snapshot') if options.snapshot else None,
+                'layout': self.project_layout,
+                'outdated': self.outdated,
+            }
+        )
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
 
-        # Requeue for another update in 40ms (24*40ms == 1s - so this is
-        # as fast as we need to update to match human visual acuity)
-        self.root.after(40, self.handle_background_tasks)
-
 
     ######################################################
     # Internal GUI layout methods.
@@ -313,8 +425,7 @@ class MainWindow(object):
         it is.
         """
         # TEMP: Rework into HTML view
-        path, ext = os.path.splitext(filename)
-        compiled_filename = path.replace(os.path.join(self.base_path, 'docs'), os.path.join(self.base_path, 'docs', '_build', 'json')) + '.fjson'
+        compiled_filename = self._compiled_filename(filename)
 
         # Set the filename label for the current file
         self.current_file.set(self.filename_normalizer(filename))
@@ -322,7 +433,13 @@ class MainWindow(object):
         try:
             # Update the html view; this means changing the displayed file
             # if necessary, and updating the current line.
-            if filename != self.html.filename:
+            if filename in self.documents:
+                self.documents.move_to_end(filename)
+                self.html.show(compiled_filename, self.documents[filename])
+            elif not self.write_files:
+                # Nothing is read from disk; ask the worker for the document.
+                self.work_queue.put(BuildSpecific([filename]))
+            elif filename != self.html.filename:
                 self.html.filename = compiled_filename
 
             # self.html.anchor = anchor
@@ -350,6 +467,19 @@ class MainWindow(object):
         except IOError:
             tkMessageBox.showerror(message='%s has not been compiled to HTML' % self.filename_normalizer(filename))
 
+    def _compiled_filename(self, filename):
+        "Convert a source filename into the name of the file it is compiled into"
+        path, ext = os.path.splitext(filename)
+        return path.replace(os.path.join(self.base_path, 'docs'), os.path.join(self.base_path, 'docs', '_build', 'json')) + '.fjson'
+
+    def _remember_document(self, filename, body):
+        "Keep a rendered document in memory, dropping the least recently used if needed"
+        self.documents[filename] = body
+        self.documents.move_to_end(filename)
+        if self.write_files:
+            while len(self.documents) > self.DOCUMENT_CACHE_SIZE:
+                self.documents.popitem(last=False)
+
     def _show_warnings(self, filename):
         "Show the warnings output panel"
 
@@ -386,148 +516,203 @@ class MainWindow(object):
 
     def handle_background_tasks(self):
         "Background queue handler"
+        results = []
         try:
             while True:
                 result = self.results_queue.get(block=False)
 
-                ########################
-                # Output from the worker
-                ########################
-
-                if isinstance(result, Output):
-                    self.run_status.set(result.message.capitalize())
-
-                elif isinstance(result, WarningOutput):
-                    if result.filename:
-                        source_file = os.path.join(self.base_path, 'docs', result.filename)
-                        self.project_file_tree.item(source_file, tags=['file', 'warning'])
-
-                    # Archive the warning.
-                    self.warning_output.setdefault(result.filename, []).append((result.lineno, result.message))
-
-                elif isinstance(result, InitializationStart):
-                    # Handle the "Start of sphinx init" message
-                    self.progress.configure(mode='indeterminate', variable=None, maximum=None)
-                    self.rebuild_all_button.configure(state=DISABLED)
-                    self.rebuild_file_button.configure(state=DISABLED)
-                    self.reload_config_button.configure(state=DISABLED)
-                    self.progress.start()
-
-                elif isinstance(result, InitializationEnd):
-                    # Handle the "End of Sphinx init" message.
-                    # Stop the progress spinner, and activate the work buttons.
-                    self.run_status.set('Sphinx initialized.')
-                    self.progress.stop()
-
-                    self.rebuild_all_button.configure(state=ACTIVE)
-                    self.rebuild_file_button.configure(state=ACTIVE)
-                    self.reload_config_button.configure(state=ACTIVE)
-
-                    # We can now inspect the extension type from the sphinx config.
-                    self.source_extension = result.extension
-
-                    # Set the initial file
-                    self.project_file_tree.selection_set(os.path.join(self.base_path, 'docs', 'index' + self.source_extension))
-
-                elif isinstance(result, BuildStart):
-                    # Build start; set up the progress bar, set initial progress to 0
-                    self.progress_value.set(0)
-                    self.progress.configure(mode='determinate', maximum=100, variable=self.progress_value)
-
-                    # Disable all the buttons so no new commands can be issued
-                    self.rebuild_all_button.configure(state=DISABLED)
-                    self.rebuild_file_button.configure(state=DISABLED)
-                    self.reload_config_button.configure(state=DISABLED)
-
-                    if result.filenames is None:
-                        # Build is for all files. Clear the warnings, and
-                        # set all files as dirty.
-                        filenames = self.project_file_tree.tag_has('file')
-
-                        self.warning_output = {}
-                    else:
-                        # Build is for a selection of files. Clear the global warnings
-                        # and the file warnings, and set selected files as dirty.
-                        filenames = result.filenames
-
-                        self.warning_output[None] = []
-                        for f in filenames:
-                            self.warning_output[f] = []
-
-                    for f in filenames:
-                        self.project_file_tree.item(f, tags=['file', 'dirty'])
-
-                elif isinstance(result, Progress):
+                # The worker sends its output in batches.
+                if isinstance(result, Batch):
+                    results.extend(result.messages)
+                else:
+                    results.append(result)
+
+        except Empty:
+            # queue.get() raises an exception when the queue is empty.
+            # This means there is no more output to consume at this time.
+            pass
+
+        # Only the newest status and progress are shown, however much
+        # output has been waiting.
+        for result in collapse(results):
+            self.handle_result(result)
+
+    def handle_result(self, result):
+        "Handle a message from the worker or the monitor"
+        ########################
+        # Output from the worker
+        ########################
+
+        if isinstance(result, Output):
+            self.run_status.set(result.message.capitalize())
+
+        elif isinstance(result, WarningOutput):
+            # Warnings can come from files that aren't in the
+            # tree (e.g., the docstrings of a Python module).
+            if result.filename and self.project_file_tree.exists(result.filename):
+                self.project_file_tree.item(result.filename, tags=['file', 'warning'])
+
+            # Archive the warning.
+            self.warning_output.setdefault(result.filename, []).append((result.lineno, result.message))
+
+        elif isinstance(result, InitializationStart):
+            # Handle the "Start of sphinx init" message
+            self.progress.configure(mode='indeterminate', variable=None, maximum=None)
+            self.rebuild_all_button.configure(state=DISABLED)
+            self.rebuild_file_button.configure(state=DISABLED)
+            self.reload_config_button.configure(state=DISABLED)
+            self.progress.start()
+
+        elif isinstance(result, InitializationEnd):
+            # Handle the "End of Sphinx init" message.
+            # Stop the progress spinner, and activate the work buttons.
+            self.run_status.set('Sphinx initialized.')
+            self.progress.stop()
+
+            self.rebuild_all_button.configure(state=ACTIVE)
+            self.rebuild_file_button.configure(state=ACTIVE)
+            self.reload_config_button.configure(state=ACTIVE)
+
+            # We can now inspect the extension type from the sphinx config.
+            self.source_extension = result.extension
+
+            # ... and tell the monitor where the templates and static files are.
+            self.project_layout.configure(result.templates_path, result.static_path)
+
+            # Set the initial file. The configuration is reloaded whenever
+            # conf.py is saved; don't move away from the file being viewed.
+            if not self.project_file_tree.selection():
+                self.project_file_tree.selection_set(os.path.join(self.base_path, 'docs', 'index' + self.source_extension))
+
+        elif isinstance(result, BuildStart):
+            # Build start; set up the progress bar, set initial progress to 0
+            self.progress_value.set(0)
+            self.progress.configure(mode='determinate', maximum=100, variable=self.progress_value)
+
+            # Disable all the buttons so no new commands can be issued
+            self.rebuild_all_button.configure(state=DISABLED)
+            self.rebuild_file_button.configure(state=DISABLED)
+            self.reload_config_button.configure(state=DISABLED)
+
+            # The changes this build will include, once it is complete.
+            self.building = self.outdated.building(result.filenames)
+
+            if result.filenames is None:
+                # Build is for all files. Clear the warnings, and
+                # set all files as dirty.
+                filenames = self.project_file_tree.tag_has('file')
+
+                self.warning_output = {}
+                self.documents.clear()
+            else:
+                # Build is for a selection of files. Clear the global warnings
+                # and the file warnings, and set selected files as dirty.
+                filenames = result.filenames
+
+                self.warning_output[None] = []
+                for f in filenames:
+                    self.warning_output[f] = []
+                    self.documents.pop(f, None)
+
+            for f in filenames:
+                self.project_file_tree.item(f, tags=['file', 'dirty'])
+
+        elif isinstance(result, Progress):
+            try:
+                base, max_val = {
+                    # Progress messages that will be received from a build.
+                    # The returned values is a tuple, consisting of:
+                    #  * The overall progress value when this task is at 0%
+                    #  * The delta that will be added when the task is 100%
+                    'reading sources': (0, 45),
+                    'writing output': (45, 45),
+                    'finishing': (90, 10),
+                }[result.stage]
+
+                progress = int(base + max_val * result.progress / 100.0)
+                self.progress_value.set(progress)
+
+            except KeyError:
+                pass
+
+        elif isinstance(result, BuildEnd):
+            # Build complete; mark progress as 100%
+            self.progress_value.set(100)
+            self.outdated.built(self.building)
+            self.building = {}
+
+            # Disable all the buttons so no new commands can be issued
+            self.rebuild_all_button.configure(state=ACTIVE)
+            self.rebuild_file_button.configure(state=ACTIVE)
+            self.reload_config_button.configure(state=ACTIVE)
+
+            # The current file has usually been delivered already; if
+            # not, fall back to reading it from disk.
+            current_file = self.project_file_tree.selection()[0]
+            if result.filenames is None or current_file in result.filenames:
+                if current_file not in self.documents:
                     try:
-                        base, max_val = {
-                            # Progress messages that will be received from a build.
-                            # The returned values is a tuple, consisting of:
-                            #  * The overall progress value when this task is at 0%
-                            #  * The delta that will be added when the task is 100%
-                            'reading sources': (0, 30),
-                            'looking for now-outdated files': (30, 2),
-                            'pickling environment': (32, 2),
-                            'checking consistency': (34, 2),
-                            'preparing documents': (36, 2),
-                            'writing output': (38, 30),
-                            'writing additional files': (68, 2),
-                            'copying images': (70, 20),
-                            'copying downloadable files': (90, 2),
-                            'copying static files': (92, 2),
-                            'dumping search index': (94, 2),
-                            'dumping object inventory': (96, 2),
-                            'writing templatebuiltins.js': (98, 2),
-                        }[result.stage]
-
-                        progress = int(base + max_val * result.progress / 100.0)
-                        self.progress_value.set(progress)
-
-                        # If this is a 'writing output' update, we have a file generated
-                        # so update the markup of the tree
-                        if result.stage == 'writing output':
-                            source_file = os.path.join(self.base_path, 'docs', result.context + self.source_extension)
-                            if not self.project_file_tree.tag_has('warning', source_file):
-                                self.project_file_tree.item(source_file, tags=['file'])
-
-                    except KeyError:
+                        self.html.refresh()
+                    except IOError:
                         pass
+                self._show_warnings(current_file)
 
-                elif isinstance(result, BuildEnd):
-                    # Build complete; mark progress as 100%
-                    self.progress_value.set(100)
+        elif isinstance(result, DocumentReady):
+            self._remember_document(result.filename, result.body)
 
-                    # Disable all the buttons so no new commands can be issued
-                    self.rebuild_all_button.configure(state=ACTIVE)
-                    self.rebuild_file_button.configure(state=ACTIVE)
-                    self.reload_config_button.configure(state=ACTIVE)
+            # The file has been generated, so update the markup of the tree.
+            if self.project_file_tree.exists(result.filename):
+                if not self.project_file_tree.tag_has('warning', result.filename):
+                    self.project_file_tree.item(result.filename, tags=['file'])
 
-                    current_file = self.project_file_tree.selection()[0]
-                    if result.filenames is None or current_file in result.filenames:
-                        self.html.refresh()
-                        self._show_warnings(current_file)
+            # Show the new version of the current file straight away.
+            if result.filename in self.project_file_tree.selection():
+                self.html.show(self._compiled_filename(result.filename), result.body)
 
-                #########################
-                # Output from the monitor
-                #########################
+        elif isinstance(result, BuildCancelled):
+            # Newer edits superseded the build. The worker restarts
+            # it straight away, so leave the buttons disabled and the
+            # unbuilt files marked dirty; just reset the progress.
+            self.progress_value.set(0)
+            self.building = {}
 
-                elif isinstance(result, FileChange):
-                    # Make sure the new files are in the tree
-                    for f in result.new:
-                        dirname, filename = os.path.split(f)
-                        self.project_file_tree.insert_dirname(dirname)
-                        self.project_file_tree.insert_filename(dirname, filename)
+        elif isinstance(result, ModuleDependencies):
+            # Tell the monitor which Python modules to keep an eye on.
+            self.project_layout.watch_modules(result.modules)
 
-                    # Enqueue a build task for all the new and modified documents.
-                    self.work_queue.put(BuildSpecific(result.new + result.modified))
+        elif isinstance(result, FileDependencies):
+            # ... and which other files, such as included snippets.
+            self.project_layout.watch_dependencies(result.files)
 
-        except Empty:
-            # queue.get() raises an exception when the queue is empty.
-            # This means there is no more output to consume at this time.
-            pass
+        #########################
+        # Output from the monitor
+        #########################
+
+        elif isinstance(result, FileChange):
+            # Make sure the new files are in the tree
+            for f in result.new:
+                dirname, filename = os.path.split(f)
+                self.project_file_tree.insert_dirname(dirname)
+                self.project_file_tree.insert_filename(dirname, filename)
+
+            # Enqueue a build task for all the new and modified documents.
+            self.work_queue.put(BuildSpecific(result.new + result.modified))
 
-        # Requeue for another update in 40ms (24*40ms == 1s - so this is
-        # as fast as we need to update to match human visual acuity)
-        self.root.after(40, self.handle_background_tasks)
+        elif isinstance(result, ConfigChange):
+            # The worker will only rebuild what the new configuration requires.
+            self.work_queue.put(ReloadConfig())
+
+        elif isinstance(result, TemplateChange):
+            # Nothing needs to be re-read; the documents just need to be written again.
+            self.work_queue.put(RewriteAll())
+
+        elif isinstance(result, StaticChange):
+            self.work_queue.put(CopyStatic())
+
+        elif isinstance(result, (ModuleChange, DependencyChange)):
+            # Only the documents that depend on the files need to be rebuilt.
+            if result.documents:
+                self.work_queue.put(BuildSpecific(result.documents))
 
     ######################################################
     # TK Command handlers
@@ -542,6 +727,7 @@ class MainWindow(object):
         # Wait for the threads to die.
         self.worker_thread.join()
         self.monitor_thread.join()
+        self.results_queue.close()
 
         # Quit the main app.
         self.root.quit()
@@ -619,6 +805,9 @@ class MainWindow(object):
         if event.widget.selection():
             filename = event.widget.selection()[0]
 
+            # Ask the worker to build this document before any others.
+            self.work_queue.put(Focus(filename))
+
             if os.path.isfile(filename):
                 # Display the file in the html view
                 self.show_file(filename=filename)
@@ -7,7 +7,7 @@ from tkinter import *
 from xml.etree import ElementTree as et
 
 from tkreadonly import normalize_sequence
-from galley.monitor import project_visitor
+from galley.monitor import scan
 
 
 class WindowTooSmallException(Exception):
@@ -598,16 +598,28 @@ class SimpleHTMLView(Frame, object):
     def filename(self, value):
         "Set the file being displayed by the view"
         if self._filename != value:
-            # Store the new filename
-            self._filename = value
-
-            self.href = {}
-            self.element_id = {}
-
             with open(value) as htmlfile:
                 content = json.load(htmlfile)
-                self.document = et.fromstring('<body>%s</body>' % content['body'].encode('UTF-8'))
-                self.redraw()
+            self.show(value, content['body'])
+
+    def show(self, filename, body):
+        """Display a rendered body of HTML, without reading it from disk.
+
+        filename is the file the body would have been read from. If it is
+        the file currently being displayed, the scroll position is kept.
+        """
+        ypos = self.html.yview() if filename == self._filename else None
+
+        self._filename = filename
+
+        self.href = {}
+        self.element_id = {}
+
+        self.document = et.fromstring('<body>%s</body>' % body)
+        self.redraw()
+
+        if ypos is not None:
+            self.html.yview_moveto(ypos[0])
 
     def redraw(self, event=None):
         "Redraw the canvas. This reflows all content on the page."
@@ -674,7 +686,7 @@ class FileView(Treeview):
 
         # Populate the file view
         if self.root:
-            os.path.walk(self.root, project_visitor(self.insert_dirname, self.insert_filename), None)
+            scan(self.root, self.insert_dirname, self.insert_filename, None)
 
     def insert_dirname(self, dirname, data=None):
         "Ensure that a specific directory exists in the breakpoint tree"
@@ -1,8 +1,32 @@
 from collections import namedtuple
-import re
+from contextlib import contextmanager, nullcontext
+import logging
+import multiprocessing
 import os
+import pickle
+from queue import Empty
+import re
+import sys
+import threading
+import time
+
+from docutils import nodes
+from docutils.utils import get_source_line
+from sphinx import addnodes
+from sphinx.application import Sphinx, ENV_PICKLE_FILENAME
+from sphinx.environment import CONFIG_OK, CONFIG_CHANGED
+from sphinx.errors import SphinxError
+from sphinx.locale import __
+from sphinx.pycode import ModuleAnalyzer
+from sphinx.util import docname_join, logging as sphinx_logging
+from sphinx.util.build_phase import BuildPhase
+from sphinx.util.console import bold
+from sphinx.util.display import SkipProgressMessage, progress_message
+from sphinx.util.parallel import SerialTasks, parallel_available
+from sphinxcontrib.serializinghtml import JSONHTMLBuilder
 
-from sphinx.application import Sphinx
+
+logger = sphinx_logging.getLogger(__name__)
 
 
 ######################################################################
@@ -14,70 +38,91 @@ ReloadConfig = namedtuple('ReloadConfig', [])
 BuildAll = namedtuple('BuildAll', [])
 BuildSpecific = namedtuple('BuildSpecific', ['filenames'])
 
+# Write every document again, without re-reading any sources.
+RewriteAll = namedtuple('RewriteAll', [])
+# Copy the static files, without writing any documents.
+CopyStatic = namedtuple('CopyStatic', [])
+
 Quit = namedtuple('Quit', [])
 
+# A hint that the user is looking at a document; when it needs to be
+# built, it is built before any other documents.
+Focus = namedtuple('Focus', ['filename'])
+
 
 ######################################################################
 # Output message types
 ######################################################################
 
 Output = namedtuple('Output', ['message'])
-WarningOutput = namedtuple('Warning', ['filename', 'lineno', 'message'])
+WarningOutput = namedtuple('WarningOutput', ['filename', 'lineno', 'message'])
 Progress = namedtuple('Progress', ['stage', 'progress', 'context'])
 
 InitializationStart = namedtuple('InitializationStart', [])
-InitializationEnd = namedtuple('InitializationEnd', ['extension'])
+InitializationEnd = namedtuple('InitializationEnd', ['extension', 'templates_path', 'static_path'])
 
 BuildStart = namedtuple('BuildStart', ['filenames'])
 BuildEnd = namedtuple('BuildEnd', ['filenames'])
+# The build was abandoned part way through, because newer commands
+# superseded it; it will be restarted along with those commands.
+BuildCancelled = namedtuple('BuildCancelled', ['filenames'])
+
+# The Python modules that documents depend on, as a dictionary mapping the
+# filename of each module to the source files of the dependent documents.
+ModuleDependencies = namedtuple('ModuleDependencies', ['modules'])
+# The other files that documents depend on, but that aren't documents
+# (e.g., included snippets), mapped in the same way.
+FileDependencies = namedtuple('FileDependencies', ['files'])
+
+# A document has been written; body is the rendered HTML, and metadata is
+# a dictionary of the other parts of the page (title, toc, and so on).
+DocumentReady = namedtuple('DocumentReady', ['filename', 'body', 'metadata'])
+
+# A batch of the messages above, sent together to save on queue traffic.
+Batch = namedtuple('Batch', ['messages'])
 
 
 ######################################################################
 # Sphinx handler
 ######################################################################
 
+# A complete escape sequence: a control sequence (e.g., '\x1b[32;40m', which
+# sets the colours), or a two character escape.
+ANSI_ESCAPE_RE = re.compile(r'\x1b(?:\[[0-?]*[ -/]*[@-~]|[@-Z\\-_])')
+# The start of an escape sequence, cut off at the end of the data.
+PARTIAL_ANSI_ESCAPE_RE = re.compile(r'\x1b(?:\[[0-?]*[ -/]*)?\Z')
+LINE_BREAK_RE = re.compile(r'[\r\n]')
+
 class ANSIOutputHandler(object):
     "A File-like object that puts output onto a queue, stripping ANSI codes."
     def __init__(self, queue):
         self.queue = queue
         self.buffer = []
+        # The start of an escape sequence that will be completed by the next write.
+        self.partial = ''
 
     def write(self, data):
         "Write the given data to the buffer"
-        start = 0
-        end = 0
+        if self.partial:
+            data = self.partial + data
+            self.partial = ''
 
         # The data provided by Sphinx may contain ANSI escape sequences. Strip them out.
-        while end < len(data):
-            ch = data[end]
-            if ch == '\x1b':
-                # Insert any accumulated text with the current mode
-                self.buffer.append(data[start:end])
-
-                # Read the escape code
-                # mode = data[end + 1]
-                end = end + 2
-                params = []
-                while ord(data[end]) not in range(64, 127):
-                    param = []
-                    while ord(data[end]) not in range(64, 127) and data[end] != ';':
-                        param.append(data[end])
-                        end = end + 1
-                    params.append(int(''.join(param)))
-                    if data[end] == ';':
-                        end = end + 1
-                # command = data[end]
-
-                end = end + 1
-                start = end
-
-            elif ch == '\r' or ch == '\n':
-                self.buffer.append(data[start:end])
-                self.flush()
-                start = end + 1
-            end = end + 1
-
-        self.buffer.append(data[start:end])
+        if '\x1b' in data:
+            partial = PARTIAL_ANSI_ESCAPE_RE.search(data)
+            if partial:
+                self.partial = partial.group()
+                data = data[:partial.start()]
+            data = ANSI_ESCAPE_RE.sub('', data)
+
+        # Every line break flushes the buffer; whatever follows the last
+        # one is kept until the next.
+        lines = LINE_BREAK_RE.split(data)
+        for line in lines[:-1]:
+            self.buffer.append(line)
+            self.flush()
+        if lines[-1]:
+            self.buffer.append(lines[-1])
 
     def flush(self):
         "Flush the current buffer"
@@ -92,78 +137,1076 @@ class ANSIOutputHandler(object):
         """
         self.queue.put(Output(message=content))
 
-SIMPLE_PROGRESS_RE = re.compile(r'(.+)\.\.\.$')
-PERCENT_PROGRESS_RE = re.compile(r'([\w\s]+)\.\.\. \[([\s\d]{3})\%\] (.+)')
-
 class SphinxStatusHandler(ANSIOutputHandler):
-    "A Sphinx output handler for normal status update, stripping ANSI codes."
-    def __init__(self, *args, **kwargs):
-        super(SphinxStatusHandler, self).__init__(*args, **kwargs)
-        self.task = None
+    """A Sphinx output handler for normal status update, stripping ANSI codes.
 
+    The status is only shown to the user; progress and warnings are
+    reported by the Galley extension, not found in this output.
+    """
     def emit(self, content):
         content = content.strip()
         if content:
-            # Always output the status literally
             self.queue.put(Output(content))
 
-            # Also check for certain key content, and output special messages
-            if self.task:
-                # There is an outstanding simple task. If we've got output, it
-                # means we've completed that task.
-                self.queue.put(Progress(stage=self.task, progress=100, context=None))
-                self.task = None
+
+class NullOutput(object):
+    "A File-like object that discards everything written to it."
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+
+######################################################################
+# Output batching
+######################################################################
+
+def superseded_by(message):
+    """The kind of message that, when newer, supersedes the given message.
+
+    Only the newest status (and the newest progress of each stage) is
+    shown. Returns None for messages that must all be delivered.
+    """
+    if isinstance(message, Output):
+        return Output
+    elif isinstance(message, Progress):
+        return (Progress, message.stage)
+
+
+def collapse(messages):
+    """Drop the status and progress messages that newer ones supersede.
+
+    Warnings and delivered documents are never dropped, and don't affect
+    the status or progress, so superseded messages are dropped across
+    them. Any other message (e.g., the start of a build) is a barrier;
+    messages are never dropped across it.
+    """
+    collapsed = []
+    # The position in collapsed of the newest message of each kind.
+    newest = {}
+    for message in messages:
+        kind = superseded_by(message)
+        if kind is not None:
+            if kind in newest:
+                collapsed[newest[kind]] = None
+            newest[kind] = len(collapsed)
+        elif not isinstance(message, (WarningOutput, DocumentReady)):
+            newest = {}
+        collapsed.append(message)
+    return [message for message in collapsed if message is not None]
+
+
+class BatchingQueue(object):
+    """A queue-like wrapper that sends messages onto a queue in batches.
+
+    Messages are collected into a Batch, which is sent when it holds size
+    messages, or interval seconds after its first message was collected,
+    whichever comes first. Superseded messages are dropped from a batch.
+    """
+    def __init__(self, queue, size=100, interval=0.025):
+        self.queue = queue
+        self.size = size
+        self.interval = interval
+
+        # Messages can be sent by the timer, as well as by the thread
+        # putting them on the queue.
+        self.lock = threading.Lock()
+        self.messages = []
+        self.timer = None
+
+    def put(self, message):
+        with self.lock:
+            self.messages.append(message)
+            if len(self.messages) >= self.size:
+                self._send()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        "Send any messages that have been collected"
+        with self.lock:
+            self._send()
+
+    def _send(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.messages:
+            self.queue.put(Batch(collapse(self.messages)))
+            self.messages = []
+
+
+######################################################################
+# Builder
+######################################################################
+
+class GalleyBuilder(JSONHTMLBuilder):
+    """A JSON builder that also delivers each page to the view.
+
+    As each document is written, its body and metadata are attached to a
+    debug log record as a DocumentReady message; an OutputHandler then
+    puts it on the output queue. Writing the JSON files can be turned off.
+    """
+    name = 'galley'
+
+    # The parts of the page context, other than the body, that are delivered.
+    METADATA = ('title', 'meta', 'toc', 'display_toc', 'parents', 'prev', 'next', 'sourcename')
+
+    write_files = True
+
+    # The LiveSession that decides when the environment is saved; without
+    # one, it is saved after every build that updates it, as usual.
+    live = None
+
+    # If set, only these documents are read; any other documents that are
+    # out of date are left for a later build.
+    reading = None
+
+    def build(self, docnames, summary=None, method='update'):
+        # This is Builder.build(), except that the environment is saved by
+        # save_environment(). Sphinx would have opened (and truncated) the
+        # saved environment even when the save was to be skipped, and it
+        # offers no narrower hook. The copy follows Sphinx 9 (see setup.py);
+        # tests/worker/test_builder.py checks that it still matches.
+        if summary:
+            logger.info(bold(__('building [%s]: ')) + summary, self.name)
+
+        # while reading, collect all warnings from docutils
+        with (
+            nullcontext()
+            if self._app._exception_on_warning
+            else sphinx_logging.pending_warnings()
+        ):
+            updated_docnames = set(self.read())
+
+        doccount = len(updated_docnames)
+        logger.info(bold(__('looking for now-outdated files... ')), nonl=True)
+        updated_docnames.update(self.env.check_dependents(self._app, updated_docnames))
+        outdated = len(updated_docnames) - doccount
+        if outdated:
+            logger.info(__('%d found'), outdated)
+        else:
+            logger.info(__('none found'))
+
+        if updated_docnames:
+            self.save_environment()
+
+            # global actions
+            self.phase = BuildPhase.CONSISTENCY_CHECK
+            with progress_message(__('checking consistency')):
+                self.env.check_consistency()
+        else:
+            if method == 'update' and not docnames:
+                logger.info(bold(__('no targets are out of date.')))
+
+        self.phase = BuildPhase.RESOLVING
+
+        # filter "docnames" (list of outdated files) by the updated
+        # found_docs of the environment; this will remove docs that
+        # have since been removed
+        if docnames and docnames != ['__all__']:
+            docnames = set(docnames) & self.env.found_docs
+
+        # determine if we can write in parallel
+        if parallel_available and self._app.parallel > 1 and self.allow_parallel:
+            self.parallel_ok = self._app.is_parallel_allowed('write')
+        else:
+            self.parallel_ok = False
+
+        self.finish_tasks = SerialTasks()
+
+        # write all "normal" documents (or everything for some builders)
+        self.write(docnames, updated_docnames, method)
+
+        # finish (write static files etc.)
+        self.finish()
+
+        # wait for all tasks
+        self.finish_tasks.join()
+
+    def save_environment(self):
+        "Save the environment, which has just been updated"
+        if self.live is not None:
+            self.live.updated(self)
+        else:
+            with progress_message(__('pickling environment')):
+                dump_environment(self.env, self.doctreedir)
+
+    def write_documents(self, docnames):
+        stage_start('writing output', len(docnames))
+        super(GalleyBuilder, self).write_documents(docnames)
+
+    def handle_page(self, pagename, ctx, *args, **kwargs):
+        super(GalleyBuilder, self).handle_page(pagename, ctx, *args, **kwargs)
+        if pagename in self.env.all_docs:
+            logger.debug('[galley] delivering %s', pagename, extra={
+                'galley_document': DocumentReady(
+                    filename=os.path.normpath(str(self.env.doc2path(pagename))),
+                    body=ctx.get('body', ''),
+                    metadata=dict((key, ctx[key]) for key in self.METADATA if key in ctx),
+                )
+            })
+
+    def dump_context(self, context, filename):
+        if self.write_files:
+            super(GalleyBuilder, self).dump_context(context, filename)
+
+    def finish(self):
+        # Copying images and static files, and the search index; the
+        # stage is complete when the build is finished.
+        stage_start('finishing', 1)
+        super(GalleyBuilder, self).finish()
+
+    def handle_finish(self):
+        # The global context, search index and inventory are only useful
+        # alongside the JSON files.
+        if self.write_files:
+            super(GalleyBuilder, self).handle_finish()
+
+
+class GalleySphinx(Sphinx):
+    """A Sphinx application that can use the Galley builder.
+
+    output_queue is where build events and documents are delivered; if
+    write_files is False, documents are only delivered, and not written
+    to disk.
+    """
+    def __init__(self, *args, **kwargs):
+        self.output_queue = kwargs.pop('output_queue', None)
+        write_files = kwargs.pop('write_files', True)
+        super(GalleySphinx, self).__init__(*args, **kwargs)
+        if isinstance(self.builder, GalleyBuilder):
+            self.builder.write_files = write_files
+
+    def restore_logging(self):
+        """Send Sphinx's logging to this application again.
+
+        Needed when another application has been created, and has failed
+        to start; it has already taken over the logging.
+        """
+        sphinx_logging.setup(self, self._status, self._warning, verbosity=self.verbosity)
+        add_output_handler(self)
+
+    def preload_builder(self, name):
+        # The project's own extensions have been loaded; the Galley
+        # extension goes after them, so it sees their warnings.
+        self.setup_extension(__name__)
+        if name == GalleyBuilder.name:
+            self.add_builder(GalleyBuilder, override=True)
+        super(GalleySphinx, self).preload_builder(name)
+
+
+######################################################################
+# Galley extension
+######################################################################
+
+# Events are attached to debug log records, rather than put straight on
+# the output queue. Sphinx passes the log records of parallel reader and
+# writer processes back to the main process, so every event arrives
+# there, where an OutputHandler turns them into output messages.
+
+def stage_start(stage, total):
+    "Report the start of a build stage that will process total items"
+    logger.debug('[galley] %s: %d items', stage, total, extra={'galley_stage': (stage, total)})
+
+
+def stage_step(stage, context):
+    "Report that an item (described by context) of a build stage has been processed"
+    logger.debug('[galley] %s: %s', stage, context, extra={'galley_step': (stage, context)})
+
+
+def on_env_before_read_docs(app, env, docnames):
+    reading = getattr(app.builder, 'reading', None)
+    if reading is not None:
+        docnames[:] = [docname for docname in docnames if docname in reading]
+    stage_start('reading sources', len(docnames))
+
+
+def on_source_read(app, docname, source):
+    stage_step('reading sources', docname)
+
+
+def on_doctree_resolved(app, doctree, docname):
+    # Documents are resolved as they are written (or, when writing in
+    # parallel, as they are handed to the writer processes).
+    stage_step('writing output', docname)
+
+
+def on_build_finished(app, exception):
+    if exception is None:
+        stage_step('finishing', None)
+
+
+def warning_location(app, location):
+    """The source file and line number of the location of a warning.
+
+    The location is whatever was given to Sphinx's logger: a (docname,
+    lineno) tuple, a node, a docname, or a 'source:line' string (which is
+    also how the location of a node arrives from another process).
+    """
+    filename = lineno = None
+    if isinstance(location, tuple):
+        docname, lineno = location
+        if docname:
+            filename = app.env.doc2path(docname)
+    elif isinstance(location, nodes.Node):
+        filename, lineno = get_source_line(location)
+    elif location and ':' in location:
+        # The source may contain colons of its own (a drive letter, or
+        # 'module.py:docstring of ...'), but the line number can't.
+        filename, lineno = location.rsplit(':', 1)
+        if filename == '<unknown>':
+            filename = None
+    elif location:
+        filename = app.env.doc2path(location)
+
+    if filename:
+        filename = os.path.normpath(str(filename))
+    try:
+        lineno = int(lineno) if lineno else None
+    except ValueError:
+        lineno = None
+    return filename, lineno
+
+
+class OutputHandler(logging.Handler):
+    """A logging handler that puts Galley's output messages on a queue.
+
+    Stage and step events become Progress messages, documents are
+    delivered as they are, and warnings become WarningOutput messages.
+    """
+    def __init__(self, app, output_queue):
+        super(OutputHandler, self).__init__(logging.DEBUG)
+        self.app = app
+        self.output_queue = output_queue
+        self.once = sphinx_logging.OnceFilter()
+
+        # The current stage; how many items it has, and how many are done.
+        self.stage = None
+        self.total = 0
+        self.done = 0
+
+    def emit(self, record):
+        if record.levelno >= logging.WARNING:
+            self.warning(record)
+
+        elif hasattr(record, 'galley_stage'):
+            self.stage, self.total = record.galley_stage
+            self.done = 0
+            self.progress(None)
+
+        elif hasattr(record, 'galley_step'):
+            stage, context = record.galley_step
+            if stage == self.stage and self.done < self.total:
+                self.done += 1
+                self.progress(context)
+
+        elif hasattr(record, 'galley_document'):
+            self.output_queue.put(record.galley_document)
+
+    def progress(self, context):
+        percent = 100 * self.done // self.total if self.total else 100
+        self.output_queue.put(Progress(stage=self.stage, progress=percent, context=context))
+
+    def warning(self, record):
+        # While Sphinx reads and writes documents, it holds warnings back,
+        # and handles them again afterwards; this handler sees each record
+        # both times, but only reports it once.
+        if getattr(record, 'galley_reported', False):
+            return
+        record.galley_reported = True
+        try:
+            suppress_warnings = self.app.config.suppress_warnings
+        except AttributeError:
+            # The configuration hasn't been read yet.
+            suppress_warnings = ()
+        if sphinx_logging.is_suppressed_warning(
+            getattr(record, 'type', ''), getattr(record, 'subtype', ''), suppress_warnings
+        ):
+            return
+        if not self.once.filter(record):
+            return
+
+        filename, lineno = warning_location(self.app, getattr(record, 'location', None))
+        self.output_queue.put(WarningOutput(
+            filename=filename,
+            lineno=lineno,
+            message=logging.LogRecord.getMessage(record),
+        ))
+
+
+def add_output_handler(app):
+    "Put the output of the application on its output queue, if it has one"
+    output_queue = getattr(app, 'output_queue', None)
+    if output_queue is not None:
+        # Sphinx replaces the handlers on its logger whenever an
+        # application is created, so this only lasts as long as this one.
+        # It goes first, to see each record before Sphinx's own handlers
+        # rewrite its location.
+        logging.getLogger(sphinx_logging.NAMESPACE).handlers.insert(0, OutputHandler(app, output_queue))
+
+
+def setup(app):
+    "Set up the Galley extension"
+    app.connect('env-before-read-docs', on_env_before_read_docs)
+    app.connect('source-read', on_source_read)
+    app.connect('doctree-resolved', on_doctree_resolved)
+    app.connect('build-finished', on_build_finished)
+
+    add_output_handler(app)
+
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
+
+
+######################################################################
+# Build actions
+######################################################################
+
+def initialization_end(sphinx):
+    "Construct the message describing a newly initialized Sphinx instance"
+    # Depending on the version of Sphinx, source_suffix is a string, a list
+    # of suffixes, or a dictionary mapping suffixes to file types.
+    extension = sphinx.config.source_suffix
+    if not isinstance(extension, str):
+        extension = list(extension)[0]
+
+    return InitializationEnd(
+        extension=extension,
+        templates_path=sphinx.config.templates_path,
+        static_path=getattr(sphinx.config, 'html_static_path', []),
+    )
+
+
+def config_error(confdir, error):
+    "Construct the message describing a configuration that Sphinx couldn't load"
+    # A syntax error in conf.py knows where it is.
+    cause = getattr(error, '__cause__', None)
+    return WarningOutput(
+        filename=os.path.normpath(os.path.join(confdir, 'conf.py')),
+        lineno=cause.lineno if isinstance(cause, SyntaxError) else None,
+        message=str(error).strip(),
+    )
+
+
+def config_changes(old, new):
+    """Compare two Sphinx configurations.
+
+    Returns the set of rebuild categories (e.g., 'env' or 'html') of the
+    config values that differ. A change to the list of extensions is
+    treated as a change to the environment.
+    """
+    changed = set()
+    if old.extensions != new.extensions:
+        changed.add('env')
+    for name, value, rebuild in old:
+        if name not in new or new[name] != value:
+            changed.add(rebuild)
+    return changed
+
+
+def changed_values(old, new, category):
+    "The names of the config values in a rebuild category that differ between two configurations"
+    return set(
+        name
+        for name, value, rebuild in old
+        if rebuild == category and (name not in new or new[name] != value)
+    )
+
+
+# Config values that affect reading, but only of the documents that use
+# them; each is mapped to the text that the source of such a document
+# will contain. A change to any other value that affects reading means
+# that every document must be read again.
+SUBSTITUTION_VALUES = {
+    'version': '|version|',
+    'release': '|release|',
+    'today': '|today|',
+    'today_fmt': '|today|',
+}
+AUTODOC_PREFIXES = ('autodoc_', 'autoclass_', 'napoleon_')
+
+
+def documents_using(sphinx, text):
+    "Find the documents whose source, or any file they include, contains the text"
+    env = sphinx.env
+    docnames = set()
+    for docname in env.found_docs:
+        filenames = [str(env.doc2path(docname))] + [
+            os.path.join(str(sphinx.srcdir), str(dependency))
+            for dependency in env.dependencies.get(docname, ())
+            if not str(dependency).endswith('.py')
+        ]
+        for filename in filenames:
+            try:
+                with open(filename, encoding=sphinx.config.source_encoding, errors='replace') as f:
+                    if text in f.read():
+                        docnames.add(docname)
+                        break
+            except OSError:
+                pass
+    return docnames
+
+
+def affected_documents(sphinx, names):
+    """Find the documents to read again after the named config values changed.
+
+    Returns None if every document may be affected.
+    """
+    docnames = set()
+    for name in names:
+        if name in SUBSTITUTION_VALUES:
+            docnames.update(documents_using(sphinx, SUBSTITUTION_VALUES[name]))
+        elif name.startswith(AUTODOC_PREFIXES) and name != 'autodoc_mock_imports':
+            # Every autodoc directive starts the same way.
+            docnames.update(documents_using(sphinx, '.. auto'))
+        else:
+            return None
+    return docnames
+
+
+def reread(sphinx, docnames):
+    """Read only the given documents again in the next build.
+
+    Sphinx reads every document again when a config value that affects
+    reading has changed; this overrides that decision.
+    """
+    env = sphinx.env
+    env.config_status = CONFIG_OK
+    env.config_status_extra = ''
+
+    # The documents are forgotten once they have all been read; if the
+    # build is cancelled before then, the next build reads them again.
+    pending = set(docnames)
+
+    def outdated(app, env, added, changed, removed):
+        return sorted(pending)
+
+    def updated(app, env):
+        pending.clear()
+
+    sphinx.connect('env-get-outdated', outdated)
+    sphinx.connect('env-updated', updated)
+
+
+def build(sphinx, filenames=None, defer_others=False):
+    """Build every document, or just the given source files, as sphinx-build would.
+
+    Unlike Sphinx.build(), a build that fails (or is cancelled) doesn't
+    throw away the saved environment, and no summary is logged.
+
+    If defer_others is True, only the given source files are read; other
+    documents that are out of date stay that way until a later build.
+    """
+    builder = sphinx.builder
+    # After a change of configuration, every document must be read before
+    # any is written.
+    if defer_others and filenames is not None and sphinx.env.config_status == CONFIG_OK:
+        builder.reading = {sphinx.env.path2doc(filename) for filename in filenames}
+    try:
+        if filenames is None:
+            builder.build_all()
+        else:
+            builder.build_specific(filenames)
+    except Exception as err:
+        sphinx.events.emit('build-finished', err)
+        raise
+    finally:
+        builder.reading = None
+    sphinx.events.emit('build-finished', None)
+
+
+def rewrite_all(sphinx):
+    "Write every document again, using the doctrees that have already been read"
+    builder = sphinx.builder
+    builder.parallel_ok = (
+        parallel_available and sphinx.parallel > 1 and builder.allow_parallel
+        and sphinx.is_parallel_allowed('write')
+    )
+    builder.finish_tasks = SerialTasks()
+    builder.write(None, [], 'all')
+    builder.finish()
+    builder.finish_tasks.join()
+    sphinx.events.emit('build-finished', None)
+
+
+def copy_static(sphinx):
+    "Copy the static files to the output directory"
+    builder = sphinx.builder
+    if not hasattr(builder, 'globalcontext'):
+        # Nothing has been written yet, so the template context that is
+        # used to render static templates hasn't been prepared.
+        builder.prepare_writing(set())
+    builder.copy_static_files()
+
+
+def module_dependencies(sphinx):
+    """Find the Python modules that documents depend on.
+
+    autodoc records the source file of every module it documents as a
+    dependency of the document. Returns a dictionary mapping the filename
+    of each module to a sorted list of the dependent documents' source files.
+    """
+    env = sphinx.env
+    modules = {}
+    for docname, dependencies in env.dependencies.items():
+        for dependency in dependencies:
+            # Dependencies are either absolute, or relative to the source directory.
+            filename = os.path.normpath(os.path.join(str(sphinx.srcdir), str(dependency)))
+            if filename.endswith('.py'):
+                modules.setdefault(filename, set()).add(str(env.doc2path(docname)))
+    return dict(
+        (filename, sorted(documents))
+        for filename, documents in modules.items()
+    )
+
+
+class ModuleTracker(object):
+    """Tracks the Python modules that documents depend on.
+
+    autodoc imports the modules it documents, and imported modules are
+    cached; a module that has changed since it was imported must be
+    forgotten before the documents that depend on it are read again.
+    """
+    def __init__(self):
+        self.modules = {}
+        # The modification time of each module when it was last imported.
+        self.mtimes = {}
+
+    def update(self, sphinx):
+        """Record the module dependencies of the most recent build.
+
+        Returns True if the dependencies have changed.
+        """
+        modules = module_dependencies(sphinx)
+        for filename in modules:
+            if filename not in self.mtimes:
+                try:
+                    self.mtimes[filename] = os.stat(filename).st_mtime
+                except OSError:
+                    pass
+
+        if modules == self.modules:
+            return False
+        self.modules = modules
+        return True
+
+    def unload_stale(self):
+        "Forget any modules that have been modified since they were imported"
+        stale = set()
+        for filename, mtime in self.mtimes.items():
+            try:
+                current_mtime = os.stat(filename).st_mtime
+            except OSError:
+                continue
+            if current_mtime > mtime:
+                stale.add(filename)
+                self.mtimes[filename] = current_mtime
+
+        if stale:
+            for name, module in list(sys.modules.items()):
+                filename = getattr(module, '__file__', None)
+                if filename and os.path.normpath(filename) in stale:
+                    del sys.modules[name]
+                    ModuleAnalyzer.cache.pop(('module', name), None)
+            for filename in stale:
+                ModuleAnalyzer.cache.pop(('file', filename), None)
+
+
+######################################################################
+# Document dependencies
+######################################################################
+
+class DependencyIndex(object):
+    """A reverse index of the dependencies between documents.
+
+    Maps the source file of each document (or any other file that a
+    document depends on) to the source files of the documents that must
+    be written again when it changes: documents that include it, whose
+    toctree lists it, or that cross-reference something defined in it.
+
+    The files that documents depend on that aren't documents (or Python
+    modules, which are tracked separately) are also kept; the monitor
+    doesn't find them by itself, so it must be told to watch them.
+    """
+    def __init__(self):
+        self.dependents = {}
+        self.files = {}
+
+    def connect(self, sphinx):
+        "Record the cross-references in each document that the Sphinx instance reads"
+        sphinx.connect('doctree-read', self.doctree_read)
+        sphinx.connect('env-purge-doc', self.purge_doc)
+        sphinx.connect('env-merge-info', self.merge_info)
+
+    def doctree_read(self, app, doctree):
+        # The targets are stored in the environment, so they are saved
+        # (and restored) along with everything else Sphinx knows.
+        env = app.env
+        targets = set()
+        for node in doctree.findall(addnodes.pending_xref):
+            if node.get('reftype') == 'doc':
+                targets.add(docname_join(env.docname, node['reftarget']))
             else:
-                # Check for simple progress: 'doing stuff...'
-                progress_match = SIMPLE_PROGRESS_RE.match(content)
-                if progress_match:
-                    self.task = progress_match.group(1)
-                else:
-                    # Check for percent progress: 'doing stuff...'
-                    progress_match = PERCENT_PROGRESS_RE.match(content)
-                    if progress_match:
-                        self.queue.put(
-                            Progress(
-                                stage=progress_match.group(1),
-                                progress=int(progress_match.group(2)),
-                                context=progress_match.group(3)
-                            )
-                        )
+                targets.add(node['reftarget'])
+        if not hasattr(env, 'galley_references'):
+            env.galley_references = {}
+        env.galley_references[env.docname] = targets
+
+    def purge_doc(self, app, env, docname):
+        getattr(env, 'galley_references', {}).pop(docname, None)
 
+    def merge_info(self, app, env, docnames, other):
+        if not hasattr(env, 'galley_references'):
+            env.galley_references = {}
+        references = getattr(other, 'galley_references', {})
+        for docname in docnames:
+            if docname in references:
+                env.galley_references[docname] = references[docname]
 
-class SphinxWarningHandler(ANSIOutputHandler):
-    """A Sphinx output handler for, stripping ANSI codes..
+    def update(self, sphinx):
+        """Rebuild the index from the environment of the most recent build
+
+        Returns True if the files that aren't documents have changed.
+        """
+        env = sphinx.env
+        dependents = {}
+        files = {}
 
-    Parses warning content to extract context.
+        def add(filename, docname):
+            document = os.path.normpath(str(env.doc2path(docname)))
+            if docname in env.all_docs and filename != document:
+                dependents.setdefault(filename, set()).add(document)
+
+        # Files that are included (or otherwise read) by a document.
+        for docname, dependencies in env.dependencies.items():
+            for dependency in dependencies:
+                filename = os.path.normpath(os.path.join(str(sphinx.srcdir), str(dependency)))
+                add(filename, docname)
+                if not filename.endswith('.py') and env.path2doc(filename) is None:
+                    files.setdefault(filename, set()).add(str(env.doc2path(docname)))
+        for docname, included in env.included.items():
+            for other in included:
+                add(os.path.normpath(str(env.doc2path(other))), docname)
+
+        # Documents whose toctree shows the title of another document.
+        for docname, children in env.toctree_includes.items():
+            for child in children:
+                add(os.path.normpath(str(env.doc2path(child))), docname)
+
+        # Documents that cross-reference an object, label or document.
+        # Python objects may be referenced relative to the current module,
+        # so they are also indexed under their unqualified name.
+        defined = {}
+        for domain in env.domains.values():
+            for name, _, _, docname, _, _ in domain.get_objects():
+                defined.setdefault(name, set()).add(docname)
+                if '.' in name:
+                    defined.setdefault(name.rsplit('.', 1)[1], set()).add(docname)
+        for docname, targets in getattr(env, 'galley_references', {}).items():
+            for target in targets:
+                for other in defined.get(target, ()):
+                    add(os.path.normpath(str(env.doc2path(other))), docname)
+
+        self.dependents = dependents
+
+        files = dict((filename, sorted(documents)) for filename, documents in files.items())
+        if files == self.files:
+            return False
+        self.files = files
+        return True
+
+    def expand(self, filenames):
+        "Add the documents that depend on any of the given files"
+        # A dictionary is used as an insertion-ordered set.
+        expanded = dict((filename, True) for filename in filenames)
+        for filename in filenames:
+            for dependent in sorted(self.dependents.get(filename, ())):
+                expanded[dependent] = True
+        return list(expanded)
+
+
+######################################################################
+# Live sessions
+######################################################################
+
+def dump_environment(env, doctreedir):
+    """Save the build environment in the doctree directory.
+
+    The environment is written to a temporary file, which then replaces
+    the saved environment, so that is never left half written.
     """
-    def emit(self, content):
-        content = content.strip()
-        if content:
-            if content.startswith('WARNING: '):
-                self.queue.put(WarningOutput(filename=None, lineno=None, message=content[9:]))
+    filename = os.path.join(str(doctreedir), ENV_PICKLE_FILENAME)
+    with open(filename + '.tmp', 'wb') as f:
+        pickle.dump(env, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(filename + '.tmp', filename)
+
+
+class LiveSession(object):
+    """Keeps the build environment in memory between builds.
+
+    After every build that reads documents, Sphinx saves the entire build
+    environment to disk, even though the worker keeps it in memory. While
+    deferring() is in effect, the Galley builder leaves that to the
+    session; the environment is saved when the worker is idle, before the
+    configuration is reloaded, on the way out, and after every `interval`
+    builds. In between, the environment saved earlier is left as it is;
+    it is still a valid starting point, because Sphinx checks which
+    documents have changed since it was saved.
+    """
+    # Seconds without any commands before the worker is idle.
+    idle_timeout = 5.0
+
+    def __init__(self, interval=10):
+        self.interval = interval
+        # The number of builds since the environment was persisted.
+        self.unsaved = 0
+        # How long it took to persist the environment, the last time.
+        self.cost = None
+        # The total time saved by not persisting the environment.
+        self.saved = 0.0
+
+    @contextmanager
+    def deferring(self, sphinx):
+        "Leave saving the environment to this session while the Sphinx instance builds"
+        builder = sphinx.builder
+        builder.live = self
+        try:
+            yield
+        finally:
+            builder.live = None
+
+    def updated(self, builder):
+        "Save the environment that the builder has updated, or only count the build"
+        self.unsaved += 1
+        with progress_message('pickling environment'):
+            # The first save is done for real, to find out how long it takes.
+            if self.cost is None or self.unsaved >= self.interval:
+                self._save(builder.env, builder.doctreedir)
             else:
-                parts = content.split(':')
-                self.queue.put(
-                    WarningOutput(
-                        filename=parts[0],
-                        lineno=int(parts[1]) if parts[1] else None,
-                        message=':'.join(parts[3:]).strip())
-                    )
+                self.saved += self.cost
+                raise SkipProgressMessage(
+                    'environment kept in memory; saved %.2fs (%.2fs this session)',
+                    self.cost, self.saved
+                )
+
+    def _save(self, env, doctreedir):
+        start = time.time()
+        dump_environment(env, doctreedir)
+        self.cost = time.time() - start
+        self.unsaved = 0
+
+    def persist(self, sphinx):
+        "Save the environment of the Sphinx instance, if it has changed"
+        if self.unsaved:
+            self._save(sphinx.env, sphinx.doctreedir)
+
+
+######################################################################
+# Command merging
+######################################################################
+
+def drain(work_queue, block=True, timeout=None):
+    """Take every command that is waiting.
+
+    If block is True, wait for a command if none are waiting; if a timeout
+    is given, wait for at most that many seconds.
+    """
+    commands = []
+    if block:
+        try:
+            commands.append(work_queue.get(block=True, timeout=timeout))
+        except Empty:
+            return commands
+    while True:
+        try:
+            commands.append(work_queue.get(block=False))
+        except Empty:
+            return commands
+
+
+def merge_commands(commands, focus=None):
+    """Merge a batch of pending commands into the smallest equivalent batch.
+
+    The configuration is reloaded (once) before anything is built. Builds
+    are merged into a single build that covers all of them:
+
+    * BuildAll absorbs every other build;
+    * a RewriteAll combined with a BuildSpecific is a BuildAll (the changed
+      documents are read, and everything is written);
+    * BuildSpecific commands are merged into one, without duplicates; if
+      the focus document is one of several being built, it is split out
+      into a build of its own that is done first (and reads nothing else);
+    * every build copies the static files, so CopyStatic is only needed
+      on its own.
+
+    If Quit is pending, nothing else is done.
+    """
+    quit = reload_config = build_all = rewrite_all = copy_static = False
+    # A dictionary is used as an insertion-ordered set.
+    filenames = {}
+    for cmd in commands:
+        if isinstance(cmd, Quit):
+            quit = True
+        elif isinstance(cmd, ReloadConfig):
+            reload_config = True
+        elif isinstance(cmd, BuildAll):
+            build_all = True
+        elif isinstance(cmd, RewriteAll):
+            rewrite_all = True
+        elif isinstance(cmd, BuildSpecific):
+            for filename in cmd.filenames:
+                filenames[filename] = True
+        elif isinstance(cmd, CopyStatic):
+            copy_static = True
+
+    if quit:
+        return [Quit()]
+
+    merged = []
+    if reload_config:
+        merged.append(ReloadConfig())
+    if build_all or (rewrite_all and filenames):
+        merged.append(BuildAll())
+    elif rewrite_all:
+        merged.append(RewriteAll())
+    elif filenames:
+        if focus in filenames and len(filenames) > 1:
+            del filenames[focus]
+            merged.append(BuildSpecific([focus]))
+        merged.append(BuildSpecific(list(filenames)))
+    elif copy_static:
+        merged.append(CopyStatic())
+    return merged
+
+
+######################################################################
+# Build cancellation
+######################################################################
+
+class Cancelled(SphinxError):
+    "Raised at a document boundary to abandon a build that has been superseded"
+    category = 'Build cancelled'
+
+
+class Preemption(object):
+    """Watches for commands that arrive while a build is running.
+
+    Sphinx emits events as it reads and writes each document; at each of
+    these document boundaries, any commands waiting on the work queue are
+    set aside. If one of them supersedes the running build, the build is
+    cancelled by raising Cancelled. A build is superseded by a rebuild of
+    any of the documents being built, a full rebuild, a change of
+    configuration, or a request to quit. A rebuild of the focus document
+    also supersedes a build of other documents, so that the document
+    being viewed doesn't wait for a background build.
+
+    A build of all documents isn't superseded by a rebuild of some of
+    them. Restarting it would write every document again; if edits keep
+    arriving, it would never finish. The rebuild is done once the full
+    build is complete instead.
+    """
+    def __init__(self, work_queue):
+        self.work_queue = work_queue
+        # Commands that arrived during a build.
+        self.pending = []
+        # The documents being built; None if all documents are being
+        # built, or False if nothing is being built.
+        self.filenames = False
+        # The document that is being viewed.
+        self.focus = None
+        # When Sphinx works in parallel, events are also emitted in worker
+        # processes; the work queue must only be read by this process.
+        self.pid = os.getpid()
+
+    def connect(self, sphinx):
+        "Check for superseding commands at each document boundary of the Sphinx instance"
+        sphinx.connect('env-before-read-docs', self.check)
+        sphinx.connect('source-read', self.check)
+        sphinx.connect('doctree-resolved', self.check)
 
+    @contextmanager
+    def running(self, filenames):
+        "Allow a build of the given documents (or all documents, if None) to be cancelled"
+        self.filenames = None if filenames is None else set(filenames)
+        try:
+            yield
+        finally:
+            self.filenames = False
+
+    def take(self, timeout=None):
+        """Take the commands that were set aside, and any others that are waiting.
+
+        If there are none, wait (for at most timeout seconds) for a command.
+        """
+        commands = self.pending + drain(self.work_queue, block=not self.pending, timeout=timeout)
+        self.pending = []
+        self.refocus(commands)
+        return commands
+
+    def refocus(self, commands):
+        "Track the most recent focus hint in the commands"
+        for cmd in commands:
+            if isinstance(cmd, Focus):
+                self.focus = cmd.filename
+
+    def supersedes(self, cmd):
+        "Does the command make the running build redundant?"
+        if isinstance(cmd, (Quit, ReloadConfig, BuildAll)):
+            return True
+        if isinstance(cmd, BuildSpecific):
+            if self.filenames is None:
+                return False
+            return (
+                not self.filenames.isdisjoint(cmd.filenames)
+                or (self.focus in cmd.filenames and self.focus not in self.filenames)
+            )
+        return False
+
+    def check(self, *args):
+        "A Sphinx event handler that cancels the running build if it has been superseded"
+        if self.filenames is False or os.getpid() != self.pid:
+            return
+        commands = drain(self.work_queue, block=False)
+        self.pending.extend(commands)
+        self.refocus(commands)
+        if any(self.supersedes(cmd) for cmd in commands):
+            raise Cancelled('The build was superseded')
+
+
+def sphinx_worker(base_path, work_queue, output_queue, parallel=0, persist_every=10, write_files=True):
+    """A background worker thread performing Sphinx compilations
+
+    parallel is the number of processes Sphinx may use to read and write
+    documents; 0 (or 1) means that documents are processed serially.
+
+    persist_every is the number of builds after which the build
+    environment is saved to disk, even if the worker hasn't been idle;
+    1 saves it after every build, as sphinx-build does.
+
+    Each document is delivered to output_queue as it is written; if
+    write_files is False, documents aren't also written to disk.
+
+    Output messages are sent to output_queue in batches.
+    """
+    output_queue = BatchingQueue(output_queue)
 
-def sphinx_worker(base_path, work_queue, output_queue):
-    "A background worker thread performing Sphinx compilations"
     # Set up the Sphinx instance
     srcdir = base_path
     confdir = srcdir
     outdir = os.path.join(srcdir, '_build', 'json')
     freshenv = False
     warningiserror = False
-    buildername = 'json'
-    # verbosity = 0
-    # parallel = 0
+    buildername = 'galley'
+    verbosity = 0
     status = SphinxStatusHandler(output_queue)
-    warning = SphinxWarningHandler(output_queue)
+    # Warnings are reported by the Galley extension.
+    warning = NullOutput()
     # error = sys.stderr
     # warnfile = None
     confoverrides = {}
@@ -172,37 +1215,230 @@ def sphinx_worker(base_path, work_queue, output_queue):
 
     output_queue.put(InitializationStart())
 
-    sphinx = Sphinx(srcdir, confdir, outdir, doctreedir, buildername,
+    sphinx = GalleySphinx(srcdir, confdir, outdir, doctreedir, buildername,
                          confoverrides, status, warning, freshenv,
-                         warningiserror, tags)
+                         warningiserror, tags, verbosity, parallel,
+                         output_queue=output_queue, write_files=write_files)
+
+    output_queue.put(initialization_end(sphinx))
 
-    output_queue.put(InitializationEnd(extension=sphinx.config.source_suffix))
+    # Builds can be cancelled when newer commands supersede them.
+    preemption = Preemption(work_queue)
+    preemption.connect(sphinx)
+
+    # The saved environment already knows which modules documents depend on,
+    # and how the documents depend on each other.
+    modules = ModuleTracker()
+    if modules.update(sphinx):
+        output_queue.put(ModuleDependencies(modules.modules))
+    dependencies = DependencyIndex()
+    dependencies.connect(sphinx)
+    if dependencies.update(sphinx):
+        output_queue.put(FileDependencies(dependencies.files))
+
+    # The environment is kept in memory, and only saved now and then.
+    live = LiveSession(persist_every)
 
     quit = False
     while not quit:
-        # Get the next command off the work queue
-        cmd = work_queue.get(block=True)
+        # Don't leave any output waiting while the worker waits.
+        output_queue.flush()
 
-        if isinstance(cmd, Quit):
-            quit = True
+        # Take every command that is waiting. If the environment hasn't
+        # been saved, only wait so long for another command; a quiet
+        # moment is a good time to save it.
+        commands = preemption.take(timeout=live.idle_timeout if live.unsaved else None)
+        if not commands:
+            live.persist(sphinx)
+            continue
 
-        elif isinstance(cmd, ReloadConfig):
-            output_queue.put(InitializationStart())
-            freshenv = True
-            sphinx = Sphinx(srcdir, confdir, outdir, doctreedir, buildername,
-                             confoverrides, status, warning, freshenv,
-                             warningiserror, tags)
-            output_queue.put(InitializationEnd(extension=sphinx.config.source_suffix))
+        # Merge the commands into the smallest set of builds that will
+        # satisfy all of them; the document being viewed is built first.
+        built_all = False
+        batch = merge_commands(commands, focus=preemption.focus)
+        for index, cmd in enumerate(batch):
+            # Make sure any documents that are read will see the current
+            # version of the modules they document.
+            modules.unload_stale()
 
-        elif isinstance(cmd, BuildAll):
-            output_queue.put(BuildStart(filenames=None))
-            sphinx.builder.build_all()
-            output_queue.put(BuildEnd(filenames=None))
+            try:
+                if isinstance(cmd, Quit):
+                    live.persist(sphinx)
+                    quit = True
 
-        elif isinstance(cmd, BuildSpecific):
-            output_queue.put(BuildStart(filenames=cmd.filenames))
-            sphinx.builder.build_specific(cmd.filenames)
-            output_queue.put(BuildEnd(filenames=cmd.filenames))
+                elif isinstance(cmd, ReloadConfig):
+                    output_queue.put(InitializationStart())
+                    # The new Sphinx instance reuses the saved environment, so
+                    # make sure it is up to date.
+                    live.persist(sphinx)
+                    old_config = sphinx.config
+                    try:
+                        new_sphinx = GalleySphinx(srcdir, confdir, outdir, doctreedir, buildername,
+                                                  confoverrides, status, warning, freshenv,
+                                                  warningiserror, tags, verbosity, parallel,
+                                                  output_queue=output_queue, write_files=write_files)
+                    except SphinxError as err:
+                        # The configuration is broken (e.g., it has just been
+                        # saved half-edited). Report the problem, and carry on
+                        # with the old configuration until it is fixed.
+                        output_queue.put(config_error(confdir, err))
+                        sphinx.restore_logging()
+                        output_queue.put(initialization_end(sphinx))
+                        continue
+                    sphinx = new_sphinx
+                    preemption.connect(sphinx)
+                    dependencies.connect(sphinx)
+                    output_queue.put(initialization_end(sphinx))
+
+                    # Config values with an empty rebuild category don't affect the
+                    # output; if only those changed, there is nothing to rebuild.
+                    if config_changes(old_config, sphinx.config) - {''}:
+                        # If the changed values only affect how some documents
+                        # are read, only those documents are read again.
+                        if sphinx.env.config_status == CONFIG_CHANGED:
+                            docnames = affected_documents(
+                                sphinx, changed_values(old_config, sphinx.config, 'env')
+                            )
+                            if docnames is not None:
+                                reread(sphinx, docnames)
+
+                        # If this build is cancelled, the configuration has
+                        # still been reloaded; only the build is restarted.
+                        cmd = BuildAll()
+                        output_queue.put(BuildStart(filenames=None))
+                        with preemption.running(None), live.deferring(sphinx):
+                            build(sphinx)
+                        output_queue.put(BuildEnd(filenames=None))
+                        built_all = True
+
+                elif built_all:
+                    # Reloading the configuration has already rebuilt everything.
+                    pass
+
+                elif isinstance(cmd, BuildAll):
+                    output_queue.put(BuildStart(filenames=None))
+                    with preemption.running(None), live.deferring(sphinx):
+                        build(sphinx)
+                    output_queue.put(BuildEnd(filenames=None))
+
+                elif isinstance(cmd, BuildSpecific):
+                    # Documents that depend on the changed files are out of
+                    # date too; the view is told about all of them.
+                    filenames = dependencies.expand(cmd.filenames)
+                    # If more documents are to be built after these (i.e., this
+                    # is the focus document's build), they are read then.
+                    defer_others = any(isinstance(later, BuildSpecific) for later in batch[index + 1:])
+                    output_queue.put(BuildStart(filenames=filenames))
+                    with preemption.running(filenames), live.deferring(sphinx):
+                        build(sphinx, filenames, defer_others=defer_others)
+                    output_queue.put(BuildEnd(filenames=filenames))
+
+                elif isinstance(cmd, RewriteAll):
+                    output_queue.put(BuildStart(filenames=None))
+                    with preemption.running(None):
+                        rewrite_all(sphinx)
+                    output_queue.put(BuildEnd(filenames=None))
+
+                elif isinstance(cmd, CopyStatic):
+                    output_queue.put(BuildStart(filenames=[]))
+                    copy_static(sphinx)
+                    output_queue.put(BuildEnd(filenames=[]))
+
+            except Cancelled:
+                output_queue.put(BuildCancelled(filenames=cmd.filenames if isinstance(cmd, BuildSpecific) else None))
+                # Restart the build (and any that were to follow it),
+                # merged with whatever superseded it.
+                preemption.pending[:0] = [cmd] + batch[index + 1:]
+                sphinx._warncount = 0
+                break
+
+            if not quit:
+                if modules.update(sphinx):
+                    output_queue.put(ModuleDependencies(modules.modules))
+                if dependencies.update(sphinx):
+                    output_queue.put(FileDependencies(dependencies.files))
+
+            # Reset the warning count so that they don't accumulate between builds.
+            sphinx._warncount = 0
+
+    output_queue.flush()
+
+
+######################################################################
+# Out-of-process worker
+######################################################################
+
+class ConnectionQueue(object):
+    """A queue-like wrapper around one end of a multiprocessing Pipe.
+
+    Provides just enough of the Queue interface for sphinx_worker().
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    def put(self, item):
+        self.connection.send(item)
+
+    def get(self, block=True, timeout=None):
+        if not self.connection.poll(timeout if block else 0):
+            raise Empty
+        return self.connection.recv()
+
+
+def worker_process(base_path, connection, parallel=0, persist_every=10, write_files=True):
+    "The entry point of a worker process; commands and output are exchanged over connection"
+    queue = ConnectionQueue(connection)
+    try:
+        sphinx_worker(base_path, queue, queue, parallel, persist_every, write_files)
+    finally:
+        connection.close()
+
+
+class WorkerProcess(object):
+    """A Sphinx worker running in a separate process.
+
+    Reading and writing documents is CPU-bound, and would otherwise hold
+    the interpreter lock that the GUI needs. The worker process speaks the
+    same protocol as the worker thread: commands are put on the
+    WorkerProcess as if it were the work queue, and output messages are
+    forwarded onto output_queue.
+    """
+    def __init__(self, base_path, output_queue, parallel=0, persist_every=10, write_files=True):
+        self.output_queue = output_queue
+
+        # Tk doesn't survive being forked, so always start a fresh interpreter.
+        context = multiprocessing.get_context('spawn')
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=worker_process, args=(base_path, child_connection, parallel, persist_every, write_files))
+        self.process.daemon = True
+
+        self.reader = threading.Thread(target=self.forward_output)
+        self.reader.daemon = True
+
+        self._child_connection = child_connection
+
+    def start(self):
+        "Start the worker process"
+        self.process.start()
+        # The child's end of the pipe now belongs to the child; closing it
+        # here means that the pipe will report EOF when the child exits.
+        self._child_connection.close()
+        self.reader.start()
+
+    def forward_output(self):
+        "Forward output from the worker process until it exits"
+        while True:
+            try:
+                message = self.connection.recv()
+            except (EOFError, OSError):
+                break
+            self.output_queue.put(message)
+
+    def put(self, command):
+        "Send a command to the worker process"
+        self.connection.send(command)
 
-        # Reset the warning count so that they don't accumulate between builds.
-        sphinx._warncount = 0
+    def join(self, timeout=None):
+        "Wait for the worker process to exit (i.e., after it has been sent Quit)"
+        self.process.join(timeout)
+        self.reader.join(timeout)
@@ -8,7 +8,14 @@ try:
 finally:
     readme.close()
 
-required_pkgs = ['tkreadonly', 'sphinx']
+# GalleyBuilder.build() is a copy of Sphinx's (final) Builder.build(),
+# which uses Sphinx internals; it must be checked against each major
+# release before the upper bound is raised.
+required_pkgs = [
+    'tkreadonly',
+    'sphinx>=9.0,<10',
+    'sphinxcontrib-serializinghtml>=2.0',
+]
 
 setup(
     name='galley',
@@ -0,0 +1,197 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # python 3.x
+
+from galley import inotify
+from galley.monitor import (
+    MONITORS,
+    file_monitor,
+    scan,
+    FileChange,
+)
+
+
+class MonitorBackendTestMixin(object):
+    "Tests that every monitor backend must pass."
+    backend = None
+
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        self.write('index.rst', 'Index')
+        os.mkdir(os.path.join(self.base_path, 'sub'))
+        self.write(os.path.join('sub', 'page.rst'), 'Page')
+
+        self.queue = Queue()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=file_monitor,
+            args=(self.base_path, self.stop_event, self.queue, self.backend)
+        )
+        self.thread.start()
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.thread.join()
+        shutil.rmtree(self.base_path)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.base_path, filename), 'w') as f:
+            f.write(content)
+
+    def wait_for_change(self):
+        change = self.queue.get(timeout=5)
+        self.assertIsInstance(change, FileChange)
+        return change
+
+    def wait_until_watching(self):
+        # Give the monitor a chance to do its initial scan.
+        self.stop_event.wait(0.2)
+
+    def test_new_file(self):
+        "A newly created document is reported as new"
+        self.wait_until_watching()
+        self.write('new.rst', 'New')
+
+        change = self.wait_for_change()
+        self.assertEqual(change, FileChange([os.path.join(self.base_path, 'new.rst')], []))
+
+    def test_modified_file(self):
+        "A modified document in a subdirectory is reported as modified"
+        self.wait_until_watching()
+        # Make sure the modification time will move forward.
+        self.stop_event.wait(0.05)
+        self.write(os.path.join('sub', 'page.rst'), 'Updated page')
+
+        change = self.wait_for_change()
+        self.assertEqual(change, FileChange([], [os.path.join(self.base_path, 'sub', 'page.rst')]))
+
+    def test_new_directory(self):
+        "Documents in a new directory are reported as new"
+        self.wait_until_watching()
+        os.mkdir(os.path.join(self.base_path, 'other'))
+        self.write(os.path.join('other', 'new.rst'), 'New')
+
+        change = self.wait_for_change()
+        self.assertEqual(change.new, [os.path.join(self.base_path, 'other', 'new.rst')])
+
+    def test_dangling_symlink(self):
+        "An editor's lock file (a dangling symlink) doesn't stop the monitor"
+        self.wait_until_watching()
+        os.symlink('user@host.1234', os.path.join(self.base_path, 'sub', '.#page.rst'))
+        self.stop_event.wait(1.5)
+        self.write('new.rst', 'New')
+
+        change = self.wait_for_change()
+        self.assertEqual(change.new, [os.path.join(self.base_path, 'new.rst')])
+
+    def test_ignored_files(self):
+        "Changes to files that aren't documents aren't reported"
+        self.wait_until_watching()
+        self.write('notes.py', 'x = 1')
+        os.mkdir(os.path.join(self.base_path, '_build'))
+        self.write(os.path.join('_build', 'output.rst'), 'Built')
+
+        with self.assertRaises(Empty):
+            self.queue.get(timeout=1.5)
+
+
+class PollMonitorTest(MonitorBackendTestMixin, unittest.TestCase):
+    backend = 'poll'
+
+
+class IncrementalMonitorTest(MonitorBackendTestMixin, unittest.TestCase):
+    backend = 'incremental'
+
+    def test_modified_file(self):
+        self.skipTest("In-place edits are only detected by the periodic full rescan")
+
+
+@unittest.skipUnless(inotify.is_available(), "inotify is not available on this platform")
+class INotifyMonitorTest(MonitorBackendTestMixin, unittest.TestCase):
+    backend = 'inotify'
+
+    def test_short_lived_directories(self):
+        "Directories that are removed as soon as they are created don't stop inotify being used"
+        fallbacks = []
+        with mock.patch.dict(MONITORS, {'poll': lambda *args: fallbacks.append(args)}):
+            self.wait_until_watching()
+            for i in range(50):
+                os.mkdir(os.path.join(self.base_path, 'tmp%d' % i))
+                os.rmdir(os.path.join(self.base_path, 'tmp%d' % i))
+            self.write('new.rst', 'New')
+
+            change = self.wait_for_change()
+        self.assertEqual(change, FileChange([os.path.join(self.base_path, 'new.rst')], []))
+        self.assertEqual(fallbacks, [])
+
+
+class ScanTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        for dirname in ['sub', '_build', '.git', 'galley.egg-info']:
+            os.mkdir(os.path.join(self.base_path, dirname))
+            with open(os.path.join(self.base_path, dirname, 'page.rst'), 'w') as f:
+                f.write('Page')
+        with open(os.path.join(self.base_path, 'conf.py'), 'w') as f:
+            f.write('')
+        with open(os.path.join(self.base_path, 'index.txt'), 'w') as f:
+            f.write('Index')
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def test_scan(self):
+        "Scanning a project visits directories and documents, skipping ignored content"
+        dirs = []
+        files = []
+        scan(
+            self.base_path,
+            lambda dirname, data: dirs.append(dirname),
+            lambda dirname, filename, data: files.append(os.path.join(dirname, filename)),
+            None
+        )
+
+        self.assertEqual(dirs, [self.base_path, os.path.join(self.base_path, 'sub')])
+        self.assertEqual(sorted(files), [
+            os.path.join(self.base_path, 'index.txt'),
+            os.path.join(self.base_path, 'sub', 'page.rst'),
+        ])
+
+    def test_scan_with_stat(self):
+        "Scanning can provide the stat result for each directory and document"
+        stats = {}
+        scan(
+            self.base_path,
+            lambda dirname, data, stat: stats.__setitem__(dirname, stat),
+            lambda dirname, filename, data, stat: stats.__setitem__(os.path.join(dirname, filename), stat),
+            None,
+            stat=True
+        )
+
+        self.assertEqual(len(stats), 4)
+        for path, stat in stats.items():
+            self.assertEqual(stat.st_mtime, os.stat(path).st_mtime)
+
+    def test_dangling_symlink(self):
+        "Files that can't be examined are skipped"
+        os.symlink('user@host.1234', os.path.join(self.base_path, 'sub', '.#page.rst'))
+        files = []
+        scan(
+            self.base_path,
+            lambda dirname, data, stat: None,
+            lambda dirname, filename, data, stat: files.append(os.path.join(dirname, filename)),
+            None,
+            stat=True
+        )
+        self.assertEqual(sorted(files), [
+            os.path.join(self.base_path, 'index.txt'),
+            os.path.join(self.base_path, 'sub', 'page.rst'),
+        ])
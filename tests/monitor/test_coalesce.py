@@ -0,0 +1,76 @@
+import threading
+import time
+import unittest
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty  # python 3.x
+
+from galley.monitor import coalesce_changes, FileChange
+
+
+class CoalesceChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.input_queue = Queue()
+        self.output_queue = Queue()
+
+    def start(self, quiet_period, max_latency):
+        self.thread = threading.Thread(
+            target=coalesce_changes,
+            args=(self.input_queue, self.output_queue, quiet_period, max_latency)
+        )
+        self.thread.start()
+
+    def tearDown(self):
+        self.input_queue.put(None)
+        self.thread.join()
+
+    def test_burst_merged(self):
+        "A burst of changes is reported as a single, deduplicated change"
+        self.start(quiet_period=0.2, max_latency=5.0)
+        self.input_queue.put(FileChange(['/a.rst'], []))
+        self.input_queue.put(FileChange([], ['/b.rst', '/a.rst']))
+        self.input_queue.put(FileChange([], ['/b.rst', '/c.rst']))
+
+        change = self.output_queue.get(timeout=2)
+        self.assertEqual(change, FileChange(['/a.rst'], ['/b.rst', '/c.rst']))
+
+        # Nothing left in the queue
+        with self.assertRaises(Empty):
+            self.output_queue.get(timeout=0.3)
+
+    def test_new_overrides_modified(self):
+        "A file that is new in any merged change is reported as new"
+        self.start(quiet_period=0.2, max_latency=5.0)
+        self.input_queue.put(FileChange([], ['/a.rst']))
+        self.input_queue.put(FileChange(['/a.rst'], []))
+
+        change = self.output_queue.get(timeout=2)
+        self.assertEqual(change, FileChange(['/a.rst'], []))
+
+    def test_max_latency(self):
+        "A continuous stream of changes is flushed at the latency cap"
+        self.start(quiet_period=0.3, max_latency=0.5)
+
+        def produce():
+            for i in range(10):
+                self.input_queue.put(FileChange([], ['/page%d.rst' % i]))
+                time.sleep(0.1)
+        producer = threading.Thread(target=produce)
+        start = time.monotonic()
+        producer.start()
+
+        change = self.output_queue.get(timeout=2)
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertLess(len(change.modified), 10)
+        producer.join()
+
+    def test_stop_flushes(self):
+        "Held changes are flushed when the coalescer is stopped"
+        self.start(quiet_period=60, max_latency=60)
+        self.input_queue.put(FileChange([], ['/a.rst']))
+        self.input_queue.put(None)
+        self.thread.join()
+
+        self.assertEqual(self.output_queue.get(block=False), FileChange([], ['/a.rst']))
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from galley.monitor import Monitor, gather_tree
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.base_path, 'index.rst')
+        self.write('Index')
+
+        self.monitor = Monitor(fingerprint=True)
+        gather_tree(self.base_path, self.monitor)
+        self.future = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def write(self, content):
+        with open(self.filename, 'w') as f:
+            f.write(content)
+
+    def touch(self):
+        "Move the modification time of the document (and its directory) forward"
+        self.future += 10
+        os.utime(self.filename, (self.future, self.future))
+        os.utime(self.base_path, (self.future, self.future))
+
+    def rescan(self):
+        self.monitor.reset()
+        gather_tree(self.base_path, self.monitor)
+
+    def test_new_file_fingerprinted(self):
+        "New documents are fingerprinted when they are discovered"
+        self.assertEqual(self.monitor.new_files, [self.filename])
+        self.assertEqual(self.monitor.fingerprints.hashed, 1)
+
+    def test_touch_suppressed(self):
+        "A modification that doesn't change the content isn't reported"
+        self.touch()
+        self.rescan()
+
+        self.assertEqual(self.monitor.modified_files, [])
+        self.assertEqual(self.monitor.fingerprints.suppressed, 1)
+
+    def test_identical_rewrite_suppressed(self):
+        "Rewriting a document with identical content isn't reported"
+        self.write('Index')
+        self.touch()
+        self.rescan()
+
+        self.assertEqual(self.monitor.modified_files, [])
+        self.assertEqual(self.monitor.fingerprints.suppressed, 1)
+
+    def test_same_size_change_reported(self):
+        "A change to the content that doesn't change the size is reported"
+        self.write('Indey')
+        self.touch()
+        self.rescan()
+
+        self.assertEqual(self.monitor.modified_files, [self.filename])
+        self.assertEqual(self.monitor.fingerprints.hashed, 2)
+        self.assertEqual(self.monitor.fingerprints.suppressed, 0)
+
+    def test_size_change_not_hashed(self):
+        "A change to the size is reported without hashing the content"
+        self.write('Index page')
+        self.touch()
+        self.rescan()
+
+        self.assertEqual(self.monitor.modified_files, [self.filename])
+        self.assertEqual(self.monitor.fingerprints.hashed, 1)
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from galley.monitor import Monitor, gather_tree
+
+
+class GatherTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.base_path, 'sub'))
+        self.write('index.rst', 'Index')
+        self.write(os.path.join('sub', 'page.rst'), 'Page')
+
+        self.monitor = Monitor()
+        gather_tree(self.base_path, self.monitor)
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def path(self, *parts):
+        return os.path.join(self.base_path, *parts)
+
+    def write(self, filename, content, mtime=None):
+        with open(self.path(filename), 'w') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(self.path(filename), (mtime, mtime))
+
+    def touch_dir(self, dirname):
+        "Move a directory's modification time forward"
+        future = time.time() + 10
+        os.utime(dirname, (future, future))
+
+    def rescan(self, full=False):
+        self.monitor.reset()
+        gather_tree(self.base_path, self.monitor, full=full)
+
+    def test_initial_scan(self):
+        "The initial scan finds every document"
+        self.assertEqual(sorted(self.monitor.new_files), [self.path('index.rst'), self.path('sub', 'page.rst')])
+        record = self.monitor.table.get(self.base_path)
+        self.assertEqual(record.subdirs, ['sub'])
+        self.assertEqual(record.names, ['index.rst'])
+
+    def test_untouched_directory_skipped(self):
+        "Documents in a directory whose mtime hasn't moved aren't examined"
+        self.write(os.path.join('sub', 'page.rst'), 'Updated', mtime=time.time() + 10)
+
+        self.rescan()
+        self.assertEqual(self.monitor.modified_files, [])
+
+        # A full rescan finds the in-place edit.
+        self.rescan(full=True)
+        self.assertEqual(self.monitor.modified_files, [self.path('sub', 'page.rst')])
+
+    def test_touched_directory_rescanned(self):
+        "Documents in a directory whose mtime has moved are examined"
+        self.write(os.path.join('sub', 'page.rst'), 'Updated', mtime=time.time() + 10)
+        self.write(os.path.join('sub', 'new.rst'), 'New')
+        self.touch_dir(self.path('sub'))
+
+        self.rescan()
+        self.assertEqual(self.monitor.new_files, [self.path('sub', 'new.rst')])
+        self.assertEqual(self.monitor.modified_files, [self.path('sub', 'page.rst')])
+
+    def test_removed_content_forgotten(self):
+        "Removed documents and directories are discarded"
+        os.remove(self.path('index.rst'))
+        shutil.rmtree(self.path('sub'))
+        self.touch_dir(self.base_path)
+
+        self.rescan()
+        record = self.monitor.table.get(self.base_path)
+        self.assertEqual(record.subdirs, [])
+        self.assertEqual(record.names, [])
+        self.assertEqual(len(record.mtimes), 0)
+        self.assertIsNone(self.monitor.table.get(self.path('sub')))
@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley import inotify
+from galley.monitor import (
+    file_monitor,
+    ProjectLayout,
+    FileChange,
+    ConfigChange,
+    TemplateChange,
+    StaticChange,
+    ModuleChange,
+    DependencyChange,
+)
+
+
+class ProjectLayoutTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = os.path.join(os.sep, 'project', 'docs')
+        self.layout = ProjectLayout(self.base_path)
+
+    def path(self, *parts):
+        return os.path.join(self.base_path, *parts)
+
+    def test_classify(self):
+        "Files are classified by where they are in the project"
+        self.assertIs(self.layout.classify(self.path('conf.py')), ConfigChange)
+        self.assertIs(self.layout.classify(self.path('_templates', 'layout.html')), TemplateChange)
+        self.assertIs(self.layout.classify(self.path('_static', 'css', 'custom.css')), StaticChange)
+        self.assertIs(self.layout.classify(self.path('index.rst')), FileChange)
+        self.assertIs(self.layout.classify(self.path('sub', 'conf.py')), None)
+
+    def test_configure(self):
+        "The template and static paths can be changed"
+        self.layout.configure(['templates'], ['../static'])
+        self.assertIs(self.layout.classify(self.path('templates', 'layout.html')), TemplateChange)
+        self.assertIs(self.layout.classify(os.path.join(os.sep, 'project', 'static', 'a.css')), StaticChange)
+        self.assertIs(self.layout.classify(self.path('_static', 'a.css')), None)
+
+    def test_changes(self):
+        "Changes are split by kind, with configuration changes first"
+        messages = self.layout.changes(
+            [self.path('new.rst'), self.path('_static', 'new.css')],
+            [self.path('index.rst'), self.path('conf.py'), self.path('_templates', 'page.html')],
+        )
+        self.assertEqual(messages, [
+            ConfigChange([self.path('conf.py')]),
+            TemplateChange([self.path('_templates', 'page.html')]),
+            StaticChange([self.path('_static', 'new.css')]),
+            FileChange([self.path('new.rst')], [self.path('index.rst')]),
+        ])
+
+
+    def test_modules(self):
+        "Changes to modules are reported with the documents that depend on them"
+        module = os.path.join(os.sep, 'project', 'src', 'module.py')
+        other = os.path.join(os.sep, 'project', 'src', 'other.py')
+        self.layout.watch_modules({
+            module: [self.path('api.rst')],
+            other: [self.path('api.rst'), self.path('other.rst')],
+        })
+        self.assertIs(self.layout.classify(module), ModuleChange)
+        self.assertEqual(
+            self.layout.changes([], [module, other]),
+            [ModuleChange([module, other], [self.path('api.rst'), self.path('other.rst')])]
+        )
+
+    def test_dependencies(self):
+        "Changes to other files are reported with the documents that depend on them"
+        snippet = self.path('_includes', 'snippet.inc')
+        module = os.path.join(os.sep, 'project', 'src', 'module.py')
+        self.layout.watch_modules({module: [self.path('api.rst')]})
+        self.layout.watch_dependencies({snippet: [self.path('index.rst'), self.path('other.rst')]})
+        self.assertIs(self.layout.classify(snippet), DependencyChange)
+        self.assertEqual(
+            self.layout.changes([], [snippet, module]),
+            [
+                ModuleChange([module], [self.path('api.rst')]),
+                DependencyChange([snippet], [self.path('index.rst'), self.path('other.rst')]),
+            ]
+        )
+
+
+class ProjectMonitorTestMixin(object):
+    "Tests that every monitor backend must pass, for files that aren't documents."
+    backend = None
+
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        self.write('index.rst', 'Index')
+        self.write('conf.py', 'project = "Test"')
+        os.mkdir(os.path.join(self.base_path, '_templates'))
+        self.write(os.path.join('_templates', 'layout.html'), '{% extends "!layout.html" %}')
+        os.mkdir(os.path.join(self.base_path, '_static'))
+
+        self.layout = ProjectLayout(self.base_path)
+        self.queue = Queue()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=file_monitor,
+            args=(self.base_path, self.stop_event, self.queue, self.backend),
+            kwargs={'quiet_period': 0.1, 'layout': self.layout}
+        )
+        self.thread.start()
+        # Give the monitor a chance to do its initial scan.
+        self.stop_event.wait(0.2)
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.thread.join()
+        shutil.rmtree(self.base_path)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.base_path, filename), 'w') as f:
+            f.write(content)
+
+    def path(self, *parts):
+        return os.path.join(self.base_path, *parts)
+
+    def test_config(self):
+        "A change to conf.py is reported as a configuration change"
+        self.stop_event.wait(0.05)
+        self.write('conf.py', 'project = "Changed"')
+        self.assertEqual(self.queue.get(timeout=5), ConfigChange([self.path('conf.py')]))
+
+    def test_template(self):
+        "A change to a template is reported as a template change"
+        self.stop_event.wait(0.05)
+        self.write(os.path.join('_templates', 'layout.html'), '{# changed #}')
+        self.assertEqual(
+            self.queue.get(timeout=5),
+            TemplateChange([self.path('_templates', 'layout.html')])
+        )
+
+    def test_static(self):
+        "A new static file is reported as a static change"
+        self.write(os.path.join('_static', 'custom.css'), 'body {}')
+        self.assertEqual(self.queue.get(timeout=5), StaticChange([self.path('_static', 'custom.css')]))
+
+    def test_new_root(self):
+        "The files in a tree added to the layout aren't reported as new"
+        os.mkdir(os.path.join(self.base_path, 'static'))
+        self.write(os.path.join('static', 'old.css'), 'body {}')
+        self.layout.configure(['_templates'], ['static'])
+
+        # Once the new tree has been scanned, changes to it are reported.
+        self.stop_event.wait(1.5)
+        self.write(os.path.join('static', 'new.css'), 'body {}')
+        self.assertEqual(self.queue.get(timeout=5), StaticChange([self.path('static', 'new.css')]))
+
+    def test_module(self):
+        "A change to a module that a document depends on is reported"
+        module_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, module_path)
+        module = os.path.join(module_path, 'module.py')
+        with open(module, 'w') as f:
+            f.write('"Module"')
+        self.layout.watch_modules({module: [self.path('index.rst')]})
+
+        self.stop_event.wait(1.5)
+        with open(module, 'w') as f:
+            f.write('"Changed module"')
+        self.assertEqual(self.queue.get(timeout=5), ModuleChange([module], [self.path('index.rst')]))
+
+
+class PollProjectMonitorTest(ProjectMonitorTestMixin, unittest.TestCase):
+    backend = 'poll'
+
+
+class IncrementalProjectMonitorTest(ProjectMonitorTestMixin, unittest.TestCase):
+    backend = 'incremental'
+
+    def test_config(self):
+        self.skipTest("In-place edits are only detected by the periodic full rescan")
+
+    def test_template(self):
+        self.skipTest("In-place edits are only detected by the periodic full rescan")
+
+
+@unittest.skipUnless(inotify.is_available(), "inotify is not available on this platform")
+class INotifyProjectMonitorTest(ProjectMonitorTestMixin, unittest.TestCase):
+    backend = 'inotify'
@@ -0,0 +1,50 @@
+import unittest
+
+from galley.monitor import DirRecord, PathTable
+
+
+class DirRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.record = DirRecord(0, '/docs')
+        self.record.insert('b.rst', 2.0, 20)
+        self.record.insert('c.rst', 3.0, 30)
+        self.record.insert('a.rst', 1.0, 10)
+
+    def test_insert(self):
+        "Documents are kept in sorted order, with their data in parallel arrays"
+        self.assertEqual(self.record.names, ['a.rst', 'b.rst', 'c.rst'])
+        self.assertEqual(list(self.record.mtimes), [1.0, 2.0, 3.0])
+        self.assertEqual(list(self.record.sizes), [10, 20, 30])
+        self.assertEqual(self.record.digests, [None, None, None])
+
+    def test_index(self):
+        "Documents can be found by name"
+        self.assertEqual(self.record.index('a.rst'), 0)
+        self.assertEqual(self.record.index('c.rst'), 2)
+        self.assertEqual(self.record.index('aa.rst'), -1)
+        self.assertEqual(self.record.index('d.rst'), -1)
+
+    def test_remove(self):
+        "Removing a document removes its data"
+        self.record.remove('b.rst')
+        self.record.remove('missing.rst')
+
+        self.assertEqual(self.record.names, ['a.rst', 'c.rst'])
+        self.assertEqual(list(self.record.mtimes), [1.0, 3.0])
+        self.assertEqual(list(self.record.sizes), [10, 30])
+
+
+class PathTableTest(unittest.TestCase):
+    def test_directories(self):
+        "Directories are assigned ids, and can be discarded"
+        table = PathTable()
+        docs = table.add('/docs')
+        sub = table.add('/docs/sub')
+
+        self.assertEqual((docs.id, sub.id), (0, 1))
+        self.assertIs(table.get('/docs/sub'), sub)
+        self.assertIsNone(table.get('/other'))
+
+        table.discard('/docs')
+        self.assertIsNone(table.get('/docs'))
+        self.assertEqual(list(table), [sub])
@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.monitor import (
+    Monitor,
+    Outdated,
+    file_monitor,
+    gather_tree,
+    load_snapshot,
+    save_snapshot,
+    FileChange,
+)
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.base_path, '_build', 'galley.snapshot')
+        os.mkdir(os.path.join(self.base_path, 'sub'))
+        self.write('index.rst', 'Index')
+        self.write(os.path.join('sub', 'page.rst'), 'Page')
+        self.write(os.path.join('sub', 'other.rst'), 'Other')
+
+    def tearDown(self):
+        shutil.rmtree(self.base_path)
+
+    def path(self, *parts):
+        return os.path.join(self.base_path, *parts)
+
+    def write(self, filename, content):
+        with open(self.path(filename), 'w') as f:
+            f.write(content)
+        future = time.time() + 10
+        os.utime(self.path(filename), (future, future))
+
+    def save(self, fingerprint=False, outdated=None):
+        "Scan the tree, and save a snapshot of its state"
+        monitor = Monitor(fingerprint=fingerprint)
+        monitor.outdated = outdated
+        gather_tree(self.base_path, monitor)
+        save_snapshot(monitor, self.base_path, self.snapshot)
+
+    def diff(self, fingerprint=False):
+        "Scan the tree, and compare it with the saved snapshot"
+        monitor = Monitor(fingerprint=fingerprint)
+        gather_tree(self.base_path, monitor)
+        snapshot = load_snapshot(self.base_path, self.snapshot)
+        return snapshot.diff(monitor), monitor
+
+    def test_offline_changes(self):
+        "Documents added and modified while Galley wasn't running are found"
+        self.save()
+        self.write('new.rst', 'New')
+        self.write(os.path.join('sub', 'page.rst'), 'Updated page')
+
+        (new, modified), monitor = self.diff()
+        self.assertEqual(new, [self.path('new.rst')])
+        self.assertEqual(modified, [self.path('sub', 'page.rst')])
+
+    def test_unchanged_content(self):
+        "With fingerprints, documents rewritten with the same content aren't reported"
+        self.save(fingerprint=True)
+        self.write(os.path.join('sub', 'page.rst'), 'Page')
+        self.write(os.path.join('sub', 'other.rst'), 'Changed')
+
+        (new, modified), monitor = self.diff(fingerprint=True)
+        self.assertEqual(new, [])
+        self.assertEqual(modified, [self.path('sub', 'other.rst')])
+        self.assertEqual(monitor.fingerprints.suppressed, 1)
+
+    def test_outdated(self):
+        "Documents whose changes haven't been built are reported on the next run"
+        outdated = Outdated()
+        outdated.add([self.path('sub', 'page.rst'), self.path('sub', 'other.rst')])
+        outdated.built(outdated.building([self.path('sub', 'other.rst')]))
+        self.save(fingerprint=True, outdated=outdated)
+
+        (new, modified), monitor = self.diff(fingerprint=True)
+        self.assertEqual(new, [])
+        self.assertEqual(modified, [self.path('sub', 'page.rst')])
+
+    def test_changed_while_building(self):
+        "A change made while a build is running isn't discarded when the build completes"
+        outdated = Outdated()
+        outdated.add([self.path('index.rst')])
+        building = outdated.building()
+        outdated.add([self.path('index.rst'), self.path('sub', 'page.rst')])
+        outdated.built(building)
+        self.assertEqual(outdated.filenames(), set([self.path('index.rst'), self.path('sub', 'page.rst')]))
+
+        outdated.built(outdated.building(None))
+        self.assertEqual(outdated.filenames(), set())
+
+    def test_missing_snapshot(self):
+        "A missing or corrupt snapshot is ignored"
+        self.assertIsNone(load_snapshot(self.base_path, self.snapshot))
+
+        os.mkdir(self.path('_build'))
+        with open(self.snapshot, 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(load_snapshot(self.base_path, self.snapshot))
+
+    def test_file_monitor(self):
+        "The file monitor saves a snapshot on exit, and reports offline changes on startup"
+        def run(outdated=None):
+            queue = Queue()
+            stop_event = threading.Event()
+            thread = threading.Thread(
+                target=file_monitor,
+                args=(self.base_path, stop_event, queue),
+                kwargs={'backend': 'poll', 'snapshot': self.snapshot, 'quiet_period': 0, 'outdated': outdated}
+            )
+            thread.start()
+            stop_event.set()
+            thread.join()
+            return queue
+
+        queue = run()
+        self.assertTrue(queue.empty())
+        self.assertTrue(os.path.exists(self.snapshot))
+
+        self.write(os.path.join('sub', 'page.rst'), 'Updated page')
+        queue = run()
+        self.assertEqual(queue.get(block=False), FileChange([], [self.path('sub', 'page.rst')]))
+
+        # Nothing built the change, so it is reported again.
+        outdated = Outdated()
+        queue = run(outdated)
+        self.assertEqual(queue.get(block=False), FileChange([], [self.path('sub', 'page.rst')]))
+        self.assertEqual(outdated.filenames(), set([self.path('sub', 'page.rst')]))
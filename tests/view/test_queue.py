@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+import tkinter
+import unittest
+from unittest import mock
+
+from galley.view import NotifyingQueue
+
+
+class NotifyingQueueTest(unittest.TestCase):
+    def setUp(self):
+        # A Tcl interpreter is enough to run the event loop; no display is needed.
+        self.tcl = tkinter.Tcl()
+        self.results = []
+        self.wakeups = 0
+        self.queue = NotifyingQueue(self.tcl, self.drain)
+
+    def tearDown(self):
+        self.queue.close()
+
+    def drain(self):
+        self.wakeups += 1
+        while not self.queue.empty():
+            self.results.append(self.queue.get(block=False))
+
+    def run_events(self, until, timeout=10):
+        "Run the event loop until the condition is met"
+        start = time.time()
+        while not until() and time.time() - start < timeout:
+            self.tcl.tk.dooneevent(tkinter._tkinter.DONT_WAIT)
+            time.sleep(0.001)
+
+    @unittest.skipUnless(hasattr(tkinter.Tcl().tk, 'createfilehandler'), "Tk can't watch a pipe on this platform")
+    def test_idle(self):
+        "Nothing happens while the queue is empty"
+        self.run_events(until=lambda: False, timeout=0.2)
+        self.assertEqual(self.wakeups, 0)
+
+    def test_wakeup(self):
+        "Items put on the queue by another thread are delivered in order"
+        def produce():
+            for i in range(500):
+                self.queue.put(i)
+                if i % 100 == 0:
+                    time.sleep(0.01)
+        producer = threading.Thread(target=produce)
+        producer.start()
+        self.run_events(until=lambda: len(self.results) == 500)
+        producer.join()
+
+        self.assertEqual(self.results, list(range(500)))
+        # Items that arrive together are handled together.
+        self.assertLess(self.wakeups, 500)
+
+    @unittest.skipUnless(hasattr(tkinter.Tcl().tk, 'createfilehandler'), "Tk can't watch a pipe on this platform")
+    def test_put_during_wakeup(self):
+        "An item put while Tk is being woken isn't left waiting"
+        read = os.read
+        interrupted = []
+
+        def put_then_read(fd, n):
+            # Another thread puts an item on the queue as the pipe is read.
+            if not interrupted:
+                interrupted.append(True)
+                self.queue.put(2)
+            return read(fd, n)
+
+        self.queue.put(1)
+        with mock.patch('os.read', put_then_read):
+            self.run_events(until=lambda: self.wakeups > 0)
+        self.assertEqual(self.results, [1, 2])
+
+        # Later items still wake Tk.
+        self.queue.put(3)
+        self.run_events(until=lambda: len(self.results) == 3, timeout=2)
+        self.assertEqual(self.results, [1, 2, 3])
+        self.assertFalse(self.queue.pending)
@@ -0,0 +1,115 @@
+import time
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.worker import (
+    BatchingQueue,
+    Batch,
+    collapse,
+    Output,
+    Progress,
+    WarningOutput,
+    DocumentReady,
+    BuildStart,
+    BuildEnd,
+)
+
+
+def warning(i):
+    return WarningOutput('/docs/index.rst', i, 'Warning %d' % i)
+
+
+class BatchingQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue()
+
+    def test_size(self):
+        "A batch is sent as soon as it is full"
+        batching = BatchingQueue(self.queue, size=3, interval=60)
+        for i in range(7):
+            batching.put(warning(i))
+
+        self.assertEqual(self.queue.get(block=False), Batch([warning(i) for i in range(3)]))
+        self.assertEqual(self.queue.get(block=False), Batch([warning(i) for i in range(3, 6)]))
+        self.assertTrue(self.queue.empty())
+
+        # The rest are sent when the queue is flushed.
+        batching.flush()
+        self.assertEqual(self.queue.get(block=False), Batch([warning(6)]))
+        self.assertTrue(self.queue.empty())
+
+    def test_interval(self):
+        "A batch that isn't full is sent after a short time"
+        batching = BatchingQueue(self.queue, size=100, interval=0.01)
+        batching.put(warning(1))
+        batching.put(warning(2))
+        self.assertEqual(self.queue.get(timeout=5), Batch([warning(1), warning(2)]))
+
+        time.sleep(0.05)
+        self.assertTrue(self.queue.empty())
+
+    def test_empty_flush(self):
+        "Flushing when nothing has been collected sends nothing"
+        batching = BatchingQueue(self.queue)
+        batching.flush()
+        self.assertTrue(self.queue.empty())
+
+    def test_collapsed(self):
+        "Superseded messages aren't sent"
+        batching = BatchingQueue(self.queue, size=100, interval=60)
+        for i in range(50):
+            batching.put(Output('message %d' % i))
+        batching.flush()
+        self.assertEqual(self.queue.get(block=False), Batch([Output('message 49')]))
+
+
+class CollapseTest(unittest.TestCase):
+    def test_status(self):
+        "Only the newest status is kept"
+        self.assertEqual(
+            collapse([Output('one'), Output('two'), Output('three')]),
+            [Output('three')]
+        )
+
+    def test_progress(self):
+        "The newest progress of each stage is kept"
+        self.assertEqual(
+            collapse([
+                Progress('reading sources', 50, 'a'),
+                Progress('reading sources', 100, 'b'),
+                Progress('writing output', 0, None),
+                Progress('writing output', 50, 'a'),
+            ]),
+            [Progress('reading sources', 100, 'b'), Progress('writing output', 50, 'a')]
+        )
+
+    def test_never_dropped(self):
+        "Warnings and documents are always kept, and don't stop messages being superseded"
+        warning = WarningOutput('/docs/a.rst', 1, 'Oops')
+        document = DocumentReady('/docs/a.rst', '<p>A</p>', {})
+        self.assertEqual(
+            collapse([
+                Output('reading a'), warning, Progress('reading sources', 50, 'a'),
+                Output('writing a'), document, Progress('reading sources', 100, 'b'),
+            ]),
+            [warning, Output('writing a'), document, Progress('reading sources', 100, 'b')]
+        )
+
+    def test_barrier(self):
+        "Messages aren't superseded across other messages"
+        self.assertEqual(
+            collapse([
+                Progress('writing output', 100, 'b'), Output('done'),
+                BuildEnd(None), BuildStart(None),
+                Progress('writing output', 0, None), Output('starting'), Output('started'),
+            ]),
+            [
+                Progress('writing output', 100, 'b'), Output('done'),
+                BuildEnd(None), BuildStart(None),
+                Progress('writing output', 0, None), Output('started'),
+            ]
+        )
@@ -0,0 +1,114 @@
+import ast
+import inspect
+import io
+import os
+import shutil
+import tempfile
+import textwrap
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from sphinx.builders import Builder
+from sphinx.util.parallel import parallel_available
+
+from galley.worker import GalleySphinx, GalleyBuilder, DocumentReady
+
+
+class GalleyBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        for filename, content in [
+            ('conf.py', 'project = "Test"\n'),
+            ('index.rst', 'Index\n=====\n\n.. toctree::\n\n   page\n'),
+            ('page.rst', 'Page\n====\n\nSome *content*.\n'),
+        ]:
+            with open(os.path.join(self.path, filename), 'w') as f:
+                f.write(content)
+        self.outdir = os.path.join(self.path, '_build', 'json')
+        self.queue = Queue()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def build(self, write_files, parallel=0):
+        sphinx = GalleySphinx(
+            self.path, self.path, self.outdir, os.path.join(self.outdir, '.doctrees'), 'galley',
+            status=io.StringIO(), warning=io.StringIO(), parallel=parallel,
+            output_queue=self.queue, write_files=write_files
+        )
+        sphinx.builder.build_all()
+
+        documents = {}
+        while not self.queue.empty():
+            message = self.queue.get()
+            if isinstance(message, DocumentReady):
+                documents[message.filename] = message
+        return documents
+
+    def test_delivered(self):
+        "Each document is delivered as it is written"
+        documents = self.build(write_files=True)
+        self.assertEqual(
+            sorted(documents),
+            [os.path.join(self.path, 'index.rst'), os.path.join(self.path, 'page.rst')]
+        )
+        page = documents[os.path.join(self.path, 'page.rst')]
+        self.assertIn('<em>content</em>', page.body)
+        self.assertEqual(page.metadata['title'], 'Page')
+        self.assertTrue(os.path.exists(os.path.join(self.outdir, 'page.fjson')))
+
+    def test_not_written(self):
+        "Documents don't have to be written to disk"
+        documents = self.build(write_files=False)
+        self.assertEqual(len(documents), 2)
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, 'page.fjson')))
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, 'globalcontext.json')))
+
+    @unittest.skipUnless(parallel_available, "Sphinx can't work in parallel on this platform")
+    def test_parallel(self):
+        "Documents written by other processes are delivered too"
+        for i in range(8):
+            with open(os.path.join(self.path, 'extra%d.rst' % i), 'w') as f:
+                f.write(':orphan:\n\nExtra %d\n=======\n' % i)
+        documents = self.build(write_files=False, parallel=3)
+        self.assertEqual(len(documents), 10)
+        self.assertIn('Extra 7', documents[os.path.join(self.path, 'extra7.rst')].body)
+
+
+class BuildMethodTest(unittest.TestCase):
+    class Normalizer(ast.NodeTransformer):
+        "Use the names that Sphinx uses for the modules that both import"
+        def visit_Name(self, node):
+            if node.id == 'sphinx_logging':
+                node.id = 'logging'
+            return node
+
+    def statements(self, method):
+        tree = ast.parse(textwrap.dedent(inspect.getsource(method)))
+        statements = tree.body[0].body
+        if isinstance(statements[0], ast.Expr) and isinstance(statements[0].value, ast.Constant):
+            # Skip the docstring.
+            statements = statements[1:]
+        return [self.Normalizer().visit(statement) for statement in statements]
+
+    def test_same_as_sphinx(self):
+        "GalleyBuilder.build() is Sphinx's Builder.build(), except for how the environment is saved"
+        expected = self.statements(Builder.build)
+        updated = [
+            statement for statement in expected
+            if isinstance(statement, ast.If) and ast.unparse(statement.test) == 'updated_docnames'
+        ]
+        self.assertEqual(len(updated), 1, "Builder.build() no longer saves the environment the same way")
+        # Sphinx imports the name of the pickle file, and writes it.
+        self.assertIn('pickle.dump(self.env', ast.unparse(updated[0].body[1]))
+        updated[0].body[:2] = ast.parse('self.save_environment()').body
+
+        self.assertEqual(
+            [ast.dump(statement) for statement in self.statements(GalleyBuilder.build)],
+            [ast.dump(statement) for statement in expected],
+            "Builder.build() has changed; GalleyBuilder.build() must be updated to match"
+        )
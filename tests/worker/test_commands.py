@@ -0,0 +1,91 @@
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.worker import (
+    drain,
+    merge_commands,
+    ReloadConfig,
+    BuildAll,
+    BuildSpecific,
+    RewriteAll,
+    CopyStatic,
+    Quit,
+    Focus,
+)
+
+
+class DrainTest(unittest.TestCase):
+    def test_drain(self):
+        "Every waiting command is taken"
+        queue = Queue()
+        queue.put(BuildSpecific(['a.rst']))
+        queue.put(BuildAll())
+        self.assertEqual(drain(queue), [BuildSpecific(['a.rst']), BuildAll()])
+        self.assertTrue(queue.empty())
+
+
+class MergeCommandsTest(unittest.TestCase):
+    def test_single(self):
+        "A single command is unchanged"
+        self.assertEqual(merge_commands([BuildSpecific(['a.rst'])]), [BuildSpecific(['a.rst'])])
+
+    def test_specific(self):
+        "Specific builds are merged, without duplicates"
+        self.assertEqual(
+            merge_commands([
+                BuildSpecific(['a.rst', 'b.rst']),
+                BuildSpecific(['b.rst']),
+                BuildSpecific(['c.rst', 'a.rst']),
+            ]),
+            [BuildSpecific(['a.rst', 'b.rst', 'c.rst'])]
+        )
+
+    def test_focus(self):
+        "The focus document is built on its own, before the others"
+        self.assertEqual(
+            merge_commands([BuildSpecific(['a.rst', 'b.rst']), BuildSpecific(['c.rst'])], focus='b.rst'),
+            [BuildSpecific(['b.rst']), BuildSpecific(['a.rst', 'c.rst'])]
+        )
+        self.assertEqual(
+            merge_commands([BuildSpecific(['b.rst']), Focus('b.rst')], focus='b.rst'),
+            [BuildSpecific(['b.rst'])]
+        )
+        self.assertEqual(
+            merge_commands([BuildSpecific(['a.rst'])], focus='b.rst'),
+            [BuildSpecific(['a.rst'])]
+        )
+
+    def test_build_all(self):
+        "A full build absorbs smaller builds, wherever it is in the queue"
+        self.assertEqual(
+            merge_commands([BuildSpecific(['a.rst']), BuildAll(), CopyStatic(), BuildSpecific(['b.rst'])]),
+            [BuildAll()]
+        )
+
+    def test_rewrite_all(self):
+        "A rewrite on its own stays a rewrite; with specific builds, it becomes a full build"
+        self.assertEqual(merge_commands([RewriteAll(), CopyStatic(), RewriteAll()]), [RewriteAll()])
+        self.assertEqual(merge_commands([RewriteAll(), BuildSpecific(['a.rst'])]), [BuildAll()])
+
+    def test_copy_static(self):
+        "Copying static files is only needed if nothing is built"
+        self.assertEqual(merge_commands([CopyStatic(), CopyStatic()]), [CopyStatic()])
+        self.assertEqual(
+            merge_commands([CopyStatic(), BuildSpecific(['a.rst'])]),
+            [BuildSpecific(['a.rst'])]
+        )
+
+    def test_reload_config(self):
+        "The configuration is reloaded once, before anything is built"
+        self.assertEqual(
+            merge_commands([BuildSpecific(['a.rst']), ReloadConfig(), ReloadConfig()]),
+            [ReloadConfig(), BuildSpecific(['a.rst'])]
+        )
+
+    def test_quit(self):
+        "Nothing is built on the way out"
+        self.assertEqual(merge_commands([BuildAll(), Quit(), BuildSpecific(['a.rst'])]), [Quit()])
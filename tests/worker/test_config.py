@@ -0,0 +1,183 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+
+from galley.worker import (
+    config_changes,
+    changed_values,
+    affected_documents,
+    reread,
+    sphinx_worker,
+    Batch,
+    ReloadConfig,
+    BuildAll,
+    Quit,
+    InitializationEnd,
+    BuildEnd,
+    WarningOutput,
+)
+
+
+class ConfigChangesTest(unittest.TestCase):
+    def test_unchanged(self):
+        "Identical configurations have no changes"
+        self.assertEqual(config_changes(Config({'project': 'Test'}), Config({'project': 'Test'})), set())
+
+    def test_output_only(self):
+        "A change to an HTML option only affects the HTML output"
+        self.assertEqual(
+            config_changes(Config({'pygments_style': 'sphinx'}), Config({'pygments_style': 'monokai'})),
+            {'html'}
+        )
+
+    def test_no_rebuild(self):
+        "Some options don't affect the output at all"
+        self.assertEqual(config_changes(Config({'nitpicky': False}), Config({'nitpicky': True})), {''})
+
+    def test_reading(self):
+        "A change to an option used while reading affects the environment"
+        self.assertEqual(
+            config_changes(Config({'rst_epilog': ''}), Config({'rst_epilog': '.. |x| replace:: y'})),
+            {'env'}
+        )
+
+    def test_extensions(self):
+        "A change to the list of extensions affects the environment"
+        self.assertEqual(
+            config_changes(Config({'extensions': []}), Config({'extensions': ['sphinx.ext.todo']})),
+            {'env'}
+        )
+
+
+class ChangedValuesTest(unittest.TestCase):
+    def test_category(self):
+        "Only the changed values in the category are reported"
+        self.assertEqual(
+            changed_values(
+                Config({'version': '1.0', 'rst_epilog': '', 'pygments_style': 'sphinx'}),
+                Config({'version': '1.1', 'rst_epilog': '', 'pygments_style': 'monokai'}),
+                'env'
+            ),
+            {'version'}
+        )
+
+
+class AffectedDocumentsTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write_conf('1.0')
+        self.write('index.rst', 'Index\n=====\n\nThis is version |version|.\n\n.. toctree::\n\n   api\n   other\n')
+        self.write('api.rst', 'API\n===\n\n.. autofunction:: os.path.join\n')
+        self.write('other.rst', 'Other\n=====\n\nNothing to see here.\n')
+        self.sphinx = self.build()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(content)
+
+    def write_conf(self, version):
+        self.write('conf.py', 'extensions = ["sphinx.ext.autodoc"]\nversion = %r\n' % version)
+
+    def build(self):
+        outdir = os.path.join(self.path, '_build', 'json')
+        self.status = io.StringIO()
+        sphinx = Sphinx(
+            self.path, self.path, outdir, os.path.join(outdir, '.doctrees'), 'json',
+            status=self.status, warning=io.StringIO()
+        )
+        return sphinx
+
+    def test_substitution(self):
+        "Only documents using a substitution depend on its value"
+        self.sphinx.builder.build_all()
+        self.assertEqual(affected_documents(self.sphinx, {'version'}), {'index'})
+
+    def test_autodoc(self):
+        "Only documents using autodoc depend on its options"
+        self.sphinx.builder.build_all()
+        self.assertEqual(affected_documents(self.sphinx, {'autodoc_typehints'}), {'api'})
+
+    def test_other(self):
+        "Any other value that affects reading affects every document"
+        self.sphinx.builder.build_all()
+        self.assertIsNone(affected_documents(self.sphinx, {'rst_epilog'}))
+        self.assertIsNone(affected_documents(self.sphinx, {'version', 'rst_epilog'}))
+
+    def test_reread(self):
+        "Only the affected documents are read again"
+        self.sphinx.builder.build_all()
+        self.write_conf('1.1')
+        sphinx = self.build()
+        reread(sphinx, affected_documents(sphinx, {'version'}))
+        sphinx.builder.build_all()
+        self.assertIn('0 added, 1 changed, 0 removed', self.status.getvalue())
+
+        # ... and only in the next build.
+        self.status.seek(0)
+        self.status.truncate()
+        sphinx.builder.build_all()
+        self.assertIn('0 added, 0 changed, 0 removed', self.status.getvalue())
+
+
+class ReloadConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        self.write('conf.py', 'project = "Test"\n')
+        self.write('index.rst', 'Index\n=====\n\nContent.\n')
+
+        self.work_queue = Queue()
+        self.output_queue = Queue()
+        self.worker = threading.Thread(target=sphinx_worker, args=(self.path, self.work_queue, self.output_queue))
+        self.worker.daemon = True
+        self.worker.start()
+        self.wait_for(InitializationEnd)
+
+    def tearDown(self):
+        self.work_queue.put(Quit())
+        self.worker.join(60)
+        shutil.rmtree(self.path)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(content)
+
+    def wait_for(self, kind):
+        "Collect output until a message of the given kind arrives"
+        messages = []
+        while not any(isinstance(message, kind) for message in messages):
+            batch = self.output_queue.get(timeout=60)
+            messages.extend(batch.messages if isinstance(batch, Batch) else [batch])
+        return messages
+
+    def test_broken_config(self):
+        "A broken configuration is reported, and the worker recovers once it is fixed"
+        self.write('conf.py', 'project = "T\n')
+        self.work_queue.put(ReloadConfig())
+        messages = self.wait_for(InitializationEnd)
+        warnings = [m for m in messages if isinstance(m, WarningOutput)]
+        self.assertEqual(len(warnings), 1)
+        self.assertEqual(warnings[0].filename, os.path.join(self.path, 'conf.py'))
+        self.assertEqual(warnings[0].lineno, 1)
+        self.assertTrue(self.worker.is_alive())
+
+        self.write('conf.py', 'project = "Fixed"\n')
+        self.work_queue.put(ReloadConfig())
+        self.wait_for(InitializationEnd)
+        self.work_queue.put(BuildAll())
+        self.wait_for(BuildEnd)
+        with open(os.path.join(self.path, '_build', 'json', 'globalcontext.json')) as f:
+            self.assertIn('"project": "Fixed"', f.read())
@@ -0,0 +1,162 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from sphinx.application import Sphinx
+
+from galley.monitor import file_monitor, ProjectLayout, DependencyChange
+from galley.worker import (
+    DependencyIndex,
+    sphinx_worker,
+    Batch,
+    BuildAll,
+    BuildSpecific,
+    Quit,
+    DocumentReady,
+    FileDependencies,
+)
+
+
+class DependencyIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.realpath(tempfile.mkdtemp())
+        for filename, content in [
+            ('conf.py', 'project = "Test"\n'),
+            ('index.rst', 'Index\n=====\n\n.. toctree::\n\n   intro\n   ref\n\n.. include:: snippet.txt\n'),
+            ('snippet.txt', 'Included text.\n'),
+            ('intro.rst', '.. _intro-label:\n\nIntro\n=====\n\nIntroduction.\n'),
+            ('ref.rst', 'Ref\n===\n\nSee :ref:`intro-label`.\n'),
+            ('other.rst', ':orphan:\n\nOther\n=====\n\nNothing to see here.\n'),
+        ]:
+            with open(os.path.join(cls.path, filename), 'w') as f:
+                f.write(content)
+
+        outdir = os.path.join(cls.path, '_build', 'json')
+        cls.sphinx = Sphinx(
+            cls.path, cls.path, outdir, os.path.join(outdir, '.doctrees'), 'json',
+            status=io.StringIO(), warning=io.StringIO()
+        )
+        cls.index = DependencyIndex()
+        cls.index.connect(cls.sphinx)
+        cls.sphinx.builder.build_all()
+        cls.index.update(cls.sphinx)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.path)
+
+    def source(self, filename):
+        return os.path.join(self.path, filename)
+
+    def test_unrelated(self):
+        "A document that nothing depends on is built on its own"
+        self.assertEqual(self.index.expand([self.source('other.rst')]), [self.source('other.rst')])
+
+    def test_files(self):
+        "Files that documents depend on, but that aren't documents, are kept"
+        self.assertEqual(self.index.files, {self.source('snippet.txt'): [self.source('index.rst')]})
+        # Nothing has changed since the index was built.
+        self.assertFalse(self.index.update(self.sphinx))
+
+    def test_include(self):
+        "Documents that include a file depend on it"
+        self.assertEqual(
+            self.index.expand([self.source('snippet.txt')]),
+            [self.source('snippet.txt'), self.source('index.rst')]
+        )
+
+    def test_toctree_and_reference(self):
+        "Documents that list a document in a toctree, or refer to it, depend on it"
+        self.assertEqual(
+            self.index.expand([self.source('intro.rst')]),
+            [self.source('intro.rst'), self.source('index.rst'), self.source('ref.rst')]
+        )
+
+    def test_no_duplicates(self):
+        "Documents that are already being built aren't added again"
+        self.assertEqual(
+            self.index.expand([self.source('ref.rst'), self.source('intro.rst')]),
+            [self.source('ref.rst'), self.source('intro.rst'), self.source('index.rst')]
+        )
+
+
+class SnippetTest(unittest.TestCase):
+    "A change to an included snippet rebuilds the documents that include it"
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        os.mkdir(os.path.join(self.path, '_includes'))
+        for filename, content in [
+            ('conf.py', 'project = "Test"\n'),
+            ('index.rst', 'Index\n=====\n\n.. include:: _includes/snippet.inc\n'),
+            (os.path.join('_includes', 'snippet.inc'), 'Original snippet.\n'),
+        ]:
+            with open(os.path.join(self.path, filename), 'w') as f:
+                f.write(content)
+
+        self.work_queue = Queue()
+        self.output_queue = Queue()
+        self.worker = threading.Thread(target=sphinx_worker, args=(self.path, self.work_queue, self.output_queue))
+        self.worker.daemon = True
+        self.worker.start()
+
+        self.layout = ProjectLayout(self.path)
+        self.changes = Queue()
+        self.stop_event = threading.Event()
+        self.monitor = threading.Thread(
+            target=file_monitor,
+            args=(self.path, self.stop_event, self.changes, 'poll'),
+            kwargs={'quiet_period': 0.1, 'layout': self.layout}
+        )
+        self.monitor.daemon = True
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.work_queue.put(Quit())
+        self.worker.join(60)
+        if self.monitor.is_alive():
+            self.monitor.join(60)
+        shutil.rmtree(self.path)
+
+    def wait_for(self, kind):
+        "Collect the worker's output until a message of the given kind arrives"
+        while True:
+            batch = self.output_queue.get(timeout=60)
+            for message in batch.messages if isinstance(batch, Batch) else [batch]:
+                if isinstance(message, kind):
+                    return message
+
+    def test_snippet(self):
+        # The worker tells the view which files to watch, and the view
+        # passes them on to the monitor.
+        self.work_queue.put(BuildAll())
+        files = self.wait_for(FileDependencies).files
+        snippet = os.path.join(self.path, '_includes', 'snippet.inc')
+        self.assertEqual(files, {snippet: [os.path.join(self.path, 'index.rst')]})
+        self.layout.watch_dependencies(files)
+
+        # Give the monitor a chance to see the snippet before it changes.
+        self.monitor.start()
+        self.stop_event.wait(1.5)
+        with open(snippet, 'w') as f:
+            f.write('Changed snippet.\n')
+        future = time.time() + 10
+        os.utime(snippet, (future, future))
+
+        # The view asks for the dependent documents to be rebuilt.
+        change = self.changes.get(timeout=10)
+        self.assertEqual(change, DependencyChange([snippet], [os.path.join(self.path, 'index.rst')]))
+        self.work_queue.put(BuildSpecific(change.documents))
+
+        document = self.wait_for(DocumentReady)
+        self.assertEqual(document.filename, os.path.join(self.path, 'index.rst'))
+        self.assertIn('Changed snippet.', document.body)
@@ -0,0 +1,158 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from sphinx.util.parallel import parallel_available
+
+from galley.worker import GalleySphinx, Progress, WarningOutput, warning_location, build
+
+
+class GalleyExtensionTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.realpath(tempfile.mkdtemp())
+        for filename, content in [
+            ('conf.py', 'project = "Test"\n'),
+            ('index.rst', 'Index\n=====\n\n.. toctree::\n\n   page\n'),
+            ('page.rst', 'Page\n====\n\nSee :ref:`missing: label`.\n\n.. unknown-directive::\n'),
+            ('orphan.rst', 'Orphan\n======\n\nNot in any toctree.\n'),
+        ]:
+            with open(os.path.join(self.path, filename), 'w') as f:
+                f.write(content)
+        self.outdir = os.path.join(self.path, '_build', 'json')
+        self.queue = Queue()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def sphinx(self, parallel=0, **confoverrides):
+        return GalleySphinx(
+            self.path, self.path, self.outdir, os.path.join(self.outdir, '.doctrees'), 'galley',
+            confoverrides=confoverrides, status=io.StringIO(), warning=io.StringIO(),
+            parallel=parallel, output_queue=self.queue
+        )
+
+    def messages(self, kind):
+        messages = []
+        while not self.queue.empty():
+            message = self.queue.get()
+            if isinstance(message, kind):
+                messages.append(message)
+        return messages
+
+    def source(self, filename):
+        return os.path.join(self.path, filename)
+
+    def test_progress(self):
+        "Each stage of a build reports its progress through the documents"
+        build(self.sphinx())
+        progress = self.messages(Progress)
+        self.assertEqual(progress, [
+            Progress(stage='reading sources', progress=0, context=None),
+            Progress(stage='reading sources', progress=33, context='index'),
+            Progress(stage='reading sources', progress=66, context='orphan'),
+            Progress(stage='reading sources', progress=100, context='page'),
+            Progress(stage='writing output', progress=0, context=None),
+            Progress(stage='writing output', progress=33, context='index'),
+            Progress(stage='writing output', progress=66, context='orphan'),
+            Progress(stage='writing output', progress=100, context='page'),
+            Progress(stage='finishing', progress=0, context=None),
+            Progress(stage='finishing', progress=100, context=None),
+        ])
+
+    def test_warnings(self):
+        "Each warning is reported once, with the source file and line it refers to"
+        build(self.sphinx())
+        warnings = self.messages(WarningOutput)
+
+        self.assertEqual(sorted([w._replace(message=w.message.splitlines()[0]) for w in warnings], key=repr), sorted([
+            # The message is reported as it is, colons and all.
+            WarningOutput(self.source('page.rst'), 4, "undefined label: 'missing: label'"),
+            WarningOutput(self.source('page.rst'), 6, 'Unknown directive type "unknown-directive".'),
+            # A warning about a whole document has no line number.
+            WarningOutput(self.source('orphan.rst'), None, "document isn't included in any toctree"),
+        ], key=repr))
+
+    def test_suppressed(self):
+        "Warnings that the project suppresses aren't reported"
+        build(self.sphinx(suppress_warnings=['ref.ref', 'toc']))
+        messages = [w.message for w in self.messages(WarningOutput)]
+        self.assertFalse([m for m in messages if 'label' in m or 'toctree' in m])
+
+    def test_defer_others(self):
+        "A build can leave other out of date documents to be read later"
+        sphinx = self.sphinx()
+        build(sphinx)
+        time.sleep(0.01)
+        for filename in ['page.rst', 'orphan.rst']:
+            os.utime(self.source(filename))
+        self.messages(Progress)
+
+        build(sphinx, [self.source('page.rst')], defer_others=True)
+        reading = [p.context for p in self.messages(Progress) if p.stage == 'reading sources']
+        self.assertEqual(reading, [None, 'page'])
+
+        build(sphinx, [self.source('orphan.rst')])
+        reading = [p.context for p in self.messages(Progress) if p.stage == 'reading sources']
+        self.assertEqual(reading, [None, 'orphan'])
+
+    @unittest.skipUnless(parallel_available, "Sphinx can't work in parallel on this platform")
+    def test_parallel(self):
+        "Events and warnings from other processes are reported too"
+        for i in range(8):
+            with open(self.source('extra%d.rst' % i), 'w') as f:
+                f.write(':orphan:\n\nExtra %d\n=======\n\n:ref:`nowhere-%d`\n' % (i, i))
+        build(self.sphinx(parallel=3))
+
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get())
+        reading = [m for m in messages if isinstance(m, Progress) and m.stage == 'reading sources']
+        self.assertEqual(reading[-1].progress, 100)
+        self.assertEqual(len(reading), 12)
+        warnings = [m for m in messages if isinstance(m, WarningOutput)]
+        self.assertEqual(len(warnings), 11)
+        self.assertEqual(
+            warnings.count(WarningOutput(self.source('extra7.rst'), 6, "undefined label: 'nowhere-7'")),
+            1
+        )
+
+
+class WarningLocationTest(unittest.TestCase):
+    class Env(object):
+        def doc2path(self, docname):
+            return '/docs/%s.rst' % docname
+
+    class App(object):
+        pass
+
+    def setUp(self):
+        self.app = self.App()
+        self.app.env = self.Env()
+
+    def test_no_location(self):
+        self.assertEqual(warning_location(self.app, None), (None, None))
+
+    def test_docname(self):
+        self.assertEqual(warning_location(self.app, 'intro'), (os.path.normpath('/docs/intro.rst'), None))
+
+    def test_docname_and_line(self):
+        self.assertEqual(warning_location(self.app, ('intro', 12)), (os.path.normpath('/docs/intro.rst'), 12))
+        self.assertEqual(warning_location(self.app, (None, None)), (None, None))
+
+    def test_source_and_line(self):
+        "A 'source:line' location is split at the last colon"
+        self.assertEqual(warning_location(self.app, 'C:\\docs\\intro.rst:12')[1], 12)
+        self.assertEqual(
+            warning_location(self.app, '/src/mod.py:docstring of mod.func:3'),
+            ('/src/mod.py:docstring of mod.func', 3)
+        )
+        self.assertEqual(warning_location(self.app, '/docs/intro.rst:'), ('/docs/intro.rst', None))
+        self.assertEqual(warning_location(self.app, '<unknown>:5'), (None, 5))
@@ -0,0 +1,95 @@
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+
+from sphinx.application import ENV_PICKLE_FILENAME
+
+from galley.worker import GalleySphinx, LiveSession
+
+
+class LiveSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.write('conf.py', 'project = "Test"\n')
+        self.write('index.rst', 'Index\n=====\n\nContent.\n')
+
+        outdir = os.path.join(self.path, '_build', 'json')
+        self.status = io.StringIO()
+        self.sphinx = GalleySphinx(
+            self.path, self.path, outdir, os.path.join(outdir, '.doctrees'), 'galley',
+            status=self.status, warning=io.StringIO()
+        )
+        self.pickle_filename = os.path.join(outdir, '.doctrees', ENV_PICKLE_FILENAME)
+        self.live = LiveSession(interval=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, filename, content):
+        with open(os.path.join(self.path, filename), 'w') as f:
+            f.write(content)
+
+    def rebuild(self):
+        # Make sure the modification time will move forward.
+        time.sleep(0.05)
+        self.write('index.rst', 'Index\n=====\n\nContent at %s.\n' % time.time())
+        with self.live.deferring(self.sphinx):
+            self.sphinx.builder.build_specific([os.path.join(self.path, 'index.rst')])
+
+    def test_deferred(self):
+        "Once its cost is known, saving the environment is deferred"
+        with self.live.deferring(self.sphinx):
+            self.sphinx.builder.build_all()
+        self.assertIsNotNone(self.live.cost)
+        self.assertEqual(self.live.unsaved, 0)
+        self.assertGreater(os.path.getsize(self.pickle_filename), 0)
+
+        self.rebuild()
+        self.assertEqual(self.live.unsaved, 1)
+        self.assertIn('environment kept in memory', self.status.getvalue())
+
+        # Persisting the environment saves it for the next session.
+        self.live.persist(self.sphinx)
+        self.assertEqual(self.live.unsaved, 0)
+        with open(self.pickle_filename, 'rb') as f:
+            env = pickle.load(f)
+        self.assertIn('index', env.all_docs)
+
+    def test_interval(self):
+        "The environment is saved after every few builds, regardless"
+        with self.live.deferring(self.sphinx):
+            self.sphinx.builder.build_all()
+        self.rebuild()
+        self.rebuild()
+        self.assertEqual(self.live.unsaved, 2)
+        self.rebuild()
+        self.assertEqual(self.live.unsaved, 0)
+
+    def test_saved_environment_kept(self):
+        "While saving is deferred, the environment saved earlier is left intact"
+        with self.live.deferring(self.sphinx):
+            self.sphinx.builder.build_all()
+        with open(self.pickle_filename, 'rb') as f:
+            saved = f.read()
+
+        self.rebuild()
+        self.assertEqual(self.live.unsaved, 1)
+        with open(self.pickle_filename, 'rb') as f:
+            self.assertEqual(f.read(), saved)
+        self.assertFalse(os.path.exists(self.pickle_filename + '.tmp'))
+
+    def test_not_deferring(self):
+        "Without a live session, the environment is saved after every build"
+        self.sphinx.builder.build_all()
+        self.assertEqual(self.live.unsaved, 0)
+        self.assertGreater(os.path.getsize(self.pickle_filename), 0)
+        mtime = os.stat(self.pickle_filename).st_mtime_ns
+
+        time.sleep(0.05)
+        self.write('index.rst', 'Index\n=====\n\nContent at %s.\n' % time.time())
+        self.sphinx.builder.build_specific([os.path.join(self.path, 'index.rst')])
+        self.assertGreater(os.stat(self.pickle_filename).st_mtime_ns, mtime)
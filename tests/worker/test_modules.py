@@ -0,0 +1,48 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from galley.worker import ModuleTracker
+
+
+class ModuleTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'galley_tracked.py')
+        self.write('VALUE = 1\n')
+        sys.path.insert(0, self.path)
+
+        self.tracker = ModuleTracker()
+        self.tracker.mtimes[self.filename] = os.stat(self.filename).st_mtime
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        sys.modules.pop('galley_tracked', None)
+        shutil.rmtree(self.path)
+
+    def write(self, content):
+        with open(self.filename, 'w') as f:
+            f.write(content)
+
+    def test_unchanged(self):
+        "An unchanged module stays imported"
+        import galley_tracked
+        self.tracker.unload_stale()
+        self.assertIs(sys.modules['galley_tracked'], galley_tracked)
+
+    def test_modified(self):
+        "A modified module is forgotten, so the next import sees the new version"
+        import galley_tracked
+        self.assertEqual(galley_tracked.VALUE, 1)
+
+        # Make sure the modification time will move forward.
+        time.sleep(0.05)
+        self.write('VALUE = 20\n')
+        self.tracker.unload_stale()
+        self.assertNotIn('galley_tracked', sys.modules)
+
+        import galley_tracked
+        self.assertEqual(galley_tracked.VALUE, 20)
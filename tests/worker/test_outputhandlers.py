@@ -8,10 +8,7 @@ except ImportError:
 from galley.worker import (
     ANSIOutputHandler,
     SphinxStatusHandler,
-    SphinxWarningHandler,
     Output,
-    WarningOutput,
-    Progress,
 )
 
 
@@ -75,6 +72,30 @@ class ANSIOutputHandlerTest(unittest.TestCase):
         # Nothing left in the queue
         self.assertTrue(self.queue.empty())
 
+    def test_split_ansi_string(self):
+        "An escape sequence can be split across writes"
+        self.handler.write("hello\x1b")
+        self.handler.write("[32")
+        self.handler.write(";40m world\x1b[")
+        self.handler.write("0m\n")
+
+        output = self.queue.get(block=False)
+        self.assertEqual(output, Output(message='hello world'))
+
+        # Nothing left in the queue
+        self.assertTrue(self.queue.empty())
+
+    def test_many_lines(self):
+        "Output containing many lines is split into a message per line"
+        self.handler.write("".join("\x1b[01mline %d\x1b[39;49;00m\n" % i for i in range(100)))
+
+        for i in range(100):
+            output = self.queue.get(block=False)
+            self.assertEqual(output, Output(message='line %d' % i))
+
+        # Nothing left in the queue
+        self.assertTrue(self.queue.empty())
+
 
 class SphinxStatusHandlerTest(unittest.TestCase):
     def setUp(self):
@@ -108,116 +129,3 @@ class SphinxStatusHandlerTest(unittest.TestCase):
 
         # Nothing left in the queue
         self.assertTrue(self.queue.empty())
-
-    def test_simple_progress(self):
-        "Simple tasks are identified and reported."
-
-        # Output the initial message:
-        self.handler.write("dumping object inventory...")
-        self.handler.flush()
-
-        # Only the raw output is returned
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="dumping object inventory..."))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-        # Output the completion message
-        self.handler.write("done")
-        self.handler.flush()
-
-        # The raw output *and* the progress message is output.
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="done"))
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Progress(stage='dumping object inventory', progress=100, context=None))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-        # Task state has been flushed
-        self.handler.write("More stuff done.")
-        self.handler.flush()
-
-        # The raw output *and* the progress message is output.
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="More stuff done."))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-    def test_percent_progress(self):
-        "Progress indicators are extracted and sent as parsed messages"
-
-        self.handler.write("copying downloadable files... [  2%] /path/to/file.sh")
-        self.handler.flush()
-        self.handler.write("copying downloadable files... [ 80%] /path/to/other_file.bat")
-        self.handler.flush()
-        self.handler.write("copying downloadable files... [100%] /path/to/3rd-file.sh")
-        self.handler.flush()
-
-        # Output comes in pairs -- a normal output with the full message, then a parsed output.
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="copying downloadable files... [  2%] /path/to/file.sh"))
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Progress(stage='copying downloadable files', progress=2, context='/path/to/file.sh'))
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="copying downloadable files... [ 80%] /path/to/other_file.bat"))
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Progress(stage='copying downloadable files', progress=80, context='/path/to/other_file.bat'))
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Output(message="copying downloadable files... [100%] /path/to/3rd-file.sh"))
-        output = self.queue.get(block=False)
-        self.assertEqual(output, Progress(stage='copying downloadable files', progress=100, context='/path/to/3rd-file.sh'))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-
-class SphinxWarningHandlerTest(unittest.TestCase):
-    def setUp(self):
-        self.queue = Queue()
-        self.handler = SphinxWarningHandler(self.queue)
-
-    def test_global_warning(self):
-        "A gloabl warning message is parsed correctly"
-
-        self.handler.write("WARNING: html_static_path entry '/beeware/galley/docs/_static' does not exist")
-        self.handler.flush()
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, WarningOutput(filename=None, lineno=None, message="html_static_path entry '/beeware/galley/docs/_static' does not exist"))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-
-    def test_file_warning(self):
-        "A warning message that mentions a filename is parsed for file name/number content"
-
-        self.handler.write("/beeware/galley/docs/internals/newfile.rst:: WARNING: document isn't included in any toctree")
-        self.handler.flush()
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, WarningOutput(filename='/beeware/galley/docs/internals/newfile.rst', lineno=None, message="document isn't included in any toctree"))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
-
-
-
-    def test_file_warning(self):
-        "A warning message that mentions a filename is parsed for file name/number content"
-
-        self.handler.write("/beeware/galley/docs/index.rst:65: WARNING: toctree glob pattern u'releases' didn't match any documents")
-        self.handler.flush()
-
-        output = self.queue.get(block=False)
-        self.assertEqual(output, WarningOutput(filename='/beeware/galley/docs/index.rst', lineno=65, message="toctree glob pattern u'releases' didn't match any documents"))
-
-        # Nothing left in the queue
-        self.assertTrue(self.queue.empty())
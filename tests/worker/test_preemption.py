@@ -0,0 +1,89 @@
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.worker import (
+    Cancelled,
+    Preemption,
+    ReloadConfig,
+    BuildAll,
+    BuildSpecific,
+    CopyStatic,
+    Quit,
+    Focus,
+)
+
+
+class PreemptionTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = Queue()
+        self.preemption = Preemption(self.queue)
+
+    def test_idle(self):
+        "Nothing is cancelled, or taken from the queue, when no build is running"
+        self.queue.put(BuildAll())
+        self.preemption.check()
+        self.assertEqual(self.preemption.pending, [])
+        self.assertFalse(self.queue.empty())
+
+    def test_overlapping(self):
+        "A rebuild of a document that is being built cancels the build"
+        self.queue.put(BuildSpecific(['b.rst', 'c.rst']))
+        with self.preemption.running(['a.rst', 'b.rst']):
+            self.assertRaises(Cancelled, self.preemption.check)
+        self.assertEqual(self.preemption.pending, [BuildSpecific(['b.rst', 'c.rst'])])
+
+    def test_disjoint(self):
+        "A rebuild of other documents is set aside until the build is complete"
+        self.queue.put(BuildSpecific(['c.rst']))
+        with self.preemption.running(['a.rst', 'b.rst']):
+            self.preemption.check()
+        self.assertEqual(self.preemption.take(), [BuildSpecific(['c.rst'])])
+        self.assertEqual(self.preemption.pending, [])
+
+    def test_build_all(self):
+        "A build of all documents runs to completion, and the rebuilds follow it"
+        self.queue.put(Focus('c.rst'))
+        with self.preemption.running(None):
+            # However often documents change, the full build isn't restarted.
+            for filenames in [['c.rst'], ['a.rst', 'c.rst'], ['b.rst']]:
+                self.queue.put(BuildSpecific(filenames))
+                self.preemption.check()
+        self.assertEqual(self.preemption.take(), [
+            Focus('c.rst'),
+            BuildSpecific(['c.rst']),
+            BuildSpecific(['a.rst', 'c.rst']),
+            BuildSpecific(['b.rst']),
+        ])
+
+    def test_superseding(self):
+        "Full rebuilds, configuration changes and quitting cancel any build"
+        for cmd in [BuildAll(), ReloadConfig(), Quit()]:
+            self.queue.put(cmd)
+            with self.preemption.running(['a.rst']):
+                self.assertRaises(Cancelled, self.preemption.check)
+
+    def test_static(self):
+        "Copying static files doesn't cancel a build"
+        self.queue.put(CopyStatic())
+        with self.preemption.running(None):
+            self.preemption.check()
+        self.assertEqual(self.preemption.take(), [CopyStatic()])
+
+    def test_focus(self):
+        "A rebuild of the focus document cancels a build of other documents"
+        self.queue.put(Focus('c.rst'))
+        self.queue.put(BuildSpecific(['c.rst']))
+        with self.preemption.running(['a.rst', 'b.rst']):
+            self.assertRaises(Cancelled, self.preemption.check)
+        self.assertEqual(self.preemption.focus, 'c.rst')
+
+        # Once the focus moves on, the document is no longer urgent.
+        self.preemption.take()
+        self.queue.put(Focus('a.rst'))
+        self.queue.put(BuildSpecific(['c.rst']))
+        with self.preemption.running(['a.rst']):
+            self.preemption.check()
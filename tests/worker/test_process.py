@@ -0,0 +1,70 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from galley.worker import (
+    WorkerProcess,
+    BuildAll,
+    Quit,
+    WarningOutput,
+    InitializationStart,
+    InitializationEnd,
+    BuildStart,
+    BuildEnd,
+    Batch,
+)
+
+
+class WorkerProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.base_path = tempfile.mkdtemp()
+        with open(os.path.join(self.base_path, 'conf.py'), 'w') as f:
+            f.write('project = "Test"\n')
+        with open(os.path.join(self.base_path, 'index.rst'), 'w') as f:
+            f.write('Index\n=====\n')
+
+        self.output_queue = Queue()
+        self.worker = WorkerProcess(self.base_path, self.output_queue)
+        self.worker.start()
+
+    def tearDown(self):
+        if self.worker.process.is_alive():
+            self.worker.process.terminate()
+        shutil.rmtree(self.base_path)
+
+    def test_build_and_quit(self):
+        "The worker process speaks the same protocol as the worker thread, and exits on Quit"
+        self.worker.put(BuildAll())
+
+        # Pending commands are merged, so wait for the build to finish
+        # before asking the worker to quit.
+        messages = []
+        while not messages or messages[-1] is not BuildEnd:
+            # Output arrives in batches.
+            batch = self.output_queue.get(timeout=60)
+            self.assertIsInstance(batch, Batch)
+            for message in batch.messages:
+                if isinstance(message, (InitializationStart, InitializationEnd, BuildStart, BuildEnd)):
+                    messages.append(type(message))
+
+        self.worker.put(Quit())
+        self.worker.join(timeout=60)
+
+        self.assertFalse(self.worker.process.is_alive())
+        self.assertEqual(self.worker.process.exitcode, 0)
+        self.assertEqual(messages, [InitializationStart, InitializationEnd, BuildStart, BuildEnd])
+        self.assertTrue(os.path.exists(os.path.join(self.base_path, '_build', 'json', 'index.fjson')))
+
+
+class MessagePickleTest(unittest.TestCase):
+    def test_warning(self):
+        "Warnings can be sent between processes"
+        message = WarningOutput(filename='index.rst', lineno=1, message='Oops')
+        self.assertEqual(pickle.loads(pickle.dumps(message)), message)